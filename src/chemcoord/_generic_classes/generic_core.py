@@ -9,6 +9,43 @@ import pandas as pd
 
 
 class GenericCore(object):
+    def _bump_version(self):
+        """Invalidate the cached results.
+
+        Has to be called by every method that changes the frame inplace.
+        """
+        self._metadata['version'] = self._metadata.get('version', 0) + 1
+
+    def _get_state(self):
+        """Return the state for which a cached result is valid."""
+        return self._metadata.get('version', 0)
+
+    def _get_cached(self, key, outdated=False):
+        """Return the result cached under ``key``.
+
+        Args:
+            key (str):
+            outdated (bool): Return the cached result, even if the frame
+                was changed after caching.
+
+        Returns:
+            The cached result or ``None``, if there is none or if
+            the frame was changed after caching.
+        """
+        try:
+            state, value = self._metadata['cache'][key]
+        except KeyError:
+            return None
+        if outdated or state == self._get_state():
+            return value
+        else:
+            return None
+
+    def _set_cached(self, key, value):
+        """Cache ``value`` under ``key`` for the current state."""
+        self._metadata.setdefault('cache', {})[key] = (
+            self._get_state(), value)
+
     def add_data(self, new_cols=None):
         """Adds a column with the requested data.
 
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Element codes and tables of the maximal bond lengths.
+
+The atoms are represented by the position of their element in
+:attr:`constants.elements`, which fits into an ``int8``.
+The maximal bond length between two atoms is looked up in a table
+with one row and column per code,
+which is computed only once for every column of
+:attr:`constants.elements`.
+Modified radii of single atoms are passed on separately as difference
+to the radius of their element.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import numpy as np
+
+import chemcoord.constants as constants
+
+_tables = {}
+
+
+def get_element_codes(atoms):
+    """Return the position of every element in :attr:`constants.elements`.
+
+    Args:
+        atoms (sequence): The element symbols.
+
+    Returns:
+        np.array: An ``int8`` array, if there are less than 128 elements.
+
+    Raises:
+        KeyError: If an element symbol is unknown.
+    """
+    elements = constants.elements.index
+    codes = elements.get_indexer(atoms)
+    if (codes == -1).any():
+        unknown = sorted(set(np.asarray(atoms)[codes == -1]))
+        raise KeyError('Unknown elements: {}'.format(unknown))
+    if len(elements) <= np.iinfo('i1').max:
+        return codes.astype('i1')
+    else:
+        return codes.astype('i2')
+
+
+def get_element_bond_lengths(atomic_radius_data):
+    """Return the maximal bond length for every pair of elements.
+
+    The table is cached and only recomputed if the column
+    ``atomic_radius_data`` of :attr:`constants.elements` changed.
+
+    Args:
+        atomic_radius_data (str): A column of :attr:`constants.elements`.
+
+    Returns:
+        tuple: ``(radii, bond_lengths)`` where ``bond_lengths[i, j]`` is
+        ``radii[i] + radii[j]`` for the elements with the codes
+        ``i`` and ``j``.
+    """
+    radii = constants.elements[atomic_radius_data].values.astype('f8')
+    try:
+        cached_radii, bond_lengths = _tables[atomic_radius_data]
+    except KeyError:
+        pass
+    else:
+        if np.array_equal(cached_radii, radii, equal_nan=True):
+            return cached_radii, bond_lengths
+    bond_lengths = radii[:, None] + radii[None, :]
+    bond_lengths.flags.writeable = False
+    radii.flags.writeable = False
+    _tables[atomic_radius_data] = radii, bond_lengths
+    return radii, bond_lengths
+
+
+def get_bond_lengths(atoms, atomic_radius_data, modified_radii=None):
+    """Return the codes of ``atoms``, the table of bond lengths and
+    the changes of the modified radii.
+
+    The table of the elements is shared by all calls,
+    so modified radii do not enlarge it.
+    Atoms of elements without a radius stay without bonds,
+    even if their radius is modified.
+
+    Args:
+        atoms (sequence): The element symbols.
+        atomic_radius_data (str): A column of :attr:`constants.elements`.
+        modified_radii (dict): A dictionary mapping from the
+            position of an atom to its radius.
+
+    Returns:
+        tuple: ``(codes, bond_lengths, deltas)`` where the maximal
+        bond length between the atoms ``i`` and ``j`` is
+        ``bond_lengths[codes[i], codes[j]] + deltas[i] + deltas[j]``.
+        ``deltas`` is empty, if no radius is modified.
+    """
+    codes = get_element_codes(atoms)
+    radii, bond_lengths = get_element_bond_lengths(atomic_radius_data)
+    deltas = np.zeros(0)
+    if modified_radii:
+        positions = [i for i in modified_radii if i in range(len(codes))]
+        new_radii = np.array([modified_radii[i] for i in positions],
+                             dtype='f8')
+        positions = np.array(positions, dtype='i8')
+        deltas = np.zeros(len(codes))
+        deltas[positions] = new_radii - radii[codes[positions]]
+    return codes, bond_lengths, deltas
@@ -4,67 +4,103 @@ from __future__ import (absolute_import, division, print_function,
 
 import numba as nb
 import numpy as np
-from numba import generated_jit, jit
+from numba import jit
 from numpy import arccos, arctan2, sqrt
 
 import chemcoord.constants as constants
-from chemcoord.cartesian_coordinates.xyz_functions import (_jit_cross,
-                                                           _jit_isclose,
-                                                           _jit_normalize)
+from chemcoord.cartesian_coordinates.xyz_functions import _jit_isclose
 from chemcoord.exceptions import ERR_CODE_OK, ERR_CODE_InvalidReference
 
 
-@generated_jit(nopython=True)
-def get_ref_pos(X, indices):  # pylint:disable=unused-argument
-    if isinstance(indices, nb.types.Array):
-        def f(X, indices):
-            ref_pos = np.empty((3, len(indices)))
-            for col, i in enumerate(indices):
-                if i < constants.keys_below_are_abs_refs:
-                    ref_pos[:, col] = constants._jit_absolute_refs(i)
-                else:
-                    ref_pos[:, col] = X[:, i]
-            return ref_pos
-        return f
-    elif isinstance(indices, nb.types.Integer):
-        def f(X, indices):
-            i = indices
-            if i < constants.keys_below_are_abs_refs:
-                ref_pos = constants._jit_absolute_refs(i)
-            else:
-                ref_pos = X[:, i]
-            return ref_pos
-        return f
+_ORIGIN = constants.int_label['origin']
 
 
 @jit(nopython=True, cache=True)
-def get_B(X, c_table, j):
-    B = np.empty((3, 3))
-    ref_pos = get_ref_pos(X, c_table[:, j])
-    BA = ref_pos[:, 1] - ref_pos[:, 0]
-    if _jit_isclose(BA, 0.).all():
-        return (ERR_CODE_InvalidReference, B)
-    AD = ref_pos[:, 2] - ref_pos[:, 1]
-    B[:, 2] = -_jit_normalize(BA)
-    N = _jit_cross(AD, BA)
-    if _jit_isclose(N, 0.).all():
-        return (ERR_CODE_InvalidReference, B)
-    B[:, 1] = _jit_normalize(N)
-    B[:, 0] = _jit_cross(B[:, 1], B[:, 2])
-    return (ERR_CODE_OK, B)
+def fill_ref_pos(X, c_table, j, ref_pos):
+    """Write the positions of the references of atom ``j``
+    into the columns of ``ref_pos``.
+    """
+    for k in range(3):
+        i = c_table[k, j]
+        if i < constants.keys_below_are_abs_refs:
+            # origin, e_x, e_y and e_z have consecutive codes
+            axis = i - _ORIGIN - 1
+            if axis > 2:
+                raise ValueError
+            ref_pos[:, k] = 0.
+            if axis >= 0:
+                ref_pos[axis, k] = 1.
+        else:
+            ref_pos[:, k] = X[:, i]
 
 
 @jit(nopython=True, cache=True)
-def get_grad_B(X, c_table, j):
-    grad_B = np.empty((3, 3, 3, 3))
-    ref_pos = get_ref_pos(X, c_table[:, j])
-    v_b, v_a, v_d = ref_pos[:, 0], ref_pos[:, 1], ref_pos[:, 2]
-    x_b, y_b, z_b = v_b
-    x_a, y_a, z_a = v_a
-    x_d, y_d, z_d = v_d
-    BA, AD = v_a - v_b, v_d - v_a
-    norm_AD_cross_BA = np.linalg.norm(_jit_cross(AD, BA))
-    norm_BA = np.linalg.norm(BA)
+def norm(x, y, z, v):
+    """Return the norm of ``(x, y, z)`` using ``v`` as workspace.
+
+    The vector is normed with :func:`numpy.linalg.norm`,
+    whose rounding differs from ``sqrt(x**2 + y**2 + z**2)``.
+    """
+    v[0], v[1], v[2] = x, y, z
+    return np.linalg.norm(v)
+
+
+@jit(nopython=True, cache=True)
+def fill_B(ref_pos, B, v):
+    """Write the basis spanned by the references ``ref_pos``
+    into the columns of ``B``.
+
+    Args:
+        ref_pos (np.array):
+        B (np.array):
+        v (np.array): A workspace of length three.
+
+    Returns:
+        int: An error code.
+    """
+    BA_x = ref_pos[0, 1] - ref_pos[0, 0]
+    BA_y = ref_pos[1, 1] - ref_pos[1, 0]
+    BA_z = ref_pos[2, 1] - ref_pos[2, 0]
+    if (_jit_isclose(BA_x, 0.) and _jit_isclose(BA_y, 0.)
+            and _jit_isclose(BA_z, 0.)):
+        return ERR_CODE_InvalidReference
+    AD_x = ref_pos[0, 2] - ref_pos[0, 1]
+    AD_y = ref_pos[1, 2] - ref_pos[1, 1]
+    AD_z = ref_pos[2, 2] - ref_pos[2, 1]
+    N_x = AD_y * BA_z - AD_z * BA_y
+    N_y = AD_z * BA_x - AD_x * BA_z
+    N_z = AD_x * BA_y - AD_y * BA_x
+    if (_jit_isclose(N_x, 0.) and _jit_isclose(N_y, 0.)
+            and _jit_isclose(N_z, 0.)):
+        return ERR_CODE_InvalidReference
+    norm_BA = norm(BA_x, BA_y, BA_z, v)
+    norm_N = norm(N_x, N_y, N_z, v)
+    B[0, 2] = -BA_x / norm_BA
+    B[1, 2] = -BA_y / norm_BA
+    B[2, 2] = -BA_z / norm_BA
+    B[0, 1] = N_x / norm_N
+    B[1, 1] = N_y / norm_N
+    B[2, 1] = N_z / norm_N
+    B[0, 0] = B[1, 1] * B[2, 2] - B[2, 1] * B[1, 2]
+    B[1, 0] = B[2, 1] * B[0, 2] - B[0, 1] * B[2, 2]
+    B[2, 0] = B[0, 1] * B[1, 2] - B[1, 1] * B[0, 2]
+    return ERR_CODE_OK
+
+
+@jit(nopython=True, cache=True)
+def fill_grad_B(ref_pos, grad_B, v):
+    """Write the derivatives of the basis spanned by the references
+    ``ref_pos`` into ``grad_B``.
+    ``v`` is a workspace of length three.
+    """
+    x_b, y_b, z_b = ref_pos[0, 0], ref_pos[1, 0], ref_pos[2, 0]
+    x_a, y_a, z_a = ref_pos[0, 1], ref_pos[1, 1], ref_pos[2, 1]
+    x_d, y_d, z_d = ref_pos[0, 2], ref_pos[1, 2], ref_pos[2, 2]
+    norm_AD_cross_BA = norm(
+        (y_d - y_a) * (z_a - z_b) - (z_d - z_a) * (y_a - y_b),
+        (z_d - z_a) * (x_a - x_b) - (x_d - x_a) * (z_a - z_b),
+        (x_d - x_a) * (y_a - y_b) - (y_d - y_a) * (x_a - x_b), v)
+    norm_BA = norm(x_a - x_b, y_a - y_b, z_a - z_b, v)
     grad_B[0, 0, 0, 0] = (
         ((x_a - x_b)
          * ((y_a - y_b)
@@ -915,38 +951,35 @@ def get_grad_B(X, c_table, j):
     grad_B[2, 2, 2, 0] = 0.
     grad_B[2, 2, 2, 1] = 0.
     grad_B[2, 2, 2, 2] = 0.
-    return grad_B
 
 
-@jit(nb.f8[:](nb.f8[:]), nopython=True)
-def get_S_inv(v):
-    x, y, z = v
-    r = np.linalg.norm(v)
-    if r == 0:
-        return np.array([0., 0., 0.])
-    alpha = arccos(-z / r)
-    delta = arctan2(-y / r, x / r)
-    return np.array([r, alpha, delta])
+@jit(nopython=True, cache=True)
+def fill_IB(X, j, ref_pos, IB):
+    """Write the vector from the bond reference to atom ``j``
+    into ``IB``.
+    """
+    for m in range(3):
+        IB[m] = X[m, j] - ref_pos[m, 0]
+
 
+@jit(nopython=True, cache=True)
+def fill_T(IB, B, T):
+    """Write ``IB`` in the basis ``B`` into ``T``."""
+    np.dot(B.T, IB, T)
 
-@jit(nb.f8[:, :](nb.f8[:]), nopython=True)
-def get_grad_S_inv(v):
-    x, y, z = v
-    grad_S_inv = np.zeros((3, 3))
+
+@jit(nopython=True, cache=True)
+def fill_grad_S_inv(v, grad_S_inv):
+    x, y, z = v[0], v[1], v[2]
+    grad_S_inv[:, :] = 0.
 
     r = np.linalg.norm(v)
     if _jit_isclose(r, 0):
         pass
     elif _jit_isclose(x**2 + y**2, 0):
-        grad_S_inv[0, 0] = 0.
-        grad_S_inv[0, 1] = 0.
         grad_S_inv[0, 2] = 1
         grad_S_inv[1, 0] = -1 / z
         grad_S_inv[1, 1] = -1 / z
-        grad_S_inv[1, 2] = 0.
-        grad_S_inv[2, 0] = 0.
-        grad_S_inv[2, 1] = 0.
-        grad_S_inv[2, 2] = 0.
     else:
         grad_S_inv[0, 0] = x / r
         grad_S_inv[0, 1] = y / r
@@ -956,68 +989,131 @@ def get_grad_S_inv(v):
         grad_S_inv[1, 2] = sqrt(x**2 + y**2) / r**2
         grad_S_inv[2, 0] = y / (x**2 + y**2)
         grad_S_inv[2, 1] = -x / (x**2 + y**2)
-        grad_S_inv[2, 2] = 0.
-    return grad_S_inv
-
-
-@jit(nopython=True, cache=True)
-def get_T(X, c_table, j):
-    err, B = get_B(X, c_table, j)
-    if err == ERR_CODE_OK:
-        v_b = get_ref_pos(X, c_table[0, j])
-        result = np.dot(B.T, X[:, j] - v_b)
-    else:
-        result = np.empty(3)
-    return err, result
 
 
 @jit(nopython=True, cache=True)
 def get_C(X, c_table):
     C = np.empty((3, c_table.shape[1]))
+    ref_pos = np.empty((3, 3))
+    B = np.empty((3, 3))
+    IB = np.empty(3)
+    T = np.empty(3)
+    v = np.empty(3)
 
     for j in range(C.shape[1]):
-        err, v = get_T(X, c_table, j)
-        if err == ERR_CODE_OK:
-            C[:, j] = get_S_inv(v)
-        else:
+        fill_ref_pos(X, c_table, j, ref_pos)
+        err = fill_B(ref_pos, B, v)
+        if err != ERR_CODE_OK:
             return (err, C)
+        fill_IB(X, j, ref_pos, IB)
+        fill_T(IB, B, T)
+        r = np.linalg.norm(T)
+        if r == 0:
+            C[:, j] = 0.
+        else:
+            C[0, j] = r
+            C[1, j] = arccos(-T[2] / r)
+            C[2, j] = arctan2(-T[1] / r, T[0] / r)
     return (ERR_CODE_OK, C)
 
 
 @jit(nopython=True, cache=True)
-def get_grad_C(X, c_table):
+def get_grad_C_blocks(X, c_table):
+    """Return the nonzero ``(3, 3)`` blocks of :func:`get_grad_C`.
+
+    The blocks of the row of atom ``j`` are
+    ``data[indptr[j]:indptr[j + 1]]`` and belong to the atoms
+    ``indices[indptr[j]:indptr[j + 1]]``,
+    which is the layout of :class:`scipy.sparse.bsr_matrix`.
+
+    Returns:
+        tuple: ``(err, row, data, indices, indptr)``.
+        The blocks of an invalid row and of the following rows are zero.
+    """
     n_atoms = X.shape[1]
-    grad_C = np.zeros((3, n_atoms, n_atoms, 3))
+    indptr = np.zeros(n_atoms + 1, dtype=np.int64)
+    for j in range(n_atoms):
+        indptr[j + 1] = indptr[j] + 1
+        for k in range(3):
+            if c_table[k, j] > constants.keys_below_are_abs_refs:
+                indptr[j + 1] += 1
+    data = np.zeros((indptr[n_atoms], 3, 3))
+    indices = np.zeros(indptr[n_atoms], dtype=np.int64)
+    ref_pos = np.empty((3, 3))
+    B = np.empty((3, 3))
+    grad_B = np.empty((3, 3, 3, 3))
+    IB = np.empty(3)
+    T = np.empty(3)
+    v = np.empty(3)
+    grad_S_inv = np.empty((3, 3))
+    A = np.empty((3, 3))
+    grad = np.empty((3, 3))
 
-    for j in range(X.shape[1]):
-        IB = (X[:, j] - get_ref_pos(X, c_table[0, j])).reshape((3, 1, 1))
-        grad_S_inv = get_grad_S_inv(get_T(X, c_table, j)[1])
-        err, B = get_B(X, c_table, j)
+    for j in range(n_atoms):
+        fill_ref_pos(X, c_table, j, ref_pos)
+        err = fill_B(ref_pos, B, v)
         if err == ERR_CODE_InvalidReference:
-            return (err, j, grad_C)
-        grad_B = get_grad_B(X, c_table, j)
+            return (err, j, data, indices, indptr)
+        fill_IB(X, j, ref_pos, IB)
+        fill_T(IB, B, T)
+        fill_grad_S_inv(T, grad_S_inv)
+        fill_grad_B(ref_pos, grad_B, v)
 
         # Derive for j
-        grad_C[:, j, j, :] = np.dot(grad_S_inv, B.T)
+        p = indptr[j]
+        indices[p] = j
+        np.dot(grad_S_inv, B.T, grad)
+        data[p] = grad
 
-        # Derive for b(j)
-        if c_table[0, j] > constants.keys_below_are_abs_refs:
-            A = np.sum(grad_B[:, :, 0, :] * IB, axis=0)
-            grad_C[:, j, c_table[0, j], :] = np.dot(grad_S_inv, A - B.T)
-        else:
-            grad_C[:, j, c_table[0, j], :] = 0.
+        # Derive for b(j), a(j) and d(j); absolute references are constant
+        for k in range(3):
+            i = c_table[k, j]
+            if i < constants.keys_below_are_abs_refs:
+                continue
+            p += 1
+            indices[p] = i
+            for m in range(3):
+                for n in range(3):
+                    A[m, n] = (grad_B[0, m, k, n] * IB[0]
+                               + grad_B[1, m, k, n] * IB[1]
+                               + grad_B[2, m, k, n] * IB[2])
+                    if k == 0:
+                        A[m, n] -= B[n, m]
+            np.dot(grad_S_inv, A, grad)
+            data[p] = grad
+    return (ERR_CODE_OK, j, data, indices, indptr)
 
-        # Derive for a(j)
-        if c_table[1, j] > constants.keys_below_are_abs_refs:
-            A = np.sum(grad_B[:, :, 1, :] * IB, axis=0)
-            grad_C[:, j, c_table[1, j], :] = np.dot(grad_S_inv, A)
-        else:
-            grad_C[:, j, c_table[1, j], :] = 0.
 
-        # Derive for d(j)
-        if c_table[2, j] > constants.keys_below_are_abs_refs:
-            A = np.sum(grad_B[:, :, 2, :] * IB, axis=0)
-            grad_C[:, j, c_table[2, j], :] = np.dot(grad_S_inv, A)
-        else:
-            grad_C[:, j, c_table[2, j], :] = 0.
-    return (ERR_CODE_OK, j, grad_C)  # pylint:disable=undefined-loop-variable
+@jit(nopython=True, cache=True)
+def get_grad_C(X, c_table):
+    n_atoms = X.shape[1]
+    err, row, data, indices, indptr = get_grad_C_blocks(X, c_table)
+    grad_C = np.zeros((3, n_atoms, n_atoms, 3))
+    for j in range(n_atoms):
+        for p in range(indptr[j], indptr[j + 1]):
+            grad_C[:, j, indices[p], :] = data[p]
+    return (err, row, grad_C)
+
+
+@jit(nopython=True, cache=True, nogil=True, parallel=True)
+def get_C_frames(X, c_table):
+    """Apply :func:`get_C` to several frames in parallel.
+
+    Args:
+        X (np.array): ``(n_frames, 3, n_atoms)`` array of positions.
+        c_table (np.array): The construction table shared by all frames.
+
+    Returns:
+        tuple: ``(err, C)`` with the ``(n_frames,)`` array of error codes
+        and the ``(n_frames, 3, n_atoms)`` array of bond lengths,
+        angles and dihedrals in radians.
+        The values of a frame with an error are undefined.
+    """
+    n_frames = X.shape[0]
+    err = np.empty(n_frames, dtype=np.int64)
+    C = np.empty(X.shape)
+    for f in nb.prange(n_frames):
+        frame_err, frame_C = get_C(X[f], c_table)
+        err[f] = frame_err
+        C[f] = frame_C
+    return err, C
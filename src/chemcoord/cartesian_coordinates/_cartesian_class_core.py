@@ -5,25 +5,35 @@ from __future__ import (absolute_import, division, print_function,
 import collections
 import copy
 import itertools
+import warnings
 from functools import partial
-from itertools import product
 
-import numba as nb
 import numpy as np
 import pandas as pd
 from numba import jit
-from sortedcontainers import SortedSet
+from scipy.optimize import linear_sum_assignment
 
 import chemcoord.cartesian_coordinates.xyz_functions as xyz_functions
 import chemcoord.constants as constants
 from chemcoord._generic_classes.generic_core import GenericCore
+from chemcoord.cartesian_coordinates._bond_lengths import \
+    get_bond_lengths, get_element_codes
 from chemcoord.cartesian_coordinates._cartesian_class_pandas_wrapper import \
     PandasWrapper
+from chemcoord.cartesian_coordinates._connectivity import \
+    Connectivity, get_coordination_spheres, get_environment_hashes, \
+    sort_by_component
+from chemcoord.cartesian_coordinates._neighbor_search import \
+    CellList, VerletList, get_periodic_bond_pairs, get_periodic_distances
 from chemcoord.cartesian_coordinates.xyz_functions import dot
 from chemcoord.configuration import settings
 from chemcoord.exceptions import IllegalArgumentCombination, PhysicalMeaning
 from six.moves import zip  # pylint:disable=redefined-builtin
 
+# Coordination spheres of up to this number of bonds are looked up in the
+# shells of all atoms, which are cached with the bonds.
+_MAX_CACHED_SPHERE = 6
+
 
 class CartesianCore(PandasWrapper, GenericCore):
 
@@ -96,6 +106,34 @@ class CartesianCore(PandasWrapper, GenericCore):
         else:
             return selected
 
+    def _get_xyz(self):
+        """Return the positions as ``(n, 3)`` float array.
+
+        Faster than ``self.loc[:, ['x', 'y', 'z']].values``
+        for small molecules.
+        """
+        return np.stack([self._frame[axis].values for axis in 'xyz'],
+                        axis=1).astype('f8')
+
+    def _get_cell(self):
+        """Return the periodic cell from ``metadata['cell']``.
+
+        Returns:
+            np.array: A ``(3, 3)`` array with the lattice vectors as rows
+            or ``None`` for open boundaries.
+        """
+        cell = self.metadata.get('cell')
+        if cell is None:
+            return None
+        return np.asarray(cell, dtype='f8').reshape(3, 3)
+
+    def _get_state(self):
+        # The bonds depend on the periodic cell as well.
+        cell = self._get_cell()
+        if cell is not None:
+            cell = tuple(cell.ravel())
+        return (super(CartesianCore, self)._get_state(), cell)
+
     def _test_if_can_be_added(self, other):
         if not (set(self.index) == set(other.index)
                 and np.alltrue(self['atom'] == other.loc[self.index, 'atom'])):
@@ -293,95 +331,9 @@ class CartesianCore(PandasWrapper, GenericCore):
                     pass
         return out
 
-    @staticmethod
-    @jit(nopython=True, cache=True)
-    def _jit_give_bond_array(pos, bond_radii, self_bonding_allowed=False):
-        """Calculate a boolean array where ``A[i,j] is True`` indicates a
-        bond between the i-th and j-th atom.
-        """
-        n = pos.shape[0]
-        bond_array = np.empty((n, n), dtype=nb.boolean)
-
-        for i in range(n):
-            for j in range(i, n):
-                D = 0
-                for h in range(3):
-                    D += (pos[i, h] - pos[j, h])**2
-                B = (bond_radii[i] + bond_radii[j])**2
-                bond_array[i, j] = (B - D) >= 0
-                bond_array[j, i] = bond_array[i, j]
-        if not self_bonding_allowed:
-            for i in range(n):
-                bond_array[i, i] = False
-        return bond_array
-
-    def _update_bond_dict(self, fragment_indices,
-                          positions,
-                          bond_radii,
-                          bond_dict=None,
-                          self_bonding_allowed=False,
-                          convert_index=None):
-        """If bond_dict is provided, this function is not side effect free
-        bond_dict has to be a collections.defaultdict(set)
-        """
-        assert (isinstance(bond_dict, collections.defaultdict)
-                or bond_dict is None)
-        fragment_indices = list(fragment_indices)
-        if convert_index is None:
-            convert_index = dict(enumerate(fragment_indices))
-        if bond_dict is None:
-            bond_dict = collections.defaultdict(set)
-
-        frag_pos = positions[fragment_indices, :]
-        frag_bond_radii = bond_radii[fragment_indices]
-
-        bond_array = self._jit_give_bond_array(
-            frag_pos, frag_bond_radii,
-            self_bonding_allowed=self_bonding_allowed)
-        a, b = bond_array.nonzero()
-        a, b = [convert_index[i] for i in a], [convert_index[i] for i in b]
-        for row, index in enumerate(a):
-            # bond_dict is a collections.defaultdict(set)
-            bond_dict[index].add(b[row])
-        return bond_dict
-
-    def _divide_et_impera(self, n_atoms_per_set=500, offset=3):
-        coords = ['x', 'y', 'z']
-        sorted_series = dict(zip(
-            coords, [self[axis].sort_values() for axis in coords]))
-
-        def ceil(x):
-            return int(np.ceil(x))
-
-        n_sets = len(self) / n_atoms_per_set
-        n_sets_along_axis = ceil(n_sets**(1 / 3))
-        n_atoms_per_set_along_axis = ceil(len(self) / n_sets_along_axis)
-
-        def give_index(series, i, n_atoms_per_set_along_axis, offset=offset):
-            N = n_atoms_per_set_along_axis
-            try:
-                min_value, max_value = series.iloc[[i * N, (i + 1) * N]]
-            except IndexError:
-                min_value, max_value = series.iloc[[i * N, -1]]
-            selection = series.between(min_value - offset, max_value + offset)
-            return set(series[selection].index)
-
-        indices_at_axis = {axis: {} for axis in coords}
-        for axis, i in product(coords, range(n_sets_along_axis)):
-            indices_at_axis[axis][i] = give_index(sorted_series[axis], i,
-                                                  n_atoms_per_set_along_axis)
-
-        array_of_fragments = np.full([n_sets_along_axis] * 3, None, dtype='O')
-        for i, j, k in product(*[range(x) for x in array_of_fragments.shape]):
-            selection = (indices_at_axis['x'][i]
-                         & indices_at_axis['y'][j]
-                         & indices_at_axis['z'][k])
-            array_of_fragments[i, j, k] = selection
-        return array_of_fragments
-
     def get_bonds(self,
                   self_bonding_allowed=False,
-                  offset=3,
+                  offset=None,
                   modified_properties=None,
                   use_lookup=False,
                   set_lookup=True,
@@ -390,25 +342,28 @@ class CartesianCore(PandasWrapper, GenericCore):
         """Return a dictionary representing the bonds.
 
         .. warning:: This function is **not sideeffect free**, since it
-            assigns the output to a variable ``self._metadata['bond_dict']`` if
-            ``set_lookup`` is ``True`` (which is the default). This is
-            necessary for performance reasons.
+            caches the bonds in ``self._metadata`` if ``set_lookup`` is
+            ``True`` (which is the default). This is necessary for
+            performance reasons.
 
         ``.get_bonds()`` will use or not use a lookup
-        depending on ``use_lookup``. Greatly increases performance if
-        True, but could introduce bugs in certain situations.
-
-        Just imagine a situation where the :class:`~Cartesian` is
-        changed manually. If you apply lateron a method e.g.
-        :meth:`~get_zmat()` that makes use of :meth:`~get_bonds()`
-        the dictionary of the bonds
-        may not represent the actual situation anymore.
-
-        You have two possibilities to cope with this problem.
-        Either you just re-execute ``get_bonds`` on your specific instance,
-        or you change the ``internally_use_lookup`` option in the settings.
-        Please note that the internal use of the lookup variable
-        greatly improves performance.
+        depending on ``use_lookup``.
+        Every method that changes the :class:`~Cartesian` inplace,
+        e.g. assignments via :meth:`~Cartesian.loc`,
+        invalidates the lookup.
+        So ``use_lookup=True`` always returns the bonds for the current
+        coordinates, unless they were calculated with different
+        arguments, e.g. ``modified_properties``.
+        The dictionary of the lookup is returned itself,
+        so changing it inplace changes the bonds that are used
+        with ``use_lookup=True``, e.g. by :meth:`~Cartesian.fragmentate`.
+        The internally used default is
+        ``settings['defaults']['use_lookup']``.
+
+        If ``metadata['cell']`` contains a ``(3, 3)`` matrix with the
+        lattice vectors as rows, the bonds are detected under periodic
+        boundary conditions, i.e. also between atoms
+        on opposite faces of the cell.
 
         Args:
             modified_properties (dic): If you want to change the van der
@@ -418,7 +373,10 @@ class CartesianCore(PandasWrapper, GenericCore):
                     modified_properties = {index1: 1.5}
 
                 For global changes use the constants module.
-            offset (float):
+            offset (float): Deprecated and without effect. The neighbor
+                search uses a linked-cell list whose cells are as large
+                as the largest possible bond.
+                Passing it raises a :class:`DeprecationWarning`.
             use_lookup (bool):
             set_lookup (bool):
             self_bonding_allowed (bool):
@@ -432,68 +390,269 @@ class CartesianCore(PandasWrapper, GenericCore):
             dict: Dictionary mapping from an atom index to the set of
             indices of atoms bonded to.
         """
+        if offset is not None:
+            message = 'offset is without effect and will be removed.'
+            warnings.warn(message, DeprecationWarning)
+        return self._get_connectivity(
+            self_bonding_allowed=self_bonding_allowed,
+            modified_properties=modified_properties,
+            use_lookup=use_lookup, set_lookup=set_lookup,
+            atomic_radius_data=atomic_radius_data).to_dict()
+
+    def set_bonds(self, bond_dict):
+        """Replace the bonds in the lookup.
+
+        All methods called with ``use_lookup=True``, e.g.
+        :meth:`~Cartesian.fragmentate` or
+        :meth:`~Cartesian.get_coordination_sphere`,
+        use the new bonds until the :class:`~Cartesian` is changed inplace
+        or the bonds are calculated again.
+
+        Args:
+            bond_dict (dict): Dictionary mapping from an atom index to the
+                set of indices of atoms bonded to,
+                as returned by :meth:`~Cartesian.get_bonds`.
+                A bond given only for one of its atoms is added to both.
+
+        Returns:
+            None:
+        """
+        # Results derived from the old bonds become invalid.
+        self._bump_version()
+        self._set_connectivity(Connectivity.from_dict(bond_dict, self.index))
+        # An outdated lookup is searched again instead of being patched.
+        self._set_cached('cell_list', None)
+
+    def _get_connectivity(self,
+                          self_bonding_allowed=False,
+                          modified_properties=None,
+                          use_lookup=False,
+                          set_lookup=True,
+                          atomic_radius_data=None):
+        """Return the bonds as
+        :class:`~chemcoord.cartesian_coordinates._connectivity.Connectivity`.
+
+        The arguments are the same as for :meth:`~Cartesian.get_bonds`.
+        A connectivity from the lookup is used only if it was calculated
+        with the same arguments.
+        It is restricted to ``self``, if
+        ``self`` is a subset of the atoms it was calculated for.
+        """
         if atomic_radius_data is None:
             atomic_radius_data = settings['defaults']['atomic_radius_data']
+        arguments = self._get_bond_arguments(
+            self_bonding_allowed=self_bonding_allowed,
+            modified_properties=modified_properties,
+            atomic_radius_data=atomic_radius_data)
+        positions = self._get_xyz()
+        cell = self._get_cell()
 
         def complete_calculation():
-            old_index = self.index
-            self.index = range(len(self))
-            fragments = self._divide_et_impera(offset=offset)
-            positions = np.array(self.loc[:, ['x', 'y', 'z']], order='F')
-            data = self.add_data([atomic_radius_data, 'valency'])
-            bond_radii = data[atomic_radius_data]
-            if modified_properties is not None:
-                bond_radii.update(pd.Series(modified_properties))
-            bond_radii = bond_radii.values
-            bond_dict = collections.defaultdict(set)
-            for i, j, k in product(*[range(x) for x in fragments.shape]):
-                # The following call is not side effect free and changes
-                # bond_dict
-                self._update_bond_dict(
-                    fragments[i, j, k], positions, bond_radii,
-                    bond_dict=bond_dict,
-                    self_bonding_allowed=self_bonding_allowed)
-
-            for i in set(self.index) - set(bond_dict.keys()):
-                bond_dict[i] = {}
-
-            self.index = old_index
-            rename = dict(enumerate(self.index))
-            bond_dict = {rename[key]: {rename[i] for i in bond_dict[key]}
-                         for key in bond_dict}
-            return bond_dict
-
+            codes, bond_lengths, deltas = get_bond_lengths(
+                self._frame['atom'].values, atomic_radius_data,
+                modified_radii=modified_properties)
+            if cell is not None:
+                a, b = get_periodic_bond_pairs(
+                    positions, codes, bond_lengths, cell,
+                    self_bonding_allowed=self_bonding_allowed, deltas=deltas)
+                return Connectivity.from_pairs(a, b, self.index), None
+            cell_list = CellList(positions, codes, bond_lengths,
+                                 self_bonding_allowed=self_bonding_allowed,
+                                 deltas=deltas)
+            a, b = cell_list.get_bond_pairs()
+            return Connectivity.from_pairs(a, b, self.index), cell_list
+
+        connectivity, cell_list = None, None
         if use_lookup:
-            try:
-                bond_dict = self._metadata['bond_dict']
-            except KeyError:
-                bond_dict = complete_calculation()
-        else:
-            bond_dict = complete_calculation()
+            connectivity = self._get_cached_connectivity(arguments)
+            if connectivity is None:
+                if cell is None:
+                    connectivity, cell_list = self._update_connectivity(
+                        positions, arguments)
+            elif not connectivity.index.equals(self.index):
+                if self.index.isin(connectivity.index).all():
+                    connectivity = connectivity.restrict(self.index)
+                else:
+                    connectivity = None
+        if connectivity is None:
+            connectivity, cell_list = complete_calculation()
 
         if set_lookup:
-            self._metadata['bond_dict'] = bond_dict
-        return bond_dict
+            self._set_connectivity(connectivity, arguments)
+            if cell_list is not None:
+                atoms = self._frame['atom'].values
+                self._set_cached('cell_list', (arguments, self.index, atoms,
+                                               positions, cell_list))
+            elif cell is not None:
+                # Periodic bonds are not updated incrementally.
+                self._set_cached('cell_list', None)
+        return connectivity
 
-    def _give_val_sorted_bond_dict(self, use_lookup):
-        def complete_calculation():
-            bond_dict = self.get_bonds(use_lookup=use_lookup)
-            valency = dict(zip(self.index,
-                               self.add_data('valency')['valency']))
-            val_bond_dict = {key:
-                             SortedSet([i for i in bond_dict[key]],
-                                       key=lambda x: -valency[x], load=20)
-                             for key in bond_dict}
-            return val_bond_dict
-        if use_lookup:
-            try:
-                val_bond_dict = self._metadata['val_bond_dict']
-            except KeyError:
-                val_bond_dict = complete_calculation()
+    @staticmethod
+    def _get_bond_arguments(self_bonding_allowed=False,
+                            modified_properties=None,
+                            atomic_radius_data=None):
+        """Return the arguments of the bond detection as hashable key.
+
+        The arguments are the same as for :meth:`~Cartesian.get_bonds`.
+        """
+        if atomic_radius_data is None:
+            atomic_radius_data = settings['defaults']['atomic_radius_data']
+        if modified_properties:
+            modified_properties = frozenset(modified_properties.items())
         else:
-            val_bond_dict = complete_calculation()
-        self._metadata['val_bond_dict'] = val_bond_dict
-        return val_bond_dict
+            modified_properties = None
+        return (bool(self_bonding_allowed), modified_properties,
+                atomic_radius_data)
+
+    def _get_cached_connectivity(self, arguments, outdated=False):
+        """Return the cached connectivity, if it was calculated
+        with ``arguments``.
+
+        Args:
+            arguments (tuple): As returned by :meth:`_get_bond_arguments`.
+            outdated (bool): Look into :meth:`_get_cached`.
+
+        Returns:
+            Connectivity: The cached connectivity or ``None``.
+        """
+        cached = self._get_cached('connectivity', outdated=outdated)
+        if cached is None or cached[0] != arguments:
+            return None
+        connectivity = cached[1]
+        if connectivity.has_changed_dict():
+            if self._get_cached('connectivity') is None:
+                # Changed bonds of an outdated lookup are not patched.
+                return None
+            # The dictionary returned by get_bonds was changed inplace.
+            connectivity = connectivity.apply_dict_changes()
+            self._bump_version()
+            self._set_connectivity(connectivity, arguments)
+            self._set_cached('cell_list', None)
+        return connectivity
+
+    def _set_connectivity(self, connectivity, arguments=None):
+        """Cache the connectivity together with the arguments
+        of the bond detection.
+
+        Args:
+            connectivity (Connectivity):
+            arguments (tuple): As returned by :meth:`_get_bond_arguments`.
+                Bonds given explicitly are used like bonds calculated
+                with the default arguments.
+
+        Returns:
+            None:
+        """
+        if arguments is None:
+            arguments = self._get_bond_arguments()
+        self._set_cached('connectivity', (arguments, connectivity))
+
+    def _update_connectivity(self, positions, arguments):
+        """Update an outdated connectivity after some atoms were displaced.
+
+        Only the bonds of the displaced atoms are searched again,
+        using the cell list of the outdated calculation.
+
+        Args:
+            positions (np.array): The current positions.
+            arguments (tuple): The arguments of the bond detection
+                as returned by :meth:`_get_bond_arguments`.
+
+        Returns:
+            tuple: ``(connectivity, cell_list)`` or ``(None, None)``
+            if the atoms changed, too many atoms were displaced
+            since the bonds were calculated or the cell list was built
+            with other arguments.
+        """
+        connectivity = self._get_cached_connectivity(arguments, outdated=True)
+        state = self._get_cached('cell_list', outdated=True)
+        if connectivity is None or state is None:
+            return None, None
+        cell_list_arguments, index, atoms, old_positions, cell_list = state
+        # The radii and self_bonding_allowed are stored in the cell list.
+        if cell_list_arguments != arguments:
+            return None, None
+        if not (index.equals(self.index) and connectivity.index.equals(index)
+                and np.array_equal(atoms, self._frame['atom'].values)):
+            return None, None
+        changed = (positions != old_positions).any(axis=1).nonzero()[0]
+        # The displaced atoms are compared with each other directly.
+        if cell_list.get_moved(positions).sum()**2 > 64 * len(self):
+            if len(changed)**2 > 64 * len(self):
+                return None, None
+            # The cell list was built for other positions,
+            # e.g. for another frame of a trajectory.
+            cell_list = cell_list.rebuild(old_positions)
+        if len(changed):
+            first, second = cell_list.get_bond_pairs_of(changed, positions)
+            connectivity = connectivity.replace_bonds(changed, first, second)
+        return connectivity, cell_list
+
+    @staticmethod
+    def _set_bonds_of_trajectory(cartesians, skin=0.5,
+                                 atomic_radius_data=None):
+        """Detect the bonds in every frame of a trajectory.
+
+        A :class:`~chemcoord.cartesian_coordinates._neighbor_search.VerletList`
+        is shared between consecutive frames with the same atoms,
+        so that the neighbour search is only repeated after an atom
+        moved more than ``skin / 2``.
+        The bonds and the cell list of the last neighbour search
+        are cached like with :meth:`~Cartesian.get_bonds`,
+        so the bonds of a frame are updated incrementally
+        after a few atoms were moved.
+
+        Args:
+            cartesians (list): A list of :class:`~chemcoord.Cartesian`.
+            skin (float):
+            atomic_radius_data (str): Look into
+                :meth:`~chemcoord.Cartesian.get_bonds`.
+
+        Returns:
+            list: The
+            :class:`~chemcoord.cartesian_coordinates._neighbor_search.VerletList`
+            of every sequence of frames with the same atoms.
+        """
+        if atomic_radius_data is None:
+            atomic_radius_data = settings['defaults']['atomic_radius_data']
+        verlet_lists, atoms = [], None
+        for molecule in cartesians:
+            positions = molecule._get_xyz()
+            if not np.array_equal(atoms, molecule._frame['atom'].values):
+                atoms = molecule._frame['atom'].values
+                codes, bond_lengths, _ = get_bond_lengths(atoms,
+                                                          atomic_radius_data)
+                verlet_lists.append(VerletList(positions, codes, bond_lengths,
+                                               skin=skin))
+            verlet_list = verlet_lists[-1]
+            a, b = verlet_list.get_bond_pairs(positions)
+            arguments = molecule._get_bond_arguments(
+                atomic_radius_data=atomic_radius_data)
+            molecule._set_connectivity(
+                Connectivity.from_pairs(a, b, molecule.index), arguments)
+            molecule._set_cached('cell_list', (
+                arguments, molecule.index, atoms, positions,
+                verlet_list.cell_list))
+        return verlet_lists
+
+    def _get_val_sorted_connectivity(self, use_lookup):
+        """Return the connectivity with the bonded atoms of every atom
+        sorted by descending valency.
+
+        Atoms with the same valency are sorted by their position.
+        """
+        if use_lookup:
+            connectivity = self._get_cached('val_connectivity')
+            if (connectivity is not None
+                    and connectivity.index.equals(self.index)):
+                return connectivity
+        connectivity = self._get_connectivity(use_lookup=use_lookup)
+        codes = get_element_codes(self._frame['atom'].values)
+        connectivity = connectivity.sort_bonded(
+            constants.elements['valency'].values[codes])
+        self._set_cached('val_connectivity', connectivity)
+        return connectivity
 
     def get_coordination_sphere(
             self, index_of_atom, n_sphere=1, give_only_index=False,
@@ -522,30 +681,14 @@ class CartesianCore(PandasWrapper, GenericCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
         exclude = set() if exclude is None else exclude
-        bond_dict = self.get_bonds(use_lookup=use_lookup)
         i = index_of_atom
         if n_sphere != 0:
-            visited = set([i]) | exclude
-            try:
-                tmp_bond_dict = {j: (bond_dict[j] - visited)
-                                 for j in bond_dict[i]}
-            except KeyError:
-                tmp_bond_dict = {}
-            n = 0
-            while tmp_bond_dict and (n + 1) < n_sphere:
-                new_tmp_bond_dict = {}
-                for i in tmp_bond_dict:
-                    if i in visited:
-                        continue
-                    visited.add(i)
-                    for j in tmp_bond_dict[i]:
-                        new_tmp_bond_dict[j] = bond_dict[j] - visited
-                tmp_bond_dict = new_tmp_bond_dict
-                n += 1
-            if only_surface:
-                index_out = set(tmp_bond_dict.keys())
+            if i in self.index:
+                index_out = set(self._get_coordination_spheres(
+                    [i], n_sphere=n_sphere, only_surface=only_surface,
+                    exclude=exclude, use_lookup=use_lookup)[0])
             else:
-                index_out = visited | set(tmp_bond_dict.keys())
+                index_out = set() if only_surface else {i}
         else:
             index_out = {i}
 
@@ -554,6 +697,44 @@ class CartesianCore(PandasWrapper, GenericCore):
         else:
             return self.loc[index_out - exclude]
 
+    def _get_coordination_spheres(self, atoms, n_sphere=1, only_surface=True,
+                                  exclude=None, use_lookup=None):
+        """Return the coordination spheres of several atoms at once.
+
+        The graph is traversed in one compiled function,
+        look into :meth:`get_coordination_sphere` for the arguments.
+        If the lookup is used and no atoms are excluded, spheres of up to
+        ``_MAX_CACHED_SPHERE`` bonds are taken from the shells cached with
+        the bonds (:meth:`Connectivity.get_shells`).
+
+        Args:
+            atoms (sequence): Indices of the central atoms.
+
+        Returns:
+            list: An array of indices for every central atom.
+            The central atom is the first entry, unless ``only_surface``
+            is set.
+        """
+        if use_lookup is None:
+            use_lookup = settings['defaults']['use_lookup']
+        connectivity = self._get_connectivity(use_lookup=use_lookup)
+        positions = connectivity.index.get_indexer(atoms)
+        n_sphere = int(min(n_sphere, len(connectivity)))
+        labels = connectivity.index.values
+        if use_lookup and not exclude and n_sphere <= _MAX_CACHED_SPHERE:
+            shell_ptr, spheres = connectivity.get_shells(n_sphere)
+            starts = shell_ptr[positions, n_sphere if only_surface else 0]
+            stops = shell_ptr[positions, n_sphere + 1]
+            return [labels[spheres[start:stop]]
+                    for start, stop in zip(starts, stops)]
+        excluded = np.zeros(len(connectivity), dtype=bool)
+        if exclude is not None:
+            excluded[connectivity.get_positions(exclude)] = True
+        sphere_ptr, spheres, _ = get_coordination_spheres(
+            connectivity.indptr, connectivity.indices, positions,
+            n_sphere, excluded, only_surface)
+        return np.split(labels[spheres], sphere_ptr[1:-1])
+
     def _preserve_bonds(self, sliced_cartesian,
                         use_lookup=None):
         """Is called after cutting geometric shapes.
@@ -577,27 +758,15 @@ class CartesianCore(PandasWrapper, GenericCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
-        included_atoms_set = set(sliced_cartesian.index)
-        assert included_atoms_set.issubset(set(self.index)), \
+        connectivity = self._get_connectivity(use_lookup=use_lookup)
+        positions = connectivity.index.get_indexer(sliced_cartesian.index)
+        assert (positions != -1).all(), \
             'The sliced Cartesian has to be a subset of the bigger frame'
-        bond_dic = self.get_bonds(use_lookup=use_lookup)
-        new_atoms = set([])
-        for atom in included_atoms_set:
-            new_atoms = new_atoms | bond_dic[atom]
-        new_atoms = new_atoms - included_atoms_set
-        while not new_atoms == set([]):
-            index_of_interest = new_atoms.pop()
-            included_atoms_set = (
-                included_atoms_set |
-                self.get_coordination_sphere(
-                    index_of_interest,
-                    n_sphere=float('inf'),
-                    only_surface=False,
-                    exclude=included_atoms_set,
-                    give_only_index=True,
-                    use_lookup=use_lookup))
-            new_atoms = new_atoms - included_atoms_set
-        molecule = self.loc[included_atoms_set, :]
+        # Every fragment with an atom in the sliced Cartesian is kept.
+        n_components, component = connectivity.get_components()
+        is_kept = np.zeros(n_components, dtype=bool)
+        is_kept[component[positions]] = True
+        molecule = self.iloc[is_kept[component].nonzero()[0]]
         return molecule
 
     def cut_sphere(
@@ -840,17 +1009,20 @@ class CartesianCore(PandasWrapper, GenericCore):
         return dihedrals
 
     def fragmentate(self, give_only_index=False,
-                    use_lookup=None):
+                    use_lookup=None, lazy=False):
         """Get the indices of non bonded parts in the molecule.
 
+        The fragments are ordered by the position of their first atom
+        and the atoms of a fragment keep their order.
+
         Args:
             give_only_index (bool): If ``True`` a set of indices is returned.
                 Otherwise a new Cartesian instance.
-            use_lookup (bool): Use a lookup variable for
-                :meth:`~chemcoord.Cartesian.get_bonds`.
             use_lookup (bool): Use a lookup variable for
                 :meth:`~chemcoord.Cartesian.get_bonds`. The default is
                 specified in ``settings['defaults']['use_lookup']``
+            lazy (bool): Return an iterator that creates the fragments
+                one after the other.
 
         Returns:
             list: A list of sets of indices or new Cartesian instances.
@@ -858,29 +1030,30 @@ class CartesianCore(PandasWrapper, GenericCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
-        fragments = []
-        pending = set(self.index)
-        self.get_bonds(use_lookup=use_lookup)
-
-        while pending:
-            index = self.get_coordination_sphere(
-                pending.pop(), use_lookup=True, n_sphere=float('inf'),
-                only_surface=False, give_only_index=True)
-            pending = pending - index
-            if give_only_index:
-                fragments.append(index)
-            else:
-                fragment = self.loc[index]
-                fragment._metadata['bond_dict'] = fragment.restrict_bond_dict(
-                    self._metadata['bond_dict'])
-                try:
-                    fragment._metadata['val_bond_dict'] = (
-                        fragment.restrict_bond_dict(
-                            self._metadata['val_bond_dict']))
-                except KeyError:
-                    pass
-                fragments.append(fragment)
-        return fragments
+        connectivity = self._get_connectivity(use_lookup=use_lookup)
+        n_components, component = connectivity.get_components()
+        order, starts = sort_by_component(n_components, component)
+        bounds = list(zip(starts[:-1].tolist(), starts[1:].tolist()))
+        if give_only_index:
+            index = self.index.values[order].tolist()
+            fragments = (set(index[start:stop]) for start, stop in bounds)
+        else:
+            frame = self._frame.iloc[order]
+            # The cached results of self are not copied to the fragments.
+            _metadata = {key: value for key, value in self._metadata.items()
+                         if key != 'cache'}
+
+            def get_fragment(start, stop, connectivity):
+                fragment = self.__class__(frame.iloc[start:stop],
+                                          metadata=self.metadata,
+                                          _metadata=_metadata)
+                fragment._set_connectivity(connectivity)
+                return fragment
+            fragments = (
+                get_fragment(start, stop, fragment_connectivity)
+                for (start, stop), fragment_connectivity
+                in zip(bounds, connectivity.split()))
+        return fragments if lazy else list(fragments)
 
     def restrict_bond_dict(self, bond_dict):
         """Restrict a bond dictionary to self.
@@ -978,6 +1151,9 @@ class CartesianCore(PandasWrapper, GenericCore):
     def get_shortest_distance(self, other):
         """Calculate the shortest distance between self and other
 
+        If self has a periodic cell in ``metadata['cell']``,
+        the minimum image convention is used.
+
         Args:
             Cartesian: other
 
@@ -994,9 +1170,13 @@ class CartesianCore(PandasWrapper, GenericCore):
             The distance between self and other. (float)
         """
         coords = ['x', 'y', 'z']
-        pos1 = self.loc[:, coords].values
-        pos2 = other.loc[:, coords].values
-        D = self._jit_pairwise_distances(pos1, pos2)
+        pos1 = self._frame.loc[:, coords].values.astype('f8')
+        pos2 = other._frame.loc[:, coords].values.astype('f8')
+        cell = self._get_cell()
+        if cell is None:
+            D = self._jit_pairwise_distances(pos1, pos2)
+        else:
+            D = get_periodic_distances(pos1, pos2, cell)
         i, j = np.unravel_index(D.argmin(), D.shape)
         d = D[i, j]
         i, j = dict(enumerate(self.index))[i], dict(enumerate(other.index))[j]
@@ -1117,6 +1297,9 @@ class CartesianCore(PandasWrapper, GenericCore):
 
     def get_distance_to(self, origin=None, other_atoms=None, sort=False):
         """Return a Cartesian with a column for the distance from origin.
+
+        If the Cartesian has a periodic cell in ``metadata['cell']``,
+        the distance to the nearest periodic image is used.
         """
         if origin is None:
             origin = np.zeros(3)
@@ -1129,13 +1312,21 @@ class CartesianCore(PandasWrapper, GenericCore):
             other_atoms = self.index
 
         new = self.loc[other_atoms, :].copy()
+        cell = self._get_cell()
         norm = np.linalg.norm
-        try:
-            new['distance'] = norm((new - origin).loc[:, ['x', 'y', 'z']],
-                                   axis=1)
-        except AttributeError:
-            # Happens if molecule consists of only one atom
-            new['distance'] = norm((new - origin).loc[:, ['x', 'y', 'z']])
+        if cell is not None:
+            positions = new._frame.loc[:, ['x', 'y', 'z']].values.astype('f8')
+            origin = np.asarray(origin, dtype='f8').reshape(1, 3)
+            new['distance'] = get_periodic_distances(positions, origin,
+                                                     cell)[:, 0]
+        else:
+            try:
+                new['distance'] = norm((new - origin).loc[:, ['x', 'y', 'z']],
+                                       axis=1)
+            except AttributeError:
+                # Happens if molecule consists of only one atom
+                new['distance'] = norm(
+                    (new - origin).loc[:, ['x', 'y', 'z']])
         if sort:
             new.sort_values(by='distance', inplace=True)
         return new
@@ -1201,22 +1392,143 @@ class CartesianCore(PandasWrapper, GenericCore):
                 A dictionary mapping from a chemical environment to
                 the set of indices of atoms in this environment.
         """
+        symbols, environments = self._get_chem_env_counts(
+            n_sphere=n_sphere, use_lookup=use_lookup)
+        environments, inverse = np.unique(environments, axis=0,
+                                          return_inverse=True)
+
+        def get_chem_env(environment):
+            element, counts = environment[0], environment[1:]
+            return (symbols[element],
+                    frozenset((symbols[j], int(n))
+                              for j, n in enumerate(counts) if n))
+
+        environments = [get_chem_env(env) for env in environments]
+        chemical_environments = collections.defaultdict(set)
+        for k, i in zip(inverse.ravel(), self.index):
+            chemical_environments[environments[k]].add(i)
+        return dict(chemical_environments)
+
+    def _get_chem_env_counts(self, n_sphere=4, use_lookup=None):
+        """Return the chemical environments of
+        :meth:`~Cartesian.partition_chem_env` as integer array.
+
+        Args:
+            n_sphere (int):
+            use_lookup (bool): Use a lookup variable for
+                :meth:`~chemcoord.Cartesian.get_bonds`. The default is
+                specified in ``settings['defaults']['use_lookup']``
+
+        Returns:
+            tuple: ``(symbols, environments)`` where ``symbols`` are the
+            sorted element symbols of ``self``.
+            Row ``i`` of ``environments`` contains the position in
+            ``symbols`` of the element of the atom at position ``i``,
+            followed by the number of atoms of every element
+            up to ``n_sphere`` bonds away.
+        """
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
+        connectivity = self._get_connectivity(use_lookup=use_lookup)
+        n_atoms = len(connectivity)
+        n_sphere = int(min(n_sphere, n_atoms))
+        # All spheres are searched in one pass and cached with the bonds.
+        shell_ptr, spheres = connectivity.get_shells(n_sphere)
+        # The shell 0 is the atom itself.
+        starts, stops = shell_ptr[:, 1], shell_ptr[:, n_sphere + 1]
+        lengths = stops - starts
+        centre = np.repeat(np.arange(n_atoms), lengths)
+        neighbours = spheres[np.arange(lengths.sum()) + np.repeat(
+            starts - np.cumsum(lengths) + lengths, lengths)]
+
+        symbols, elements = np.unique(self._frame['atom'].values,
+                                      return_inverse=True)
+        n_elements = len(symbols)
+        counts = np.bincount(
+            centre * n_elements + elements[neighbours],
+            minlength=n_atoms * n_elements).reshape(n_atoms, n_elements)
+        return symbols, np.concatenate([elements[:, None], counts], axis=1)
+
+    def _get_chem_env_labels(self, other, n_sphere=4):
+        """Label the chemical environments of ``self`` and ``other``
+        with integers.
+
+        Two atoms get the same label, if they have the same chemical
+        environment as defined by :meth:`~Cartesian.partition_chem_env`,
+        also if they belong to different molecules.
 
-        def get_chem_env(self, i, n_sphere):
-            env_index = self.get_coordination_sphere(
-                i, n_sphere=n_sphere, only_surface=False,
-                give_only_index=True, use_lookup=use_lookup)
-            env_index.remove(i)
-            atoms = self.loc[env_index, 'atom']
-            environment = frozenset(collections.Counter(atoms).most_common())
-            return (self.loc[i, 'atom'], environment)
+        Args:
+            other (Cartesian):
+            n_sphere (int):
 
-        chemical_environments = collections.defaultdict(set)
-        for i in self.index:
-            chemical_environments[get_chem_env(self, i, n_sphere)].add(i)
-        return dict(chemical_environments)
+        Returns:
+            tuple: The labels of the atoms of ``self`` and of ``other``.
+        """
+        symbols1, environments1 = self._get_chem_env_counts(n_sphere)
+        symbols2, environments2 = other._get_chem_env_counts(n_sphere)
+        symbols = np.union1d(symbols1, symbols2)
+
+        def to_common_symbols(local_symbols, environments):
+            columns = np.searchsorted(symbols, local_symbols)
+            common = np.zeros((len(environments), len(symbols) + 1),
+                              dtype=environments.dtype)
+            common[:, 0] = columns[environments[:, 0]]
+            common[:, columns + 1] = environments[:, 1:]
+            return common
+
+        _, labels = np.unique(
+            np.concatenate([to_common_symbols(symbols1, environments1),
+                            to_common_symbols(symbols2, environments2)]),
+            axis=0, return_inverse=True)
+        labels = labels.ravel()
+        return labels[:len(self)], labels[len(self):]
+
+    def _get_chem_env_hashes(self, n_sphere=4, use_lookup=None):
+        """Return a hash of the chemical environment of every atom.
+
+        The hashes are a fingerprint of the topology that
+        can be compared between molecules.
+        Atoms with the same chemical environment
+        as defined by :meth:`~Cartesian.partition_chem_env` can have
+        different hashes and vice versa. Look into
+        :func:`~chemcoord.cartesian_coordinates._connectivity.get_environment_hashes`
+        for the differences to :meth:`~Cartesian.partition_chem_env`.
+
+        Args:
+            n_sphere (int): The number of refinement rounds.
+            use_lookup (bool): Use a lookup variable for
+                :meth:`~chemcoord.Cartesian.get_bonds`. The default is
+                specified in ``settings['defaults']['use_lookup']``
+
+        Returns:
+            np.array: An ``uint64`` hash for every atom.
+        """
+        if use_lookup is None:
+            use_lookup = settings['defaults']['use_lookup']
+        connectivity = self._get_connectivity(use_lookup=use_lookup)
+        return get_environment_hashes(
+            connectivity.indptr, connectivity.indices,
+            get_element_codes(self._frame['atom'].values),
+            int(min(n_sphere, len(connectivity))))
+
+    def _get_topology(self, use_lookup=None):
+        """Return a hashable key of the index, the elements and the bonds.
+
+        Two Cartesians with the same key differ only in their coordinates.
+
+        Args:
+            use_lookup (bool): Use a lookup variable for
+                :meth:`~chemcoord.Cartesian.get_bonds`. The default is
+                specified in ``settings['defaults']['use_lookup']``
+
+        Returns:
+            tuple:
+        """
+        if use_lookup is None:
+            use_lookup = settings['defaults']['use_lookup']
+        connectivity = self._get_connectivity(use_lookup=use_lookup)
+        return (tuple(self.index), tuple(self._frame['atom']),
+                connectivity.indptr.tobytes(), connectivity.indices.tobytes())
 
     def align(self, other, indices=None, ignore_hydrogens=False):
         """Align two Cartesians.
@@ -1270,7 +1582,7 @@ class CartesianCore(PandasWrapper, GenericCore):
         m2 = dot(xyz_functions.get_kabsch_rotation(pos1, pos2), m2)
         return m1, m2
 
-    def reindex_similar(self, other, n_sphere=4):
+    def reindex_similar(self, other, n_sphere=4, method='greedy'):
         """Reindex ``other`` to be similarly indexed as ``self``.
 
         Returns a reindexed copy of ``other`` that minimizes the
@@ -1279,6 +1591,13 @@ class CartesianCore(PandasWrapper, GenericCore):
         Read more about the definition of the chemical environment in
         :func:`Cartesian.partition_chem_env`
 
+        With ``method='greedy'`` every atom of ``self`` takes the nearest
+        atom of ``other`` that is not taken by a nearer atom.
+        With ``method='assignment'`` the sum of squared distances
+        is minimized for every chemical environment by solving
+        a linear sum assignment problem, which is deterministic and
+        much faster for large molecules.
+
         .. note:: It is necessary to align ``self`` and other before
             applying this method.
             This can be done via :meth:`~Cartesian.align`.
@@ -1290,10 +1609,16 @@ class CartesianCore(PandasWrapper, GenericCore):
             other (Cartesian):
             n_sphere (int): Wrapper around the argument for
                 :meth:`~Cartesian.partition_chem_env`.
+            method (str): Either ``'greedy'`` or ``'assignment'``.
 
         Returns:
             Cartesian: Reindexed version of other
         """
+        if method == 'assignment':
+            return self._reindex_by_assignment(other, n_sphere)
+        elif method != 'greedy':
+            raise ValueError("method has to be 'greedy' or 'assignment'")
+
         def make_subset_similar(m1, subset1, m2, subset2, index_dct):
             """Changes index_dct INPLACE"""
             coords = ['x', 'y', 'z']
@@ -1327,8 +1652,15 @@ class CartesianCore(PandasWrapper, GenericCore):
         molecule1 = self.copy()
         molecule2 = other.copy()
 
-        partition1 = molecule1.partition_chem_env(n_sphere)
-        partition2 = molecule2.partition_chem_env(n_sphere)
+        def partition_chem_env(molecule, labels):
+            partition = collections.defaultdict(set)
+            for key, i in zip(labels.tolist(), molecule.index):
+                partition[key].add(i)
+            return partition
+
+        labels1, labels2 = molecule1._get_chem_env_labels(molecule2, n_sphere)
+        partition1 = partition_chem_env(molecule1, labels1)
+        partition2 = partition_chem_env(molecule2, labels2)
 
         index_dct = {}
         for key in partition1:
@@ -1340,3 +1672,32 @@ class CartesianCore(PandasWrapper, GenericCore):
                                             index_dct)
         molecule2.index = [index_dct[i] for i in molecule2.index]
         return molecule2.loc[molecule1.index]
+
+    def _reindex_by_assignment(self, other, n_sphere):
+        """Reindex ``other`` by an optimal assignment of the atoms
+        in the same chemical environment.
+
+        Look into :meth:`~Cartesian.reindex_similar`.
+        """
+        labels1, labels2 = self._get_chem_env_labels(other, n_sphere)
+        order1 = np.argsort(labels1, kind='stable')
+        order2 = np.argsort(labels2, kind='stable')
+        message = ('You have chemically different molecules, regarding '
+                   'the topology of their connectivity.')
+        assert np.array_equal(labels1[order1], labels2[order2]), message
+        _, starts = np.unique(labels1[order1], return_index=True)
+        pos1, pos2 = self._get_xyz(), other._get_xyz()
+        # The position in self of every atom of other.
+        assigned = np.empty(len(other), dtype='i8')
+        for start, stop in zip(starts, np.append(starts[1:], len(self))):
+            subset1, subset2 = order1[start:stop], order2[start:stop]
+            if stop - start == 1:
+                assigned[subset2] = subset1
+                continue
+            cost = ((pos1[subset1, None, :] - pos2[None, subset2, :])**2
+                    ).sum(axis=2)
+            rows, cols = linear_sum_assignment(cost)
+            assigned[subset2[cols]] = subset1[rows]
+        molecule = other.copy()
+        molecule.index = self.index[assigned]
+        return molecule.iloc[np.argsort(assigned)]
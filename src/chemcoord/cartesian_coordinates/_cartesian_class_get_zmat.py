@@ -9,44 +9,64 @@ from itertools import permutations
 
 import numpy as np
 import pandas as pd
+from scipy.sparse import bsr_matrix
 
 import chemcoord.cartesian_coordinates._cart_transformation as transformation
 import chemcoord.cartesian_coordinates.xyz_functions as xyz_functions
 import chemcoord.constants as constants
 from chemcoord.cartesian_coordinates._cartesian_class_core import CartesianCore
+from chemcoord.cartesian_coordinates._construction_table import \
+    build_construction_table, from_codes, to_codes, to_int_table
+from chemcoord.cartesian_coordinates._neighbor_search import GrowingCellList
 from chemcoord.configuration import settings
 from chemcoord.exceptions import (ERR_CODE_OK, ERR_CODE_InvalidReference,
                                   IllegalArgumentCombination, InvalidReference,
                                   UndefinedCoordinateSystem)
 from chemcoord.internal_coordinates.zmat_class_main import Zmat
 
+# The unchecked construction tables of the last topologies,
+# if ``settings['defaults']['reuse_construction_table']`` is set.
+_construction_tables = OrderedDict()
+_MAX_CACHED_TOPOLOGIES = 16
+
 
 class CartesianGetZmat(CartesianCore):
+    @staticmethod
+    def _get_invalid_references(construction_table):
+        """Return the index of the rows that use references which
+        are not defined in a previous row.
+
+        The first rows are only checked for as many references
+        as there are rows before them.
+        """
+        c_table = construction_table
+        n_rows = len(c_table)
+        # The row in which every reference is defined or -1.
+        definition = c_table.index.get_indexer(
+            c_table.loc[:, ['b', 'a', 'd']].values.ravel()).reshape(n_rows, 3)
+        row = np.arange(n_rows)[:, None]
+        is_valid = (definition != -1) & (definition < row)
+        is_valid |= np.arange(3) >= row
+        return c_table.index[~is_valid.all(axis=1)]
+
     @staticmethod
     def _check_construction_table(construction_table):
         """Checks if a construction table uses valid references.
-        Raises an exception (UndefinedCoordinateSystem) otherwise.
+        Raises an exception (UndefinedCoordinateSystem) otherwise,
+        whose message lists all invalid rows.
         """
-        c_table = construction_table
-        for row, i in enumerate(c_table.index):
-            give_message = ("Not a valid construction table. "
-                            "The index {i} uses an invalid reference").format
-            if row == 0:
-                pass
-            elif row == 1:
-                if c_table.loc[i, 'b'] not in c_table.index[:row]:
-                    raise UndefinedCoordinateSystem(give_message(i=i))
-            elif row == 2:
-                reference = c_table.loc[i, ['b', 'a']]
-                if not reference.isin(c_table.index[:row]).all():
-                    raise UndefinedCoordinateSystem(give_message(i=i))
-            else:
-                reference = c_table.loc[i, ['b', 'a', 'd']]
-                if not reference.isin(c_table.index[:row]).all():
-                    raise UndefinedCoordinateSystem(give_message(i=i))
+        invalid = CartesianGetZmat._get_invalid_references(construction_table)
+        if len(invalid) == 1:
+            raise UndefinedCoordinateSystem(
+                "Not a valid construction table. "
+                "The index {} uses an invalid reference".format(invalid[0]))
+        elif len(invalid) > 1:
+            raise UndefinedCoordinateSystem(
+                "Not a valid construction table. "
+                "The indices {} use invalid references".format(list(invalid)))
 
     def _get_frag_constr_table(self, start_atom=None, predefined_table=None,
-                               use_lookup=None, bond_dict=None):
+                               use_lookup=None):
         """Create a construction table for a Zmatrix.
 
         A construction table is basically a Zmatrix without the values
@@ -74,117 +94,37 @@ class CartesianGetZmat(CartesianCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
-        def modify_priority(bond_dict, user_defined):
-            def move_to_start(dct, key):
-                "Due to PY27 compatibility"
-                keys = dct.keys()
-                if key in keys and key != keys[0]:
-                    root = dct._OrderedDict__root
-                    first = root[1]
-                    link = dct._OrderedDict__map[key]
-                    link_prev, link_next, _ = link
-                    link_prev[1] = link_next
-                    link_next[0] = link_prev
-                    link[0] = root
-                    link[1] = first
-                    root[1] = first[0] = link
-                else:
-                    raise KeyError
-
-            for j in reversed(user_defined):
-                try:
-                    try:
-                        bond_dict.move_to_end(j, last=False)
-                    except AttributeError:
-                        # No move_to_end method in python 2.x
-                        move_to_start(bond_dict, j)
-                except KeyError:
-                    pass
-
         if start_atom is not None and predefined_table is not None:
             raise IllegalArgumentCombination('Either start_atom or '
                                              'predefined_table has to be None')
-        if bond_dict is None:
-            bond_dict = self._give_val_sorted_bond_dict(use_lookup=use_lookup)
-        if predefined_table is not None:
-            self._check_construction_table(predefined_table)
-            construction_table = predefined_table.copy()
-
+        # The bonded atoms are sorted by descending valency.
+        connectivity = self._get_val_sorted_connectivity(
+            use_lookup=use_lookup)
+        index = connectivity.index
         if predefined_table is None:
             if start_atom is None:
                 molecule = self.get_distance_to(self.get_centroid())
-                i = molecule['distance'].idxmin()
-            else:
-                i = start_atom
-            order_of_def = [i]
-            user_defined = []
-            construction_table = {i: {'b': 'origin',
-                                      'a': 'e_z',
-                                      'd': 'e_x'}}
-        else:
-            i = construction_table.index[0]
-            order_of_def = list(construction_table.index)
-            user_defined = list(construction_table.index)
-            construction_table = construction_table.to_dict(orient='index')
-
-        visited = {i}
-        if len(self) > 1:
-            parent = {j: i for j in bond_dict[i]}
-            work_bond_dict = OrderedDict(
-                [(j, bond_dict[j] - visited) for j in bond_dict[i]])
-            modify_priority(work_bond_dict, user_defined)
+                start_atom = molecule['distance'].idxmin()
+            predefined_table = pd.DataFrame(
+                [['origin', 'e_z', 'e_x']], index=[start_atom],
+                columns=['b', 'a', 'd'])
         else:
-            parent, work_bond_dict = {}, {}
-
-        while work_bond_dict:
-            new_work_bond_dict = OrderedDict()
-            for i in work_bond_dict:
-                if i in visited:
-                    continue
-                if i not in user_defined:
-                    b = parent[i]
-                    if b in order_of_def[:3]:
-                        if len(order_of_def) == 1:
-                            construction_table[i] = {'b': b,
-                                                     'a': 'e_z',
-                                                     'd': 'e_x'}
-                        elif len(order_of_def) == 2:
-                            a = (bond_dict[b] & set(order_of_def))[0]
-                            construction_table[i] = {'b': b, 'a': a,
-                                                     'd': 'e_x'}
-                        else:
-                            try:
-                                a = parent[b]
-                            except KeyError:
-                                a = (bond_dict[b] & set(order_of_def))[0]
-                            try:
-                                d = parent[a]
-                                if d in set([b, a]):
-                                    message = "Don't make self references"
-                                    raise UndefinedCoordinateSystem(message)
-                            except (KeyError, UndefinedCoordinateSystem):
-                                try:
-                                    d = ((bond_dict[a] & set(order_of_def))
-                                         - set([b, a]))[0]
-                                except IndexError:
-                                    d = ((bond_dict[b] & set(order_of_def))
-                                         - set([b, a]))[0]
-                            construction_table[i] = {'b': b, 'a': a, 'd': d}
-                    else:
-                        a, d = [construction_table[b][k] for k in ['b', 'a']]
-                        construction_table[i] = {'b': b, 'a': a, 'd': d}
-                    order_of_def.append(i)
-
-                visited.add(i)
-                for j in work_bond_dict[i]:
-                    new_work_bond_dict[j] = bond_dict[j] - visited
-                    parent[j] = i
-
-            work_bond_dict = new_work_bond_dict
-            modify_priority(work_bond_dict, user_defined)
-        output = pd.DataFrame.from_dict(construction_table, orient='index')
-        output = output.loc[order_of_def, ['b', 'a', 'd']]
-        return output
+            self._check_construction_table(predefined_table)
+        codes, foreign = to_codes(np.concatenate(
+            [predefined_table.index.values.astype(object)[:, None],
+             predefined_table.loc[:, ['b', 'a', 'd']].values.astype(object)],
+            axis=1), index)
+        if codes[0, 0] >= len(index):
+            # The search starts from the first atom, which has to be in self.
+            raise KeyError(predefined_table.index[0])
+        order, table = build_construction_table(
+            connectivity.indptr, connectivity.indices,
+            np.ascontiguousarray(codes[:, 0]),
+            np.ascontiguousarray(codes[:, 1:]))
+        output = pd.DataFrame(from_codes(table, index, foreign),
+                              index=from_codes(order, index, foreign).tolist(),
+                              columns=['b', 'a', 'd'])
+        return output.infer_objects()
 
     def get_construction_table(self, fragment_list=None,
                                use_lookup=None,
@@ -240,6 +180,10 @@ class CartesianGetZmat(CartesianCore):
             perform_checks (bool): The checks for invalid references are
                 performed using :meth:`~chemcoord.Cartesian.correct_dihedral`
                 and :meth:`~chemcoord.Cartesian.correct_absolute_refs`.
+                If ``settings['defaults']['reuse_construction_table']`` is set
+                and ``fragment_list`` is ``None``, the unchecked table of a
+                molecule with the same index, elements and bonds is reused
+                and only the checks are performed again.
 
         Returns:
             :class:`pandas.DataFrame`: Construction table
@@ -247,9 +191,33 @@ class CartesianGetZmat(CartesianCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
+        cache_key = ('construction_table', perform_checks)
+        if fragment_list is None and use_lookup:
+            c_table = self._get_cached(cache_key)
+            if (c_table is not None and len(c_table) == len(self)
+                    and c_table.index.isin(self.index).all()):
+                return c_table.copy()
+
+        def perform_checks_and_cache(c_table):
+            if perform_checks:
+                c_table = self.correct_dihedral(c_table)
+                c_table = self.correct_dihedral(c_table, use_lookup=use_lookup)
+                c_table = self.correct_absolute_refs(c_table)
+            if fragment_list is None:
+                self._set_cached(cache_key, c_table.copy())
+            return c_table
+
+        topology = None
+        if (fragment_list is None
+                and settings['defaults']['reuse_construction_table']):
+            topology = self._get_topology(use_lookup=use_lookup)
+            use_lookup = True
+            if topology in _construction_tables:
+                return perform_checks_and_cache(
+                    _construction_tables[topology].copy())
+
         if fragment_list is None:
-            self.get_bonds(use_lookup=use_lookup)
-            self._give_val_sorted_bond_dict(use_lookup=use_lookup)
+            self._get_val_sorted_connectivity(use_lookup=use_lookup)
             fragments = sorted(self.fragmentate(use_lookup=use_lookup),
                                key=len, reverse=True)
             # During function execution the bonding situation does not change,
@@ -287,8 +255,20 @@ class CartesianGetZmat(CartesianCore):
             fragment = fragments[0]
             full_table = fragment._get_frag_constr_table(use_lookup=use_lookup)
 
+        # The atoms that are already placed and their references.
+        placed = list(full_table.index)
+        placed_refs = dict(zip(full_table.index,
+                               zip(full_table['b'].values,
+                                   full_table['a'].values)))
+        tables = [full_table]
+        coords = ['x', 'y', 'z']
+        is_periodic = self._get_cell() is not None
+        if not is_periodic and len(fragments) > 1:
+            labels = self.index.tolist()
+            placed_atoms = GrowingCellList(self._frame.loc[:, coords].values)
+            placed_atoms.insert(self.index.get_indexer(placed))
+
         for fragment in fragments[1:]:
-            finished_part = self.loc[full_table.index]
             if pd.api.types.is_list_like(fragment):
                 fragment, references = fragment
                 if len(references) < min(3, len(fragment)):
@@ -298,27 +278,32 @@ class CartesianGetZmat(CartesianCore):
                 constr_table = fragment._get_frag_constr_table(
                     predefined_table=references, use_lookup=use_lookup)
             else:
-                i, b = fragment.get_shortest_distance(finished_part)[:2]
+                if is_periodic:
+                    i, b = fragment.get_shortest_distance(self.loc[placed])[:2]
+                else:
+                    i, b, _ = placed_atoms.get_nearest(
+                        fragment._frame.loc[:, coords].values)
+                    i, b = fragment.index.tolist()[i], labels[b]
                 constr_table = fragment._get_frag_constr_table(
                     start_atom=i, use_lookup=use_lookup)
-                if len(full_table) == 1:
+                if len(placed) == 1:
                     a, d = 'e_z', 'e_x'
-                elif len(full_table) == 2:
-                    if b == full_table.index[0]:
-                        a = full_table.index[1]
+                elif len(placed) == 2:
+                    if b == placed[0]:
+                        a = placed[1]
                     else:
-                        a = full_table.index[0]
+                        a = placed[0]
                     d = 'e_x'
                 else:
-                    if b in full_table.index[:2]:
-                        if b == full_table.index[0]:
-                            a = full_table.index[2]
-                            d = full_table.index[1]
+                    if b in placed[:2]:
+                        if b == placed[0]:
+                            a = placed[2]
+                            d = placed[1]
                         else:
-                            a = full_table.loc[b, 'b']
-                            d = full_table.index[2]
+                            a = placed_refs[b][0]
+                            d = placed[2]
                     else:
-                        a, d = full_table.loc[b, ['b', 'a']]
+                        a, d = placed_refs[b]
 
                 if len(constr_table) >= 1:
                     constr_table.iloc[0, :] = b, a, d
@@ -327,14 +312,42 @@ class CartesianGetZmat(CartesianCore):
                 if len(constr_table) >= 3:
                     constr_table.iloc[2, 2] = b
 
-            full_table = pd.concat([full_table, constr_table])
+            placed.extend(constr_table.index)
+            placed_refs.update(zip(constr_table.index,
+                                   zip(constr_table['b'].values,
+                                       constr_table['a'].values)))
+            if not is_periodic:
+                placed_atoms.insert(self.index.get_indexer(constr_table.index))
+            tables.append(constr_table)
 
-        c_table = full_table
-        if perform_checks:
-            c_table = self.correct_dihedral(c_table)
-            c_table = self.correct_dihedral(c_table, use_lookup=use_lookup)
-            c_table = self.correct_absolute_refs(c_table)
-        return c_table
+        full_table = pd.concat(tables)
+
+        if topology is not None:
+            if len(_construction_tables) >= _MAX_CACHED_TOPOLOGIES:
+                _construction_tables.popitem(last=False)
+            _construction_tables[topology] = full_table.copy()
+        return perform_checks_and_cache(full_table)
+
+    def _get_reference_angles(self, references):
+        """Return the angles between the reference atoms.
+
+        Args:
+            references (np.array): An array with the columns ``b, a, d``
+                of atom indices.
+
+        Returns:
+            np.array: The angle ``b, a, d`` in degrees for every row.
+        """
+        references = np.asarray(references)
+        positions = self.index.get_indexer(references.ravel().tolist())
+        if (positions == -1).any():
+            missing = references.ravel()[positions == -1]
+            raise KeyError('{} not in index'.format(list(missing)))
+        xyz = self._get_xyz()[positions.reshape(-1, 3)]
+        BI, BA = xyz[:, 0] - xyz[:, 1], xyz[:, 2] - xyz[:, 1]
+        bi, ba = [v / np.linalg.norm(v, axis=1)[:, None] for v in (BI, BA)]
+        dot_product = np.clip(np.sum(bi * ba, axis=1), -1, 1)
+        return np.degrees(np.arccos(dot_product))
 
     def check_dihedral(self, construction_table):
         """Checks, if the dihedral defining atom is colinear.
@@ -349,11 +362,9 @@ class CartesianGetZmat(CartesianCore):
             list: A list of problematic indices.
         """
         c_table = construction_table
-        angles = self.get_angle_degrees(c_table.iloc[3:, :].values)
+        angles = self._get_reference_angles(c_table.iloc[3:, :3].values)
         problem_index = np.nonzero((175 < angles) | (angles < 5))[0]
-        rename = dict(enumerate(c_table.index[3:]))
-        problem_index = [rename[i] for i in problem_index]
-        return problem_index
+        return list(c_table.index[3:][problem_index])
 
     def correct_dihedral(self, construction_table,
                          use_lookup=None):
@@ -361,6 +372,8 @@ class CartesianGetZmat(CartesianCore):
 
         Uses :meth:`~Cartesian.check_dihedral` to obtain the problematic
         indices.
+        The last corrected table is cached, so correcting it again or
+        correcting the same table again is free.
 
         Args:
             construction_table (pd.DataFrame):
@@ -374,50 +387,77 @@ class CartesianGetZmat(CartesianCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
+        if use_lookup:
+            cached = self._get_cached('dihedral_correction')
+            if cached is not None:
+                old_table, c_table, is_correct = cached
+                if (construction_table.equals(old_table)
+                        or is_correct and construction_table.equals(c_table)):
+                    return c_table.copy()
+
         problem_index = self.check_dihedral(construction_table)
-        bond_dict = self._give_val_sorted_bond_dict(use_lookup=use_lookup)
+        # The bonded atoms are sorted by descending valency.
+        bonded = self._get_val_sorted_connectivity(
+            use_lookup=use_lookup).get_bonded
+
+        def get_unvisited(j):
+            return [k for k in bonded(j) if k not in visited]
+
+        def is_nonlinear(candidates):
+            angles = self._get_reference_angles(
+                [[b, a, new_d] for new_d in candidates])
+            return (5 < angles) & (angles < 175)
+
         c_table = construction_table.copy()
         for i in problem_index:
             loc_i = c_table.index.get_loc(i)
             b, a, problem_d = c_table.loc[i, ['b', 'a', 'd']]
+            visited = set(c_table.index[loc_i:]) | {b, a, problem_d}
             try:
-                c_table.loc[i, 'd'] = (bond_dict[a] - {b, a, problem_d}
-                                       - set(c_table.index[loc_i:]))[0]
+                c_table.loc[i, 'd'] = get_unvisited(a)[0]
+                continue
             except IndexError:
-                visited = set(c_table.index[loc_i:]) | {b, a, problem_d}
-                tmp_bond_dict = OrderedDict([(j, bond_dict[j] - visited)
-                                             for j in bond_dict[problem_d]])
-                found = False
-                while tmp_bond_dict and not found:
+                pass
+            # The atoms bonded to problem_d are searched breadth first.
+            # Of the atoms with the same distance the last suitable one
+            # is taken.
+            tmp_bond_dict = OrderedDict([(j, get_unvisited(j))
+                                         for j in bonded(problem_d)])
+            found = False
+            while tmp_bond_dict and not found:
+                candidates = [new_d for new_d in tmp_bond_dict
+                              if new_d not in visited]
+                suitable = np.nonzero(is_nonlinear(candidates))[0]
+                if len(suitable):
+                    found = True
+                    c_table.loc[i, 'd'] = candidates[suitable[-1]]
+                else:
                     new_tmp_bond_dict = OrderedDict()
-                    for new_d in tmp_bond_dict:
-                        if new_d in visited:
-                            continue
-                        angle = self.get_angle_degrees([b, a, new_d])[0]
-                        if 5 < angle < 175:
-                            found = True
-                            c_table.loc[i, 'd'] = new_d
-                        else:
-                            visited.add(new_d)
-                            for j in tmp_bond_dict[new_d]:
-                                new_tmp_bond_dict[j] = bond_dict[j] - visited
+                    for new_d in candidates:
+                        visited.add(new_d)
+                        for j in tmp_bond_dict[new_d]:
+                            new_tmp_bond_dict[j] = get_unvisited(j)
                     tmp_bond_dict = new_tmp_bond_dict
-                if not found:
-                    other_atoms = c_table.index[:loc_i].difference({b, a})
-                    molecule = self.get_distance_to(origin=i, sort=True,
-                                                    other_atoms=other_atoms)
-                    k = 0
-                    while not found and k < len(molecule):
-                        new_d = molecule.index[k]
-                        angle = self.get_angle_degrees([b, a, new_d])[0]
-                        if 5 < angle < 175:
-                            found = True
-                            c_table.loc[i, 'd'] = new_d
-                        k = k + 1
-                    if not found:
-                        message = ('The atom with index {} has no possibility '
-                                   'to get nonlinear reference atoms'.format)
-                        raise UndefinedCoordinateSystem(message(i))
+            if not found:
+                # The nearest suitable atom that is already defined.
+                other_atoms = c_table.index[:loc_i].difference({b, a})
+                distances = self.get_distance_to(
+                    origin=i, other_atoms=other_atoms)['distance'].values
+                other_atoms = other_atoms[np.argsort(distances)]
+                suitable = np.nonzero(is_nonlinear(other_atoms))[0]
+                if len(suitable):
+                    found = True
+                    c_table.loc[i, 'd'] = other_atoms[suitable[0]]
+            if not found:
+                message = ('The atom with index {} has no possibility '
+                           'to get nonlinear reference atoms'.format)
+                raise UndefinedCoordinateSystem(message(i))
+        if use_lookup:
+            is_correct = (not problem_index
+                          or not self.check_dihedral(c_table))
+            self._set_cached('dihedral_correction',
+                             (construction_table.copy(), c_table.copy(),
+                              is_correct))
         return c_table
 
     def _has_valid_abs_ref(self, i, construction_table):
@@ -515,13 +555,11 @@ class CartesianGetZmat(CartesianCore):
                 c_table = pd.DataFrame(
                     data=c_table[:, 1:], index=c_table[:, 0],
                     columns=['b', 'a', 'd'])
-        c_table = c_table.replace(constants.int_label).astype('i8')
         c_table.index = c_table.index.astype('i8')
 
         new_index = c_table.index.append(self.index.difference(c_table.index))
         X = self.loc[new_index, ['x', 'y', 'z']].values.astype('f8').T
-        c_table = c_table.replace(dict(zip(new_index, range(len(self)))))
-        c_table = c_table.values.T
+        c_table = to_int_table(c_table, new_index)
 
         err, C = transformation.get_C(X, c_table)
         if err == ERR_CODE_OK:
@@ -592,6 +630,10 @@ class CartesianGetZmat(CartesianCore):
         ``Zmat_instance.loc[:, ['b', 'a', 'd']]``
         If you then pass the buildlist as argument to ``give_zmat``,
         the algorithm directly starts with step 3 (which is much faster).
+        Alternatively set ``settings['defaults']['reuse_construction_table']``
+        to reuse the construction table of an earlier molecule with the
+        same index, elements and bonds, e.g. of a trajectory.
+        Then only step 2 is repeated for the new coordinates.
 
         If a ``construction_table`` is passed into :meth:`~Cartesian.get_zmat`
         the check for pathological linearity is not performed!
@@ -621,8 +663,7 @@ class CartesianGetZmat(CartesianCore):
         if use_lookup is None:
             use_lookup = settings['defaults']['use_lookup']
 
-        self.get_bonds(use_lookup=use_lookup)
-        self._give_val_sorted_bond_dict(use_lookup=use_lookup)
+        self._get_val_sorted_connectivity(use_lookup=use_lookup)
         use_lookup = True
         # During function execution the connectivity situation won't change
         # So use_look=True will be used
@@ -634,7 +675,8 @@ class CartesianGetZmat(CartesianCore):
             c_table = construction_table
         return self._build_zmat(c_table)
 
-    def get_grad_zmat(self, construction_table, as_function=True):
+    def get_grad_zmat(self, construction_table, as_function=True,
+                      sparse=False):
         r"""Return the gradient for the transformation to a Zmatrix.
 
         If ``as_function`` is True, a function is returned that can be directly
@@ -703,11 +745,19 @@ class CartesianGetZmat(CartesianCore):
             =
             \frac{\partial \mathbf{C}_{i, j}}{\partial \mathbf{X}_{l, k}}
 
+        Every internal coordinate depends on at most four atoms.
+        If ``sparse`` is True, only the nonzero ``(3, 3)`` blocks are
+        calculated and a ``(3 * n, 3 * n)``
+        :class:`scipy.sparse.bsr_matrix` is returned instead of the tensor,
+        whose element ``[3 * j + i, 3 * k + l]`` is the element
+        ``[i, j, k, l]`` of the tensor.
+
         Args:
             construction_table (pandas.DataFrame):
             as_function (bool): Return a tensor or
                 :func:`xyz_functions.apply_grad_zmat_tensor`
                 with partially replaced arguments.
+            sparse (bool): Return a sparse matrix instead of a tensor.
 
         Returns:
             (func, np.array): Depending on ``as_function`` return a tensor or
@@ -717,20 +767,24 @@ class CartesianGetZmat(CartesianCore):
         if (construction_table.index != self.index).any():
             message = "construction_table and self must use the same index"
             raise ValueError(message)
-        c_table = construction_table.loc[:, ['b', 'a', 'd']]
-        c_table = c_table.replace(constants.int_label)
-        c_table = c_table.replace({k: v for v, k in enumerate(c_table.index)})
-        c_table = c_table.values.T
+        c_table = to_int_table(construction_table, self.index)
         X = self.loc[:, ['x', 'y', 'z']].values.T
         if X.dtype == np.dtype('i8'):
             X = X.astype('f8')
 
-        err, row, grad_C = transformation.get_grad_C(X, c_table)
+        if sparse:
+            err, row, data, indices, indptr = \
+                transformation.get_grad_C_blocks(X, c_table)
+        else:
+            err, row, grad_C = transformation.get_grad_C(X, c_table)
         if err == ERR_CODE_InvalidReference:
             rename = dict(enumerate(self.index))
             i = rename[row]
             b, a, d = construction_table.loc[i, ['b', 'a', 'd']]
             raise InvalidReference(i=i, b=b, a=a, d=d)
+        if sparse:
+            grad_C = bsr_matrix((data, indices, indptr),
+                                shape=(3 * len(self), 3 * len(self)))
 
         if as_function:
             return partial(xyz_functions.apply_grad_zmat_tensor,
@@ -9,7 +9,6 @@ import warnings
 from io import open  # pylint:disable=redefined-builtin
 from threading import Thread
 import json
-from collections import defaultdict
 import re
 from functools import partial
 
@@ -18,6 +17,7 @@ import numpy as np
 
 from chemcoord._generic_classes.generic_IO import GenericIO
 from chemcoord.cartesian_coordinates._cartesian_class_core import CartesianCore
+from chemcoord.cartesian_coordinates._connectivity import Connectivity
 from chemcoord.configuration import settings
 from chemcoord import constants
 
@@ -203,12 +203,13 @@ class CartesianIO(CartesianCore, GenericIO):
         coords = self.loc[:, ['x', 'y', 'z']].values.reshape(len(self) * 3)
         cjson_dict['atoms']['coords']['3d'] = [float(x) for x in coords]
 
-        bonds = []
-        bond_dict = self.get_bonds()
-        for i in bond_dict:
-            for b in bond_dict[i]:
-                bonds += [int(i), int(b)]
-                bond_dict[b].remove(i)
+        # cjson refers to atoms by their position
+        connectivity = self._get_connectivity()
+        rows = connectivity.get_rows()
+        first_occurrence = rows <= connectivity.indices
+        bonds = np.stack([rows[first_occurrence],
+                          connectivity.indices[first_occurrence]], axis=1)
+        bonds = [int(i) for i in bonds.flatten()]
 
         cjson_dict['bonds'] = {'connections': {}}
         cjson_dict['bonds']['connections']['index'] = bonds
@@ -255,13 +256,11 @@ class CartesianIO(CartesianCore, GenericIO):
         try:
             connections = data['bonds']['connections']['index']
         except KeyError:
-            pass
+            connections = None
         else:
-            bond_dict = defaultdict(set)
-            for i, b in zip(connections[::2], connections[1::2]):
-                bond_dict[i].add(b)
-                bond_dict[b].add(i)
-            _metadata['bond_dict'] = dict(bond_dict)
+            connections = np.unique(np.sort(
+                np.array(connections, dtype='i8').reshape((-1, 2)), axis=1),
+                axis=0)
 
         try:
             metadata.update(data['properties'])
@@ -270,6 +269,9 @@ class CartesianIO(CartesianCore, GenericIO):
 
         out = cls(atoms=elements, coords=coords, _metadata=_metadata,
                   metadata=metadata)
+        if connections is not None:
+            out._set_connectivity(Connectivity.from_pairs(
+                connections[:, 0], connections[:, 1], out.index))
         return out
 
     def view(self, viewer=None, use_curr_dir=False):
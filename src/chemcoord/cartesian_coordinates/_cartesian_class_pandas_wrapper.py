@@ -25,6 +25,12 @@ class PandasWrapper(object):
         There are two dictionaris as attributes
         called `metadata` and `_metadata`
         which are passed on when doing slices...
+
+    Caching
+        Results derived from the frame can be cached in `_metadata`
+        with :meth:`_set_cached`.
+        Every method that changes the frame inplace calls
+        :meth:`_bump_version`, which invalidates the cache.
     """
     def __len__(self):
         return self.shape[0]
@@ -117,6 +123,7 @@ class PandasWrapper(object):
             self._frame[key[0], key[1]] = value
         else:
             self._frame[key] = value
+        self._bump_version()
 
     @property
     def index(self):
@@ -129,6 +136,7 @@ class PandasWrapper(object):
     @index.setter
     def index(self, value):
         self._frame.index = value
+        self._bump_version()
 
     @property
     def columns(self):
@@ -144,6 +152,7 @@ class PandasWrapper(object):
             raise PhysicalMeaning('There are columns missing for a '
                                   'meaningful description of a molecule')
         self._frame.columns = value
+        self._bump_version()
 
     @property
     def shape(self):
@@ -163,6 +172,7 @@ class PandasWrapper(object):
             self._frame.sort_values(
                 by, axis=axis, ascending=ascending,
                 inplace=inplace, kind=kind, na_position=na_position)
+            self._bump_version()
         else:
             new = self.__class__(self._frame.sort_values(
                 by, axis=axis, ascending=ascending, inplace=inplace,
@@ -183,6 +193,7 @@ class PandasWrapper(object):
                 axis=axis, level=level, ascending=ascending, inplace=inplace,
                 kind=kind, na_position=na_position,
                 sort_remaining=sort_remaining, by=by)
+            self._bump_version()
         else:
             new = self.__class__(self._frame.sort_index(
                 axis=axis, level=level, ascending=ascending,
@@ -202,12 +213,14 @@ class PandasWrapper(object):
             self._frame.replace(to_replace=to_replace, value=value,
                                 inplace=inplace, limit=limit, regex=regex,
                                 method=method, axis=axis)
+            self._bump_version()
         else:
             new = self.__class__(self._frame.replace(
                 to_replace=to_replace, value=value, inplace=inplace,
                 limit=limit, regex=regex, method=method, axis=axis))
             new.metadata = self.metadata.copy()
             new._metadata = copy.deepcopy(self._metadata)
+            new._bump_version()
             return new
 
     def set_index(self, keys, drop=True, append=False,
@@ -234,12 +247,15 @@ class PandasWrapper(object):
             self._frame.set_index(keys, drop=drop, append=append,
                                   inplace=inplace,
                                   verify_integrity=verify_integrity)
+            self._bump_version()
         else:
             new = self._frame.set_index(keys, drop=drop, append=append,
                                         inplace=inplace,
                                         verify_integrity=verify_integrity)
-            return self.__class__(new, _metadata=self._metadata,
-                                  metadata=self.metadata)
+            new = self.__class__(new, _metadata=self._metadata,
+                                 metadata=self.metadata)
+            new._bump_version()
+            return new
 
     def append(self, other, ignore_index=False):
         """Append rows of `other` to the end of this frame, returning a new object.
@@ -285,6 +301,7 @@ class PandasWrapper(object):
         out = self if inplace else self.copy()
         out._frame.insert(loc, column, value,
                           allow_duplicates=allow_duplicates)
+        out._bump_version()
         if not inplace:
             return out
 
@@ -293,15 +310,19 @@ class PandasWrapper(object):
 
         Wrapper around the :meth:`pandas.DataFrame.apply` method.
         """
-        return self.__class__(self._frame.apply(*args, **kwargs),
-                              metadata=self.metadata,
-                              _metadata=self._metadata)
+        new = self.__class__(self._frame.apply(*args, **kwargs),
+                             metadata=self.metadata,
+                             _metadata=self._metadata)
+        new._bump_version()
+        return new
 
     def applymap(self, *args, **kwargs):
         """Applies function elementwise
 
         Wrapper around the :meth:`pandas.DataFrame.applymap` method.
         """
-        return self.__class__(self._frame.applymap(*args, **kwargs),
-                              metadata=self.metadata,
-                              _metadata=self._metadata)
+        new = self.__class__(self._frame.applymap(*args, **kwargs),
+                             metadata=self.metadata,
+                             _metadata=self._metadata)
+        new._bump_version()
+        return new
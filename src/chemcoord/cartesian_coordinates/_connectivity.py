@@ -0,0 +1,581 @@
+# -*- coding: utf-8 -*-
+"""Compact storage of the bonds and graph algorithms working on it.
+
+The bonds are stored in compressed sparse row (CSR) format over the
+positions of the atoms.
+The neighbours of the atom at position ``i`` are
+``indices[indptr[i]:indptr[i + 1]]``.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import numpy as np
+import pandas as pd
+from numba import jit
+
+
+@jit(nopython=True, cache=True)
+def get_coordination_spheres(indptr, indices, sources, max_distance,
+                             excluded, only_surface):
+    """Breadth first search over the bonds starting from several atoms.
+
+    Args:
+        indptr (np.array):
+        indices (np.array):
+        sources (np.array): Positions of the starting atoms.
+        max_distance (int): The search stops after this number of bonds.
+        excluded (np.array): Boolean mask of atoms that are not
+            traversed.
+        only_surface (bool): Return only the atoms that are exactly
+            ``max_distance`` bonds away from the starting atom.
+
+    Returns:
+        tuple: ``(sphere_ptr, spheres, distances)`` where the positions of
+        the atoms in the coordination sphere of ``sources[k]`` are
+        ``spheres[sphere_ptr[k]:sphere_ptr[k + 1]]`` in the order
+        of increasing distance.
+        ``distances`` contains the number of bonds to the starting atom
+        for every entry of ``spheres``.
+        The starting atom is the first atom of its sphere,
+        unless ``only_surface`` is set.
+    """
+    n = indptr.shape[0] - 1
+    distance = np.full(n, -1, dtype=np.int64)
+    queue = np.empty(n, dtype=np.int64)
+    sphere_ptr = np.zeros(sources.shape[0] + 1, dtype=np.int64)
+    spheres = np.empty(sources.shape[0], dtype=np.int64)
+    distances = np.empty(sources.shape[0], dtype=np.int64)
+    size = 0
+    for k in range(sources.shape[0]):
+        distance[sources[k]] = 0
+        queue[0] = sources[k]
+        head, tail = 0, 1
+        while head < tail:
+            i = queue[head]
+            head += 1
+            if distance[i] >= max_distance:
+                continue
+            for m in range(indptr[i], indptr[i + 1]):
+                j = indices[m]
+                if distance[j] == -1 and not excluded[j]:
+                    distance[j] = distance[i] + 1
+                    queue[tail] = j
+                    tail += 1
+        if size + tail > spheres.shape[0]:
+            new = np.empty(max(2 * spheres.shape[0], size + tail),
+                           dtype=np.int64)
+            new[:size] = spheres[:size]
+            spheres = new
+            new = np.empty(spheres.shape[0], dtype=np.int64)
+            new[:size] = distances[:size]
+            distances = new
+        for m in range(tail):
+            i = queue[m]
+            if not only_surface or distance[i] == max_distance:
+                spheres[size] = i
+                distances[size] = distance[i]
+                size += 1
+            # Only the visited atoms are reset for the next search.
+            distance[i] = -1
+        sphere_ptr[k + 1] = size
+    return sphere_ptr, spheres[:size], distances[:size]
+
+
+@jit(nopython=True, cache=True)
+def _find_root(parent, i):
+    while parent[i] != i:
+        # Path halving keeps the trees flat.
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+@jit(nopython=True, cache=True)
+def get_components(indptr, indices):
+    """Find the connected components with a union-find.
+
+    Args:
+        indptr (np.array):
+        indices (np.array):
+
+    Returns:
+        tuple: ``(n_components, component)`` where ``component`` is the
+        number of the component of every atom.
+        The components are numbered in the order of their first atom.
+    """
+    n = indptr.shape[0] - 1
+    parent = np.arange(n)
+    for i in range(n):
+        for k in range(indptr[i], indptr[i + 1]):
+            a, b = _find_root(parent, i), _find_root(parent, indices[k])
+            # The root is always the first atom of a component.
+            if a < b:
+                parent[b] = a
+            elif b < a:
+                parent[a] = b
+    component = np.empty(n, dtype=np.int64)
+    n_components = 0
+    for i in range(n):
+        root = _find_root(parent, i)
+        if root == i:
+            component[i] = n_components
+            n_components += 1
+        else:
+            component[i] = component[root]
+    return n_components, component
+
+
+def sort_by_component(n_components, component):
+    """Sort the atoms by their component.
+
+    Args:
+        n_components (int):
+        component (np.array): As returned by :func:`get_components`.
+
+    Returns:
+        tuple: ``(order, starts)`` where the positions of the atoms of the
+        ``k``-th component are ``order[starts[k]:starts[k + 1]]``
+        in increasing order.
+    """
+    order = np.argsort(component, kind='stable')
+    starts = np.zeros(n_components + 1, dtype='i8')
+    np.cumsum(np.bincount(component, minlength=n_components),
+              out=starts[1:])
+    return order, starts
+
+
+@jit(nopython=True, cache=True)
+def _mix(x):
+    # The finalizer of splitmix64 scatters every bit of an uint64.
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+@jit(nopython=True, cache=True)
+def get_environment_hashes(indptr, indices, codes, n_rounds):
+    """Hash the environment of every atom by Weisfeiler-Lehman refinement.
+
+    In every round the hash of an atom is combined with the sum of the
+    hashes of its bonded atoms.
+    After ``n_rounds`` rounds two atoms have the same hash,
+    if the same elements are found along all paths of up to ``n_rounds``
+    bonds.
+    The hashes do not depend on the order or labels of the atoms
+    and can be compared between molecules.
+
+    Args:
+        indptr (np.array):
+        indices (np.array):
+        codes (np.array): An integer code for the element of every atom.
+        n_rounds (int):
+
+    Returns:
+        np.array: An ``uint64`` hash for every atom.
+    """
+    n = indptr.shape[0] - 1
+    hashes = np.empty(n, dtype=np.uint64)
+    for i in range(n):
+        hashes[i] = _mix(np.uint64(codes[i]) + np.uint64(1))
+    new = np.empty(n, dtype=np.uint64)
+    for _ in range(n_rounds):
+        for i in range(n):
+            neighbours = np.uint64(0)
+            for k in range(indptr[i], indptr[i + 1]):
+                neighbours += _mix(hashes[indices[k]])
+            new[i] = _mix(hashes[i] + _mix(neighbours))
+        hashes, new = new, hashes
+    return hashes
+
+
+@jit(nopython=True, cache=True)
+def _replace_bonds(indptr, indices, is_changed, first, second):
+    """Remove all bonds of the changed atoms and add new bonds.
+
+    Returns:
+        tuple: ``(indptr, indices)`` of the new connectivity.
+    """
+    n = indptr.shape[0] - 1
+    degree = np.zeros(n, dtype=np.int64)
+    for i in range(n):
+        if not is_changed[i]:
+            for k in range(indptr[i], indptr[i + 1]):
+                if not is_changed[indices[k]]:
+                    degree[i] += 1
+    for k in range(first.shape[0]):
+        degree[first[k]] += 1
+        if second[k] != first[k]:
+            degree[second[k]] += 1
+
+    new_indptr = np.zeros(n + 1, dtype=np.int32)
+    for i in range(n):
+        new_indptr[i + 1] = new_indptr[i] + degree[i]
+    new_indices = np.empty(new_indptr[n], dtype=np.int32)
+    fill = new_indptr[:n].copy()
+    for i in range(n):
+        if not is_changed[i]:
+            for k in range(indptr[i], indptr[i + 1]):
+                if not is_changed[indices[k]]:
+                    new_indices[fill[i]] = indices[k]
+                    fill[i] += 1
+    touched = np.zeros(n, dtype=np.bool_)
+    for k in range(first.shape[0]):
+        i, j = first[k], second[k]
+        new_indices[fill[i]] = j
+        fill[i] += 1
+        touched[i] = True
+        if i != j:
+            new_indices[fill[j]] = i
+            fill[j] += 1
+            touched[j] = True
+    for i in range(n):
+        if touched[i]:
+            new_indices[new_indptr[i]:new_indptr[i + 1]] = np.sort(
+                new_indices[new_indptr[i]:new_indptr[i + 1]])
+    return new_indptr, new_indices
+
+
+def _mark_changed(method):
+    """Wrap a method that changes the bonds, so that the bond
+    dictionary is marked as changed."""
+    def changing(self, *args, **kwargs):
+        bond_dict = getattr(self, '_owner', self)
+        if bond_dict is not None:
+            bond_dict._changed = True
+        return method(self, *args, **kwargs)
+    changing.__name__ = method.__name__
+    changing.__doc__ = method.__doc__
+    return changing
+
+
+class _BondSet(set):
+    """The set of atoms bonded to one atom of a :class:`_BondDict`."""
+    def __init__(self, iterable=(), owner=None):
+        set.__init__(self, iterable)
+        self._owner = owner
+
+    def __reduce__(self):
+        return set, (list(self),)
+
+    def __repr__(self):
+        return repr(set(self))
+
+
+for name in ['add', 'discard', 'remove', 'pop', 'clear', 'update',
+             'difference_update', 'intersection_update',
+             'symmetric_difference_update',
+             '__ior__', '__iand__', '__isub__', '__ixor__']:
+    setattr(_BondSet, name, _mark_changed(getattr(set, name)))
+
+
+class _BondDict(dict):
+    """The bond dictionary returned by :meth:`Connectivity.to_dict`.
+
+    It remembers whether it or one of its sets was changed,
+    so the changes can be written back to the connectivity.
+    """
+    def __init__(self, bond_dict=()):
+        dict.__init__(self)
+        self._set_bonds(bond_dict)
+
+    def _set_bonds(self, bond_dict):
+        """Replace the content without marking it as changed."""
+        dict.clear(self)
+        for i, bonded in dict(bond_dict).items():
+            dict.__setitem__(self, i, _BondSet(bonded, self))
+        self._changed = False
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    @_mark_changed
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, _BondSet(value, self))
+
+    @_mark_changed
+    def setdefault(self, key, default=()):
+        if key not in self:
+            dict.__setitem__(self, key, _BondSet(default, self))
+        return dict.__getitem__(self, key)
+
+    @_mark_changed
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            dict.__setitem__(self, key, _BondSet(value, self))
+
+
+for name in ['__delitem__', 'pop', 'popitem', 'clear']:
+    setattr(_BondDict, name, _mark_changed(getattr(dict, name)))
+
+
+class Connectivity(object):
+    """The bonds of a molecule in compressed sparse row format.
+
+    The arrays ``indptr`` and ``indices`` are over atom positions
+    and treated as immutable,
+    ``index`` maps from positions to the labels of the atoms.
+    The dictionary representation returned by
+    :meth:`~chemcoord.Cartesian.get_bonds` is built lazily
+    by :meth:`to_dict` and kept afterwards.
+    """
+    def __init__(self, indptr, indices, index):
+        self.indptr = np.asarray(indptr, dtype='i4')
+        self.indices = np.asarray(indices, dtype='i4')
+        self.indptr.flags.writeable = False
+        self.indices.flags.writeable = False
+        self.index = pd.Index(index)
+        self._lists = None
+        self._components = None
+        self._shells = None
+        self._dict = None
+
+    @classmethod
+    def _from_coo(cls, rows, cols, index):
+        n = len(index)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(n + 1, dtype='i4')
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(indptr, cols[order], index)
+
+    @classmethod
+    def from_pairs(cls, first, second, index):
+        """Create a connectivity from an edge list.
+
+        Args:
+            first (np.array): Positions of the first atoms.
+            second (np.array): Positions of the bonded atoms.
+                Every bond has to appear only once.
+            index (sequence): The labels of the atoms.
+
+        Returns:
+            Connectivity:
+        """
+        first = np.asarray(first, dtype='i8')
+        second = np.asarray(second, dtype='i8')
+        not_self = first != second
+        rows = np.concatenate([first, second[not_self]])
+        cols = np.concatenate([second, first[not_self]])
+        return cls._from_coo(rows, cols, index)
+
+    @classmethod
+    def from_dict(cls, bond_dict, index):
+        """Create a connectivity from a bond dictionary.
+
+        Args:
+            bond_dict (dict): A dictionary as returned by
+                :meth:`~chemcoord.Cartesian.get_bonds`.
+            index (sequence): The labels of the atoms.
+
+        Returns:
+            Connectivity:
+        """
+        index = pd.Index(index)
+        keys = [i for i in bond_dict for _ in bond_dict[i]]
+        values = [j for i in bond_dict for j in bond_dict[i]]
+        rows = index.get_indexer(keys).astype('i8')
+        cols = index.get_indexer(values).astype('i8')
+        keep = (rows != -1) & (cols != -1)
+        rows, cols = rows[keep], cols[keep]
+        # A bond_dict is not guaranteed to be symmetric.
+        pairs = np.unique(np.concatenate([np.stack([rows, cols]),
+                                          np.stack([cols, rows])], axis=1),
+                          axis=1)
+        return cls._from_coo(pairs[0], pairs[1], index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __deepcopy__(self, memo):
+        # The arrays and the index are immutable and can be shared.
+        if self.has_changed_dict():
+            return self.from_dict(self._dict, self.index)
+        return self.__class__(self.indptr, self.indices, self.index)
+
+    def get_rows(self):
+        """Return the position of the first atom for every entry
+        of :attr:`indices`."""
+        return np.repeat(np.arange(len(self), dtype='i4'),
+                         np.diff(self.indptr))
+
+    def get_positions(self, labels):
+        """Return the positions of the labels that are present."""
+        positions = self.index.get_indexer(list(labels))
+        return positions[positions != -1]
+
+    def get_bonded(self, label):
+        """Return the labels of the atoms bonded to ``label``.
+
+        The labels are in the order of :attr:`indices`.
+        """
+        if self._lists is None:
+            labels = self.index.tolist()
+            self._lists = (self.indptr.tolist(), self.indices.tolist(),
+                           labels, dict(zip(labels, range(len(labels)))))
+        indptr, indices, labels, position = self._lists
+        i = position[label]
+        return [labels[j] for j in indices[indptr[i]:indptr[i + 1]]]
+
+    def get_components(self):
+        """Return the connected components.
+
+        The components are computed only once and cached afterwards.
+
+        Returns:
+            tuple: ``(n_components, component)`` as returned by
+            :func:`get_components`.
+        """
+        if self._components is None:
+            self._components = get_components(self.indptr, self.indices)
+        return self._components
+
+    def get_shells(self, max_distance):
+        """Return the atoms up to ``max_distance`` bonds away from
+        every atom.
+
+        The shells of all atoms are searched at once and cached.
+        They are searched again only for a larger ``max_distance``.
+
+        Args:
+            max_distance (int):
+
+        Returns:
+            tuple: ``(shell_ptr, spheres)`` where the positions of the atoms
+            exactly ``d`` bonds away from the atom at position ``i`` are
+            ``spheres[shell_ptr[i, d]:shell_ptr[i, d + 1]]``
+            for ``d <= max_distance``.
+        """
+        if self._shells is None or self._shells[0].shape[1] < max_distance + 2:
+            n = len(self)
+            sphere_ptr, spheres, distances = get_coordination_spheres(
+                self.indptr, self.indices, np.arange(n), max_distance,
+                np.zeros(n, dtype=bool), False)
+            centre = np.repeat(np.arange(n), np.diff(sphere_ptr))
+            shell_ptr = np.empty((n, max_distance + 2), dtype='i8')
+            shell_ptr[:, 0] = sphere_ptr[:-1]
+            shell_ptr[:, 1:] = sphere_ptr[:-1, None] + np.cumsum(np.bincount(
+                centre * (max_distance + 1) + distances,
+                minlength=n * (max_distance + 1)).reshape(n, -1), axis=1)
+            spheres.flags.writeable = False
+            self._shells = shell_ptr, spheres
+        return self._shells
+
+    def sort_bonded(self, priority):
+        """Return a connectivity with the bonded atoms of every atom
+        sorted by descending ``priority``.
+
+        Atoms with the same priority are sorted by position.
+
+        Args:
+            priority (np.array): One value for every atom.
+
+        Returns:
+            Connectivity:
+        """
+        priority = np.asarray(priority)
+        order = np.lexsort((self.indices, -priority[self.indices],
+                            self.get_rows()))
+        return self.__class__(self.indptr, self.indices[order], self.index)
+
+    def replace_bonds(self, changed, first, second):
+        """Return a new connectivity with changed bonds.
+
+        Args:
+            changed (np.array): Positions of the atoms whose bonds
+                are removed.
+            first (np.array): Positions of the first atoms of the
+                new bonds.
+            second (np.array): Positions of the bonded atoms.
+
+        Returns:
+            Connectivity:
+        """
+        is_changed = np.zeros(len(self), dtype=bool)
+        is_changed[changed] = True
+        indptr, indices = _replace_bonds(
+            self.indptr, self.indices, is_changed,
+            np.asarray(first, dtype='i8'), np.asarray(second, dtype='i8'))
+        return self.__class__(indptr, indices, self.index)
+
+    def restrict(self, labels):
+        """Restrict the connectivity to the atoms in ``labels``.
+
+        The positions of the new connectivity follow the order of
+        ``labels``.
+        """
+        labels = pd.Index(labels)
+        new_position = np.full(len(self), -1, dtype='i8')
+        new_position[self.index.get_indexer(labels)] = np.arange(len(labels))
+        rows = new_position[self.get_rows()]
+        cols = new_position[self.indices]
+        keep = (rows != -1) & (cols != -1)
+        return self._from_coo(rows[keep], cols[keep], labels)
+
+    def split(self):
+        """Split the connectivity into its connected components.
+
+        Yields:
+            Connectivity: A connectivity for every component.
+            The atoms keep their relative order.
+        """
+        n_components, component = self.get_components()
+        order, starts = sort_by_component(n_components, component)
+        new_position = np.empty(len(self), dtype='i8')
+        new_position[order] = (np.arange(len(self))
+                               - np.repeat(starts[:-1], np.diff(starts)))
+        # The bonds are sorted by the component of their first atom.
+        rank = np.empty(len(self), dtype='i8')
+        rank[order] = np.arange(len(self))
+        bond_order = np.argsort(rank[self.get_rows()], kind='stable')
+        indices = new_position[self.indices[bond_order]]
+        indptr = np.zeros(len(self) + 1, dtype='i8')
+        np.cumsum(np.diff(self.indptr)[order], out=indptr[1:])
+        labels = self.index.values[order]
+        for start, stop in zip(starts[:-1], starts[1:]):
+            yield self.__class__(indptr[start:stop + 1] - indptr[start],
+                                 indices[indptr[start]:indptr[stop]],
+                                 labels[start:stop])
+
+    def _build_dict(self):
+        labels = self.index.values
+        neighbours = np.split(labels[self.indices], self.indptr[1:-1])
+        return {i: set(bonded.tolist())
+                for i, bonded in zip(self.index, neighbours)}
+
+    def to_dict(self):
+        """Return the bonds as dictionary.
+
+        The dictionary is built only once and the same dictionary is
+        returned afterwards.
+        Changes to it are not applied to the connectivity itself,
+        but :meth:`has_changed_dict` tells about them and
+        :meth:`apply_dict_changes` returns the changed connectivity.
+
+        Returns:
+            dict: Dictionary mapping from an atom index to the set of
+            indices of atoms bonded to.
+        """
+        if self._dict is None:
+            self._dict = _BondDict(self._build_dict())
+        return self._dict
+
+    def has_changed_dict(self):
+        """Return if the dictionary of :meth:`to_dict` was changed."""
+        return self._dict is not None and self._dict._changed
+
+    def apply_dict_changes(self):
+        """Return the connectivity with the changes of the dictionary
+        returned by :meth:`to_dict`.
+
+        A bond given only for one of its atoms is added to both.
+        The dictionary is updated accordingly and
+        belongs to the new connectivity afterwards.
+
+        Returns:
+            Connectivity:
+        """
+        if not self.has_changed_dict():
+            return self
+        new = self.from_dict(self._dict, self.index)
+        new._dict, self._dict = self._dict, None
+        new._dict._set_bonds(new._build_dict())
+        return new
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""Construction tables over atom positions.
+
+A construction table is stored as ``(n, 3)`` integer array of the
+references ``b``, ``a`` and ``d`` together with the array of the defined
+atoms in the order of their definition.
+Atoms of the molecule are represented by their position,
+the absolute references by the values of :attr:`constants.int_label`
+and other atoms, that are only referenced by a predefined table,
+by codes from ``n_atoms`` onwards.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import numpy as np
+import pandas as pd
+from numba import jit
+
+import chemcoord.constants as constants
+
+_E_X = constants.int_label['e_x']
+_E_Z = constants.int_label['e_z']
+
+
+def to_codes(values, index):
+    """Encode the labels or absolute references in ``values``.
+
+    Args:
+        values (np.array): An array of labels and absolute references.
+        index (pd.Index): The labels of the atoms.
+
+    Returns:
+        tuple: ``(codes, foreign)`` where ``foreign`` is the list of
+        labels that are not in ``index``.
+    """
+    if not (isinstance(values, np.ndarray) and values.dtype.kind in 'iu'):
+        values = np.asarray(values, dtype=object)
+    if values.dtype != object:
+        # Only strings can be absolute references.
+        codes = index.get_indexer(values.ravel()).reshape(values.shape)
+        is_abs = np.zeros(values.shape, dtype=bool)
+    else:
+        abs_refs = pd.Index(list(constants.int_label))
+        abs_codes = np.array(list(constants.int_label.values()))
+        codes = abs_refs.get_indexer(values.ravel()).reshape(values.shape)
+        is_abs = codes != -1
+        codes[is_abs] = abs_codes[codes[is_abs]]
+        codes[~is_abs] = index.get_indexer(values[~is_abs])
+    is_foreign = ~is_abs & (codes == -1)
+    if is_foreign.any():
+        foreign = list(pd.unique(values[is_foreign]))
+        codes[is_foreign] = len(index) + pd.Index(foreign).get_indexer(
+            values[is_foreign])
+    else:
+        foreign = []
+    return codes.astype('i8'), foreign
+
+
+def to_int_table(construction_table, index):
+    """Return the references of a construction table as positions.
+
+    Args:
+        construction_table (pd.DataFrame):
+        index (pd.Index): The labels of the atoms.
+
+    Returns:
+        np.array: ``(3, n)`` integer array as used by the
+        transformation kernels with the absolute references
+        given by :attr:`constants.int_label`.
+    """
+    codes, foreign = to_codes(
+        construction_table.loc[:, ['b', 'a', 'd']].values, index)
+    if foreign:
+        raise KeyError('The references {} are not in the '
+                       'index'.format(foreign))
+    return np.ascontiguousarray(codes.T)
+
+
+def from_codes(codes, index, foreign=()):
+    """Decode the output of :func:`to_codes`.
+
+    Args:
+        codes (np.array):
+        index (pd.Index): The labels of the atoms.
+        foreign (list): The labels that are not in ``index``.
+
+    Returns:
+        np.array: An array of dtype object.
+    """
+    labels = np.empty(len(index) + len(foreign), dtype=object)
+    labels[:len(index)] = index.values.astype(object)
+    labels[len(index):] = foreign
+    values = np.empty(codes.shape, dtype=object)
+    is_abs = codes <= constants.keys_below_are_abs_refs
+    values[~is_abs] = labels[codes[~is_abs]]
+    for code, key in constants.string_repr.items():
+        values[codes == code] = key
+    return values
+
+
+@jit(nopython=True, cache=True)
+def _first_defined(indptr, indices, rank, j, b, a):
+    # The first atom bonded to j that is defined and neither b nor a.
+    for m in range(indptr[j], indptr[j + 1]):
+        k = indices[m]
+        if rank[k] != -1 and k != b and k != a:
+            return k
+    return -1
+
+
+@jit(nopython=True, cache=True)
+def _get_references(indptr, indices, rank, parent, n_defined, b):
+    if n_defined == 1:
+        return _E_Z, _E_X
+    elif n_defined == 2:
+        a = _first_defined(indptr, indices, rank, b, -1, -1)
+        if a == -1:
+            raise IndexError('No defined atom is bonded to b.')
+        return a, _E_X
+    a = parent[b]
+    if a == -1:
+        a = _first_defined(indptr, indices, rank, b, -1, -1)
+        if a == -1:
+            raise IndexError('No defined atom is bonded to b.')
+    d = parent[a]
+    if d == -1 or d == b or d == a:
+        d = _first_defined(indptr, indices, rank, a, b, a)
+        if d == -1:
+            d = _first_defined(indptr, indices, rank, b, b, a)
+            if d == -1:
+                raise IndexError('No defined atom is bonded to a or b.')
+    return a, d
+
+
+@jit(nopython=True, cache=True)
+def build_construction_table(indptr, indices, predefined_order,
+                             predefined_table):
+    """Complete a construction table along the bonds.
+
+    Starting from ``predefined_order[0]`` the molecule is traversed
+    breadth first. The bonded atoms of an atom are visited in the order of
+    ``indices``, but atoms of the predefined table are taken first.
+    Every new atom uses the atom it was reached from as bond reference,
+    the atom this one was reached from as angle reference and so on.
+
+    Args:
+        indptr (np.array):
+        indices (np.array): The bonded atoms sorted by descending priority.
+        predefined_order (np.array): The codes of the atoms that are
+            already defined. The first one is the starting atom.
+        predefined_table (np.array): Their ``(b, a, d)`` references.
+
+    Returns:
+        tuple: ``(order, table)`` with the codes of the defined atoms and
+        their references.
+    """
+    n = indptr.shape[0] - 1
+    n_predefined = predefined_order.shape[0]
+    order = np.empty(n + n_predefined, dtype=np.int64)
+    table = np.empty((n + n_predefined, 3), dtype=np.int64)
+    # The position in order of the defined atoms.
+    rank = np.full(n, -1, dtype=np.int64)
+    is_predefined = np.zeros(n, dtype=np.bool_)
+    for k in range(n_predefined):
+        order[k] = predefined_order[k]
+        table[k] = predefined_table[k]
+        if predefined_order[k] < n:
+            rank[predefined_order[k]] = k
+            is_predefined[predefined_order[k]] = True
+    n_defined = n_predefined
+
+    visited = np.zeros(n, dtype=np.bool_)
+    parent = np.full(n, -1, dtype=np.int64)
+    start = predefined_order[0]
+    visited[start] = True
+
+    # Every atom of the current generation has a list of bonded atoms,
+    # which were not visited when the atom was reached.
+    work_keys = np.empty(n, dtype=np.int64)
+    work_ptr = np.empty((n, 2), dtype=np.int64)
+    work_buffer = np.empty(indices.shape[0] + 1, dtype=np.int64)
+    new_keys = np.empty(n, dtype=np.int64)
+    new_ptr = np.empty((n, 2), dtype=np.int64)
+    new_buffer = np.empty(indices.shape[0] + 1, dtype=np.int64)
+    slot = np.full(n, -1, dtype=np.int64)
+
+    n_work, size = 0, 0
+    if n > 1:
+        for m in range(indptr[start], indptr[start + 1]):
+            j = indices[m]
+            parent[j] = start
+            work_keys[n_work] = j
+            work_ptr[n_work, 0] = size
+            for q in range(indptr[j], indptr[j + 1]):
+                if not visited[indices[q]]:
+                    work_buffer[size] = indices[q]
+                    size += 1
+            work_ptr[n_work, 1] = size
+            n_work += 1
+    _move_predefined_to_start(work_keys, work_ptr, n_work, is_predefined,
+                              rank)
+
+    while n_work > 0:
+        n_new, size = 0, 0
+        for w in range(n_work):
+            i = work_keys[w]
+            if visited[i]:
+                continue
+            if not is_predefined[i]:
+                b = parent[i]
+                if rank[b] < 3:
+                    a, d = _get_references(indptr, indices, rank, parent,
+                                           n_defined, b)
+                else:
+                    a, d = table[rank[b], 0], table[rank[b], 1]
+                order[n_defined] = i
+                table[n_defined, 0] = b
+                table[n_defined, 1] = a
+                table[n_defined, 2] = d
+                rank[i] = n_defined
+                n_defined += 1
+            visited[i] = True
+            for m in range(work_ptr[w, 0], work_ptr[w, 1]):
+                j = work_buffer[m]
+                if size + indptr[j + 1] - indptr[j] > new_buffer.shape[0]:
+                    new = np.empty(2 * new_buffer.shape[0]
+                                   + indptr[j + 1] - indptr[j],
+                                   dtype=np.int64)
+                    new[:size] = new_buffer[:size]
+                    new_buffer = new
+                if slot[j] == -1:
+                    slot[j] = n_new
+                    new_keys[n_new] = j
+                    n_new += 1
+                # A key that is reached again keeps its place
+                # but gets the new list of bonded atoms.
+                new_ptr[slot[j], 0] = size
+                for q in range(indptr[j], indptr[j + 1]):
+                    if not visited[indices[q]]:
+                        new_buffer[size] = indices[q]
+                        size += 1
+                new_ptr[slot[j], 1] = size
+                parent[j] = i
+        for w in range(n_new):
+            slot[new_keys[w]] = -1
+        _move_predefined_to_start(new_keys, new_ptr, n_new, is_predefined,
+                                  rank)
+        work_keys, new_keys = new_keys, work_keys
+        work_ptr, new_ptr = new_ptr, work_ptr
+        work_buffer, new_buffer = new_buffer, work_buffer
+        n_work = n_new
+    return order[:n_defined], table[:n_defined]
+
+
+@jit(nopython=True, cache=True)
+def _move_predefined_to_start(keys, ptr, n_keys, is_predefined, rank):
+    # Predefined atoms are moved to the start in the order of their
+    # definition, the other atoms keep their order.
+    n_first = 0
+    for w in range(n_keys):
+        if is_predefined[keys[w]]:
+            n_first += 1
+    if n_first == 0:
+        return
+    first = np.empty(n_first, dtype=np.int64)
+    k = 0
+    for w in range(n_keys):
+        if is_predefined[keys[w]]:
+            first[k] = w
+            k += 1
+    first = first[np.argsort(rank[keys[first]], kind='mergesort')]
+    new_order = np.empty(n_keys, dtype=np.int64)
+    new_order[:n_first] = first
+    k = n_first
+    for w in range(n_keys):
+        if not is_predefined[keys[w]]:
+            new_order[k] = w
+            k += 1
+    keys[:n_keys] = keys[new_order]
+    ptr[:n_keys] = ptr[new_order]
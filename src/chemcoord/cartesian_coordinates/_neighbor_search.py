@@ -0,0 +1,733 @@
+# -*- coding: utf-8 -*-
+"""Linked-cell neighbor search used for the detection of bonds.
+
+The atoms are given as integer codes together with a table of the
+maximal bond lengths between two codes and the changes of the bond
+lengths of atoms with a modified radius, as returned by
+:func:`~chemcoord.cartesian_coordinates._bond_lengths.get_bond_lengths`.
+The atoms are sorted into cubic cells with an edge length of the largest
+possible bond length.
+Only atom pairs within the same or directly adjacent cells are tested,
+which makes the cost linear in the number of atoms instead of quadratic.
+Only occupied cells are stored, so sparse systems do not allocate
+an empty grid.
+
+Periodic systems are described by a cell matrix whose rows are the
+lattice vectors.
+Their bonds are found by adding the periodic images of the atoms
+close to the faces of the unit cell.
+"""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import copy
+from itertools import product
+
+import numba
+import numpy as np
+from numba import jit, prange
+
+
+@jit(nopython=True, cache=True)
+def get_cell_keys(pos, cell_size):
+    """Assign every atom to a cubic cell.
+
+    Returns:
+        tuple: ``(lower, cell_idx, dims, keys)`` where ``lower`` is the
+        lower corner of the grid, ``cell_idx`` is the
+        ``(n, 3)`` array of integer cell coordinates, ``dims`` the number
+        of cells along each axis and ``keys`` the linearized cell index
+        for each atom.
+    """
+    n = pos.shape[0]
+    lower = np.zeros(3)
+    cell_idx = np.zeros((n, 3), dtype=np.int64)
+    dims = np.ones(3, dtype=np.int64)
+    keys = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return lower, cell_idx, dims, keys
+    for h in range(3):
+        lower[h] = pos[0, h]
+        for i in range(1, n):
+            if pos[i, h] < lower[h]:
+                lower[h] = pos[i, h]
+        for i in range(n):
+            cell_idx[i, h] = np.int64((pos[i, h] - lower[h]) / cell_size)
+            if cell_idx[i, h] + 1 > dims[h]:
+                dims[h] = cell_idx[i, h] + 1
+    for i in range(n):
+        keys[i] = ((cell_idx[i, 0] * dims[1] + cell_idx[i, 1]) * dims[2]
+                   + cell_idx[i, 2])
+    return lower, cell_idx, dims, keys
+
+
+@jit(nopython=True, cache=True)
+def get_cell_list(keys):
+    """Sort atoms by their cell.
+
+    Returns:
+        tuple: ``(order, occupied, cell_start)``.
+        The atoms in the ``k``-th occupied cell with the key ``occupied[k]``
+        are ``order[cell_start[k]:cell_start[k + 1]]``.
+    """
+    n = keys.shape[0]
+    order = np.argsort(keys, kind='mergesort')
+    n_occupied = 0
+    for k in range(n):
+        if k == 0 or keys[order[k]] != keys[order[k - 1]]:
+            n_occupied += 1
+    occupied = np.empty(n_occupied, dtype=np.int64)
+    cell_start = np.empty(n_occupied + 1, dtype=np.int64)
+    c = 0
+    for k in range(n):
+        if k == 0 or keys[order[k]] != keys[order[k - 1]]:
+            occupied[c] = keys[order[k]]
+            cell_start[c] = k
+            c += 1
+    cell_start[n_occupied] = n
+    return order, occupied, cell_start
+
+
+def _get_cutoff(codes, bond_lengths, deltas=()):
+    """Return the largest possible bond length between the atoms."""
+    present = np.bincount(codes).nonzero()[0]
+    lengths = bond_lengths[np.ix_(present, present)]
+    if np.isnan(lengths).all():
+        return 0.
+    if len(deltas):
+        return np.nanmax(lengths) + 2 * max(np.max(deltas), 0.)
+    return np.nanmax(lengths)
+
+
+@jit(nopython=True, cache=True)
+def _get_squared_cutoff(i, j, codes, cutoffs, deltas):
+    """Return the squared maximal bond length between the atoms
+    ``i`` and ``j``.
+
+    The bond length is only changed, if one of the atoms
+    has a modified radius.
+    """
+    cutoff = cutoffs[codes[i], codes[j]]
+    if deltas.shape[0] and (deltas[i] != 0. or deltas[j] != 0.):
+        length = np.sqrt(cutoff) + deltas[i] + deltas[j]
+        if length < 0.:
+            return -1.
+        cutoff = length**2
+    return cutoff
+
+
+@jit(nopython=True, cache=True)
+def _grow(array, size):
+    new = np.empty(2 * array.shape[0] + 1, dtype=array.dtype)
+    new[:size] = array[:size]
+    return new
+
+
+@jit(nopython=True, cache=True)
+def _find_cell(key, occupied):
+    """Return the number of the occupied cell with ``key`` or -1."""
+    c = np.searchsorted(occupied, key)
+    if c == occupied.shape[0] or occupied[c] != key:
+        return -1
+    return c
+
+
+@jit(nopython=True, cache=True)
+def _visit_cell(c, pos, codes, cutoffs, deltas, cell_idx, dims, order,
+                occupied, cell_start, first, second, offset, only_count):
+    """Find the bonds between the atoms of the ``c``-th occupied cell
+    and the atoms of itself and its neighbouring cells.
+
+    Every pair of cells is visited only once.
+    If ``only_count`` is ``False`` the bonds are written to
+    ``first`` and ``second`` starting at ``offset``.
+
+    Returns:
+        int: The number of bonds.
+    """
+    n_pairs = 0
+    i_cell = order[cell_start[c]]
+    cx, cy, cz = cell_idx[i_cell, 0], cell_idx[i_cell, 1], cell_idx[i_cell, 2]
+    for dx in range(-1, 2):
+        for dy in range(-1, 2):
+            for dz in range(-1, 2):
+                nx, ny, nz = cx + dx, cy + dy, cz + dz
+                if (nx < 0 or ny < 0 or nz < 0 or nx >= dims[0]
+                        or ny >= dims[1] or nz >= dims[2]):
+                    continue
+                key = (nx * dims[1] + ny) * dims[2] + nz
+                if key < occupied[c]:
+                    continue
+                other = _find_cell(key, occupied)
+                if other == -1:
+                    continue
+                for k in range(cell_start[c], cell_start[c + 1]):
+                    i = order[k]
+                    if other == c:
+                        start = k + 1
+                    else:
+                        start = cell_start[other]
+                    for m in range(start, cell_start[other + 1]):
+                        j = order[m]
+                        D = 0.
+                        for h in range(3):
+                            D += (pos[i, h] - pos[j, h])**2
+                        if (_get_squared_cutoff(i, j, codes, cutoffs, deltas)
+                                - D >= 0):
+                            if not only_count:
+                                first[offset + n_pairs] = min(i, j)
+                                second[offset + n_pairs] = max(i, j)
+                            n_pairs += 1
+    return n_pairs
+
+
+def _get_bond_pairs(pos, codes, cutoffs, deltas, cell_idx, dims, order,
+                    occupied, cell_start, self_bonding_allowed):
+    """Return all bonded pairs as edge list.
+
+    Two atoms ``i`` and ``j`` are bonded if their squared distance is
+    smaller or equal to ``cutoffs[codes[i], codes[j]]``,
+    which is changed by ``deltas`` for atoms with a modified radius.
+    The bonds of every cell are counted first, so that afterwards
+    every cell can write its bonds at a precomputed offset
+    without synchronisation.
+    """
+    n = pos.shape[0]
+    n_cells = occupied.shape[0]
+
+    dummy = np.empty(0, dtype=np.int64)
+    offsets = np.zeros(n_cells + 1, dtype=np.int64)
+    for c in prange(n_cells):
+        offsets[c + 1] = _visit_cell(
+            c, pos, codes, cutoffs, deltas, cell_idx, dims, order, occupied,
+            cell_start, dummy, dummy, 0, True)
+    if self_bonding_allowed:
+        offsets[0] = n
+    for c in range(n_cells):
+        offsets[c + 1] += offsets[c]
+
+    first = np.empty(offsets[n_cells], dtype=np.int64)
+    second = np.empty(offsets[n_cells], dtype=np.int64)
+    if self_bonding_allowed:
+        for i in range(n):
+            first[i], second[i] = i, i
+    for c in prange(n_cells):
+        _visit_cell(c, pos, codes, cutoffs, deltas, cell_idx, dims, order,
+                    occupied, cell_start, first, second, offsets[c], False)
+    return first, second
+
+
+_get_bond_pairs_serial = jit(nopython=True, cache=True)(_get_bond_pairs)
+_get_bond_pairs_parallel = jit(nopython=True, cache=True, nogil=True,
+                               parallel=True)(_get_bond_pairs)
+
+
+@jit(nopython=True, cache=True)
+def _get_bond_pairs_of(changed, moved, pos, codes, cutoffs, deltas, lower,
+                       cell_size, dims, order, occupied, cell_start,
+                       self_bonding_allowed):
+    """Return the bonds of the atoms at the positions ``changed``.
+
+    Atoms that are not ``moved`` are searched in the cell list,
+    which is still valid for them.
+    The moved atoms are tested directly.
+    """
+    is_changed = np.zeros(pos.shape[0], dtype=np.bool_)
+    for i in changed:
+        is_changed[i] = True
+    moved_atoms = np.nonzero(moved)[0]
+    first = np.empty(8 * changed.shape[0] + 1, dtype=np.int64)
+    second = np.empty(8 * changed.shape[0] + 1, dtype=np.int64)
+    n_pairs = 0
+    cell = np.empty(3, dtype=np.int64)
+    for i in changed:
+        for h in range(3):
+            cell[h] = np.int64(np.floor((pos[i, h] - lower[h]) / cell_size))
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                for dz in range(-1, 2):
+                    nx, ny, nz = cell[0] + dx, cell[1] + dy, cell[2] + dz
+                    if (nx < 0 or ny < 0 or nz < 0 or nx >= dims[0]
+                            or ny >= dims[1] or nz >= dims[2]):
+                        continue
+                    c = _find_cell((nx * dims[1] + ny) * dims[2] + nz,
+                                   occupied)
+                    if c == -1:
+                        continue
+                    for m in range(cell_start[c], cell_start[c + 1]):
+                        j = order[m]
+                        # The moved atoms are tested below.
+                        if moved[j] or (j == i and not self_bonding_allowed):
+                            continue
+                        if is_changed[j] and j < i:
+                            continue
+                        D = 0.
+                        for h in range(3):
+                            D += (pos[i, h] - pos[j, h])**2
+                        if (_get_squared_cutoff(i, j, codes, cutoffs, deltas)
+                                - D >= 0):
+                            if n_pairs == first.shape[0]:
+                                first = _grow(first, n_pairs)
+                                second = _grow(second, n_pairs)
+                            first[n_pairs] = min(i, j)
+                            second[n_pairs] = max(i, j)
+                            n_pairs += 1
+        for j in moved_atoms:
+            if j == i and not self_bonding_allowed:
+                continue
+            # Bonds between two changed atoms are found only once.
+            if is_changed[j] and j < i:
+                continue
+            D = 0.
+            for h in range(3):
+                D += (pos[i, h] - pos[j, h])**2
+            if _get_squared_cutoff(i, j, codes, cutoffs, deltas) - D >= 0:
+                if n_pairs == first.shape[0]:
+                    first = _grow(first, n_pairs)
+                    second = _grow(second, n_pairs)
+                first[n_pairs] = min(i, j)
+                second[n_pairs] = max(i, j)
+                n_pairs += 1
+    return first[:n_pairs], second[:n_pairs]
+
+
+#: Below this number of atoms starting the threads costs more than it saves.
+PARALLEL_THRESHOLD = 10000
+
+
+class CellList(object):
+    """Atoms sorted into the cells of a grid.
+
+    The cell list remembers the positions it was built for.
+    Afterwards the bonds of a few displaced atoms can be found with
+    :meth:`get_bond_pairs_of` without sorting all atoms again.
+
+    Args:
+        pos (np.array): ``(n, 3)`` array of positions.
+        codes (np.array): ``(n,)`` integer array of the atom codes.
+        bond_lengths (np.array): Table of the maximal bond lengths
+            between two codes.
+        self_bonding_allowed (bool):
+        deltas (np.array): The changes of the bond lengths of every atom
+            with a modified radius or an empty array.
+    """
+    def __init__(self, pos, codes, bond_lengths, self_bonding_allowed=False,
+                 deltas=None):
+        self.pos = np.array(pos, dtype='f8')
+        self.codes = np.asarray(codes)
+        self.bond_lengths = np.asarray(bond_lengths, dtype='f8')
+        self.cutoffs = self.bond_lengths**2
+        self.deltas = np.zeros(0) if deltas is None else np.asarray(
+            deltas, dtype='f8')
+        self.self_bonding_allowed = self_bonding_allowed
+        self.cell_size = _get_cutoff(self.codes, bond_lengths,
+                                     self.deltas) or 1.
+        self.lower, self.cell_idx, self.dims, keys = get_cell_keys(
+            self.pos, self.cell_size)
+        self.order, self.occupied, self.cell_start = get_cell_list(keys)
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __deepcopy__(self, memo):
+        # A cell list is never changed after construction.
+        return self
+
+    def get_bond_pairs(self, parallel=None):
+        """Return all bonded pairs as edge list.
+
+        Args:
+            parallel (bool): Distribute the cells over
+                ``numba.get_num_threads()`` threads.
+                By default this is done for more than
+                :data:`PARALLEL_THRESHOLD` atoms.
+
+        Returns:
+            tuple: Two integer arrays ``(i, j)`` with ``i <= j``
+            containing the positions of bonded atoms.
+            Every bond appears exactly once.
+        """
+        if parallel is None:
+            parallel = (len(self) > PARALLEL_THRESHOLD
+                        and numba.get_num_threads() > 1)
+        if parallel:
+            kernel = _get_bond_pairs_parallel
+        else:
+            kernel = _get_bond_pairs_serial
+        return kernel(self.pos, self.codes, self.cutoffs, self.deltas,
+                      self.cell_idx, self.dims,
+                      self.order, self.occupied, self.cell_start,
+                      self.self_bonding_allowed)
+
+    def with_bond_lengths(self, bond_lengths):
+        """Return a cell list with the same cells for other bond lengths.
+
+        The bond lengths must not be larger than the ones the cells
+        were built for.
+
+        Args:
+            bond_lengths (np.array): Table of the maximal bond lengths
+                between two codes.
+
+        Returns:
+            CellList:
+        """
+        new = copy.copy(self)
+        new.bond_lengths = np.asarray(bond_lengths, dtype='f8')
+        new.cutoffs = new.bond_lengths**2
+        return new
+
+    def rebuild(self, pos):
+        """Return a cell list with the same bond lengths for other
+        positions.
+
+        Args:
+            pos (np.array): ``(n, 3)`` array of positions.
+
+        Returns:
+            CellList:
+        """
+        return self.__class__(pos, self.codes, self.bond_lengths,
+                              self_bonding_allowed=self.self_bonding_allowed,
+                              deltas=self.deltas)
+
+    def get_moved(self, pos):
+        """Return a boolean mask of the atoms displaced since the
+        cell list was built."""
+        return (pos != self.pos).any(axis=1)
+
+    def get_bond_pairs_of(self, changed, pos):
+        """Return the bonds of some atoms after a displacement.
+
+        Args:
+            changed (np.array): Positions of the atoms whose bonds are
+                requested. It has to contain every atom that was
+                displaced since the bonds were calculated the last time.
+            pos (np.array): The current ``(n, 3)`` array of positions.
+
+        Returns:
+            tuple: Two integer arrays ``(i, j)`` with ``i <= j``
+            containing all bonds with at least one atom in ``changed``.
+            Every bond appears exactly once.
+        """
+        pos = np.asarray(pos, dtype='f8')
+        return _get_bond_pairs_of(
+            np.asarray(changed, dtype='i8'), self.get_moved(pos), pos,
+            self.codes, self.cutoffs, self.deltas, self.lower,
+            self.cell_size, self.dims,
+            self.order, self.occupied, self.cell_start,
+            self.self_bonding_allowed)
+
+
+@jit(nopython=True, cache=True)
+def _filter_pairs(first, second, pos, codes, cutoffs, deltas):
+    """Return a boolean mask of the candidate pairs that are bonded."""
+    bonded = np.empty(first.shape[0], dtype=np.bool_)
+    for k in range(first.shape[0]):
+        i, j = first[k], second[k]
+        D = 0.
+        for h in range(3):
+            D += (pos[i, h] - pos[j, h])**2
+        bonded[k] = _get_squared_cutoff(i, j, codes, cutoffs, deltas) - D >= 0
+    return bonded
+
+
+class VerletList(object):
+    """Candidate pairs for bonds over several frames of a trajectory.
+
+    All pairs closer than their bond length plus ``skin`` are stored.
+    As long as no atom moved more than ``skin / 2`` since the list was
+    built, every bond is contained in the candidate pairs and only the
+    candidates have to be tested.
+    Otherwise the list is rebuilt.
+
+    Args:
+        pos (np.array): ``(n, 3)`` array of positions.
+        codes (np.array): ``(n,)`` integer array of the atom codes.
+        bond_lengths (np.array): Table of the maximal bond lengths
+            between two codes.
+        skin (float):
+        self_bonding_allowed (bool):
+        deltas (np.array): The changes of the bond lengths of every atom
+            with a modified radius or an empty array.
+
+    Attributes:
+        cell_list (CellList): The cell list of the last build
+            for the bond lengths without ``skin``.
+        n_builds (int): The number of builds.
+    """
+    def __init__(self, pos, codes, bond_lengths, skin=0.5,
+                 self_bonding_allowed=False, deltas=None):
+        self.codes = np.asarray(codes)
+        self.bond_lengths = np.asarray(bond_lengths, dtype='f8')
+        self.cutoffs = self.bond_lengths**2
+        self.deltas = np.zeros(0) if deltas is None else np.asarray(
+            deltas, dtype='f8')
+        self.skin = skin
+        self.self_bonding_allowed = self_bonding_allowed
+        self.n_builds = 0
+        self._build(np.asarray(pos, dtype='f8'))
+
+    def _build(self, pos):
+        self.pos = pos.copy()
+        cell_list = CellList(pos, self.codes, self.bond_lengths + self.skin,
+                             self_bonding_allowed=self.self_bonding_allowed,
+                             deltas=self.deltas)
+        self.first, self.second = cell_list.get_bond_pairs()
+        self.cell_list = cell_list.with_bond_lengths(self.bond_lengths)
+        self.n_builds += 1
+
+    def get_bond_pairs(self, pos):
+        """Return all bonded pairs for new positions.
+
+        Args:
+            pos (np.array): ``(n, 3)`` array of positions.
+
+        Returns:
+            tuple: Two integer arrays ``(i, j)`` with ``i <= j``
+            containing the positions of bonded atoms.
+            Every bond appears exactly once.
+        """
+        pos = np.asarray(pos, dtype='f8')
+        displacement = ((pos - self.pos)**2).sum(axis=1)
+        if len(pos) and displacement.max() > (self.skin / 2)**2:
+            self._build(pos)
+        bonded = _filter_pairs(self.first, self.second, pos, self.codes,
+                               self.cutoffs, self.deltas)
+        return self.first[bonded], self.second[bonded]
+
+
+@jit(nopython=True, cache=True)
+def _get_nearest(points, pos, rank, lower, cell_size, dims, order, occupied,
+                 cell_start):
+    """Return the nearest pair of a point and an inserted atom.
+
+    Ties are broken like the first minimum of the dense distance matrix
+    between the points and the inserted atoms in the order of their rank.
+    """
+    best_D, best_i, best_j = np.inf, -1, -1
+    point_idx = np.empty(3, dtype=np.int64)
+    for i in range(points.shape[0]):
+        min_s, max_s = 0, 0
+        for h in range(3):
+            point_idx[h] = np.int64(np.floor((points[i, h] - lower[h])
+                                             / cell_size))
+            min_s = max(min_s, -point_idx[h], point_idx[h] - dims[h] + 1)
+            max_s = max(max_s, abs(point_idx[h]),
+                        abs(dims[h] - 1 - point_idx[h]))
+        for s in range(min_s, max_s + 1):
+            # Atoms in shells beyond s are further away than
+            # (s - 1) * cell_size, one cell is spared for rounding errors.
+            if best_D < (s - 1) * cell_size:
+                break
+            for dx in range(-s, s + 1):
+                cx = point_idx[0] + dx
+                if cx < 0 or cx >= dims[0]:
+                    continue
+                for dy in range(-s, s + 1):
+                    cy = point_idx[1] + dy
+                    if cy < 0 or cy >= dims[1]:
+                        continue
+                    on_surface = abs(dx) == s or abs(dy) == s
+                    for dz in range(-s, s + 1):
+                        if not on_surface and abs(dz) != s:
+                            continue
+                        cz = point_idx[2] + dz
+                        if cz < 0 or cz >= dims[2]:
+                            continue
+                        c = _find_cell((cx * dims[1] + cy) * dims[2] + cz,
+                                       occupied)
+                        if c == -1:
+                            continue
+                        for k in range(cell_start[c], cell_start[c + 1]):
+                            j = order[k]
+                            if rank[j] == -1:
+                                continue
+                            D = np.sqrt(((points[i] - pos[j])**2).sum())
+                            if (D < best_D or (D == best_D and i == best_i
+                                               and rank[j] < rank[best_j])):
+                                best_D, best_i, best_j = D, i, j
+    return best_i, best_j, best_D
+
+
+class GrowingCellList(object):
+    """Cell list of the atoms of a molecule that are inserted one
+    fragment after another.
+
+    All atoms are sorted into the cells once, an atom is only
+    considered after it was inserted.
+    The nearest inserted atom to some points is searched in cubic shells
+    of cells around every point, so the cost of a query does not depend
+    on the number of inserted atoms.
+
+    Args:
+        pos (np.array): ``(n, 3)`` array of positions.
+        cell_size (float): The edge length of a cell.
+            By default the cells contain one atom on average.
+    """
+    def __init__(self, pos, cell_size=None):
+        self.pos = np.array(pos, dtype='f8')
+        if cell_size is None:
+            extent = np.ptp(self.pos, axis=0) + 1 if len(self.pos) else 1
+            cell_size = (np.prod(extent) / max(len(self.pos), 1))**(1 / 3)
+        self.cell_size = cell_size
+        self.lower, _, self.dims, keys = get_cell_keys(self.pos, cell_size)
+        self.order, self.occupied, self.cell_start = get_cell_list(keys)
+        self.rank = np.full(len(self.pos), -1, dtype='i8')
+        self.n_inserted = 0
+
+    def insert(self, atoms):
+        """Insert atoms.
+
+        Args:
+            atoms (np.array): Positions of the atoms in ``pos``.
+                Their rank for breaking ties is the order of insertion.
+
+        Returns:
+            None
+        """
+        atoms = np.asarray(atoms, dtype='i8')
+        self.rank[atoms] = self.n_inserted + np.arange(len(atoms))
+        self.n_inserted += len(atoms)
+
+    def get_nearest(self, points):
+        """Return the nearest pair of a point and an inserted atom.
+
+        The result is the same as taking the first minimum of the
+        distance matrix between ``points`` and the inserted atoms
+        in the order of insertion.
+
+        Args:
+            points (np.array): ``(m, 3)`` array of positions.
+
+        Returns:
+            tuple: ``(i, j, d)`` with the position ``i`` in ``points``,
+            the position ``j`` of the inserted atom and their distance.
+        """
+        if not self.n_inserted:
+            raise ValueError('No atoms were inserted.')
+        return _get_nearest(np.asarray(points, dtype='f8'), self.pos,
+                            self.rank, self.lower, self.cell_size, self.dims,
+                            self.order, self.occupied, self.cell_start)
+
+
+def get_bond_pairs(pos, codes, bond_lengths, self_bonding_allowed=False,
+                   deltas=None):
+    """Return all bonded pairs as edge list.
+
+    Look into :meth:`CellList.get_bond_pairs` for the return value.
+    """
+    return CellList(pos, codes, bond_lengths, self_bonding_allowed,
+                    deltas=deltas).get_bond_pairs()
+
+
+def get_periodic_bond_pairs(pos, codes, bond_lengths, cell,
+                            self_bonding_allowed=False, deltas=None):
+    """Return all bonded pairs under periodic boundary conditions.
+
+    The atoms are wrapped into the unit cell and the periodic images
+    within the largest possible bond length of the unit cell are added
+    as ghost atoms, so that the usual
+    :meth:`CellList.get_bond_pairs` finds all bonds across the faces.
+    Only a thin layer of images is added instead of a padded supercell.
+
+    Args:
+        pos (np.array): ``(n, 3)`` array of positions.
+        codes (np.array): ``(n,)`` integer array of the atom codes.
+        bond_lengths (np.array): Table of the maximal bond lengths
+            between two codes.
+        cell (np.array): ``(3, 3)`` array with the lattice vectors as rows.
+        self_bonding_allowed (bool): Also allows bonds between an atom
+            and its own periodic image.
+        deltas (np.array): The changes of the bond lengths of every atom
+            with a modified radius or an empty array.
+
+    Returns:
+        tuple: Two integer arrays ``(i, j)`` with ``i <= j``
+        containing the positions of bonded atoms.
+        Every bond appears exactly once, even if two atoms are bonded
+        via several periodic images.
+    """
+    pos = np.asarray(pos, dtype='f8')
+    codes = np.asarray(codes)
+    deltas = np.zeros(0) if deltas is None else np.asarray(deltas, dtype='f8')
+    cell = np.asarray(cell, dtype='f8')
+    n = len(pos)
+    inverse = np.linalg.inv(cell)
+    fractional = pos @ inverse
+    fractional -= np.floor(fractional)
+    # The distance between two lattice planes along the k-th lattice
+    # vector is 1 / |inverse[:, k]|.
+    reach = (_get_cutoff(codes, bond_lengths, deltas)
+             * np.linalg.norm(inverse, axis=0))
+    n_images = np.ceil(reach).astype('i8')
+
+    images, origins = [fractional], [np.arange(n)]
+    for shift in product(*[range(-m, m + 1) for m in n_images]):
+        if not any(shift):
+            continue
+        shifted = fractional + shift
+        near = ((shifted > -reach) & (shifted < 1 + reach)).all(axis=1)
+        images.append(shifted[near])
+        origins.append(near.nonzero()[0])
+    origins = np.concatenate(origins)
+
+    first, second = get_bond_pairs(
+        np.concatenate(images) @ cell, codes[origins], bond_lengths,
+        deltas=deltas[origins] if len(deltas) else deltas)
+    # The original atoms come first, so a bond with at least
+    # one original atom has first < n.
+    is_original = first < n
+    first, second = origins[first[is_original]], origins[second[is_original]]
+    if self_bonding_allowed:
+        first = np.concatenate([first, np.arange(n)])
+        second = np.concatenate([second, np.arange(n)])
+    else:
+        is_image = first == second
+        first, second = first[~is_image], second[~is_image]
+    pairs = np.unique(np.minimum(first, second) * n
+                      + np.maximum(first, second))
+    return pairs // n, pairs % n
+
+
+@jit(nopython=True, cache=True)
+def get_minimum_image(vector, cell, inverse):
+    """Return the shortest periodic image of a distance vector.
+
+    Args:
+        vector (np.array): A distance vector of length 3.
+        cell (np.array): ``(3, 3)`` array with the lattice vectors as rows.
+        inverse (np.array): The inverse of ``cell``.
+
+    Returns:
+        np.array:
+    """
+    fractional = vector @ inverse
+    fractional -= np.round(fractional)
+    reduced = fractional @ cell
+    # Rounding the fractional coordinates is not sufficient
+    # for strongly skewed cells, so the neighbouring images are tested.
+    shortest = reduced.copy()
+    min_D = (reduced**2).sum()
+    for a in range(-1, 2):
+        for b in range(-1, 2):
+            for c in range(-1, 2):
+                image = reduced + a * cell[0] + b * cell[1] + c * cell[2]
+                D = (image**2).sum()
+                if D < min_D:
+                    min_D = D
+                    shortest = image
+    return shortest
+
+
+@jit(nopython=True, cache=True)
+def get_periodic_distances(pos1, pos2, cell):
+    """Return the minimum image distance between each pair of points
+    in ``pos1`` and ``pos2``."""
+    inverse = np.linalg.inv(cell)
+    D = np.empty((pos1.shape[0], pos2.shape[0]))
+    for i in range(pos1.shape[0]):
+        for j in range(pos2.shape[0]):
+            image = get_minimum_image(pos1[i] - pos2[j], cell, inverse)
+            D[i, j] = np.sqrt((image**2).sum())
+    return D
@@ -15,7 +15,9 @@ import numpy as np
 import pandas as pd
 import sympy
 from chemcoord.configuration import settings
+from chemcoord.utilities._sparse import sparse_dot
 from numba import jit
+from scipy.sparse import issparse
 
 
 def view(molecule, viewer=settings['defaults']['viewer'], use_curr_dir=False):
@@ -140,9 +142,14 @@ def write_molden(*args, **kwargs):
 def read_molden(inputfile, start_index=0, get_bonds=True):
     """Read a molden file.
 
+    If ``get_bonds`` is ``True``, the bonds are detected with a
+    neighbour list that is shared between the geometries and only
+    rebuilt after atoms moved far enough.
+
     Args:
         inputfile (str):
         start_index (int):
+        get_bonds (bool):
 
     Returns:
         list: A list containing :class:`~chemcoord.Cartesian` is returned.
@@ -177,10 +184,12 @@ def read_molden(inputfile, start_index=0, get_bonds=True):
         cartesians = []
         for energy in energies:
             cartesian = Cartesian.read_xyz(
-                f, start_index=start_index, get_bonds=get_bonds,
+                f, start_index=start_index, get_bonds=False,
                 nrows=number_of_atoms, engine='python')
             cartesian.metadata['energy'] = energy
             cartesians.append(cartesian)
+    if get_bonds:
+        Cartesian._set_bonds_of_trajectory(cartesians)
     return cartesians
 
 
@@ -446,7 +455,8 @@ def apply_grad_zmat_tensor(grad_C, construction_table, cart_dist):
     """Apply the gradient for transformation to Zmatrix space onto cart_dist.
 
     Args:
-        grad_C (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array.
+        grad_C (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array
+            or a ``(3 * n, 3 * n)`` :class:`scipy.sparse.bsr_matrix`.
             The mathematical details of the index layout is explained in
             :meth:`~chemcoord.Cartesian.get_grad_zmat()`.
         construction_table (pandas.DataFrame): Explained in
@@ -461,12 +471,16 @@ def apply_grad_zmat_tensor(grad_C, construction_table, cart_dist):
         message = "construction_table and cart_dist must use the same index"
         raise ValueError(message)
     X_dist = cart_dist.loc[:, ['x', 'y', 'z']].values.T
-    C_dist = np.tensordot(grad_C, X_dist, axes=([3, 2], [0, 1])).T
+    if issparse(grad_C):
+        C_dist = sparse_dot(grad_C, X_dist.T.ravel()).reshape(
+            (len(cart_dist), 3))
+    else:
+        C_dist = np.tensordot(grad_C, X_dist, axes=([3, 2], [0, 1])).T
     if C_dist.dtype == np.dtype('i8'):
         C_dist = C_dist.astype('f8')
     try:
         C_dist[:, [1, 2]] = np.rad2deg(C_dist[:, [1, 2]])
-    except AttributeError:
+    except (TypeError, AttributeError):
         C_dist[:, [1, 2]] = sympy.deg(C_dist[:, [1, 2]])
 
     from chemcoord.internal_coordinates.zmat_class_main import Zmat
@@ -479,3 +493,42 @@ def apply_grad_zmat_tensor(grad_C, construction_table, cart_dist):
     new.loc[:, 'atom'] = cart_dist.loc[:, 'atom']
     new.loc[:, ['bond', 'angle', 'dihedral']] = C_dist
     return Zmat(new, _metadata={'last_valid_cartesian': cart_dist})
+
+
+def get_zmat_values(frames, construction_table):
+    """Calculate the internal coordinates of several frames at once.
+
+    The construction table is translated only once and
+    the frames are transformed in parallel.
+
+    Args:
+        frames: Either a list of :class:`~chemcoord.Cartesian`
+            or a ``(n_frames, 3, n_atoms)`` array of positions,
+            where the atoms are in the order of the index of
+            ``construction_table``.
+        construction_table (pandas.DataFrame): Explained in
+            :meth:`~chemcoord.Cartesian.get_construction_table()`.
+            It is used for all frames.
+
+    Returns:
+        tuple: ``(err, values)`` with the ``(n_frames,)`` array
+        of error codes and the ``(n_frames, 3, n_atoms)`` array
+        of bond lengths, angles and dihedrals in degrees.
+        The error code is :data:`~chemcoord.exceptions.ERR_CODE_OK`
+        or :data:`~chemcoord.exceptions.ERR_CODE_InvalidReference`
+        for a frame with a linear reference.
+        The values of a frame with an error are undefined.
+    """
+    from chemcoord.cartesian_coordinates._cart_transformation import \
+        get_C_frames
+    from chemcoord.cartesian_coordinates._construction_table import \
+        to_int_table
+    index = construction_table.index
+    c_table = to_int_table(construction_table, index)
+    if not isinstance(frames, np.ndarray):
+        frames = np.stack([frame.loc[index, ['x', 'y', 'z']].values.T
+                           for frame in frames])
+    err, values = get_C_frames(np.ascontiguousarray(frames, dtype='f8'),
+                               c_table)
+    values[:, [1, 2], :] = np.rad2deg(values[:, [1, 2], :])
+    return err, values
@@ -17,12 +17,14 @@ def _give_default_file_path():
 def provide_default_settings():
     settings = {}
     # The Cartesian().get_bonds() method will use or not use a lookup.
-    # Greatly increases performance if True, but could introduce bugs
-    # if the Cartesian().xyz_frame is changed manually.
+    # The lookup is invalidated, if the Cartesian is changed inplace.
     settings['defaults'] = {}
-    settings['defaults']['use_lookup'] = False
+    settings['defaults']['use_lookup'] = True
     settings['defaults']['atomic_radius_data'] = 'atomic_radius_cc'
     settings['defaults']['viewer'] = 'gv.exe'
+    # Cartesian().get_construction_table() reuses the construction table
+    # of a molecule with the same index, elements and bonds.
+    settings['defaults']['reuse_construction_table'] = False
     # settings['viewer'] = 'avogadro'
     # settings['viewer'] = 'molden'
     # settings['viewer'] = 'jmol'
@@ -91,6 +93,7 @@ def read_configuration_file(filepath=_give_default_file_path()):
         special_actions = {}  # Something different than a string is expected
         special_actions['defaults'] = {}
         special_actions['defaults']['use_lookup'] = getboolean
+        special_actions['defaults']['reuse_construction_table'] = getboolean
         try:
             return special_actions[section][key](section, key, config)
         except KeyError:
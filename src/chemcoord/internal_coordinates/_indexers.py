@@ -1,7 +1,25 @@
 # -*- coding: utf-8 -*-
 
+import pandas as pd
+
 from chemcoord.exceptions import InvalidReference
 
+_VALUE_COLS = frozenset({'bond', 'angle', 'dihedral'})
+
+
+def _bump_version_unless_values(molecule, index, columns=slice(None)):
+    """Invalidate the cached results, unless only bond lengths, angles
+    or dihedrals of existing rows were assigned.
+    """
+    if isinstance(columns, slice):
+        only_values = False
+    else:
+        if not pd.api.types.is_list_like(columns):
+            columns = [columns]
+        only_values = set(columns) <= _VALUE_COLS
+    if not only_values or molecule._frame.index is not index:
+        molecule._bump_version()
+
 
 class _generic_Indexer(object):
     def __init__(self, molecule):
@@ -19,10 +37,13 @@ class _Loc(_generic_Indexer):
 
 class _Unsafe_Loc(_Loc):
     def __setitem__(self, key, value):
+        index = self.molecule.index
         if isinstance(key, tuple):
             self.molecule._frame.loc[key[0], key[1]] = value
+            _bump_version_unless_values(self.molecule, index, key[1])
         else:
             self.molecule._frame.loc[key] = value
+            self.molecule._bump_version()
 
 
 class _Safe_Loc(_Loc):
@@ -31,10 +52,13 @@ class _Safe_Loc(_Loc):
             molecule = self.molecule
         else:
             molecule = self.molecule.copy()
+        index = molecule.index
         if isinstance(key, tuple):
             molecule._frame.loc[key[0], key[1]] = value
+            _bump_version_unless_values(molecule, index, key[1])
         else:
             molecule._frame.loc[key] = value
+            molecule._bump_version()
 
         try:
             molecule.get_cartesian()
@@ -64,10 +88,14 @@ class _ILoc(_generic_Indexer):
 
 class _Unsafe_ILoc(_ILoc):
     def __setitem__(self, key, value):
+        index = self.molecule.index
         if isinstance(key, tuple):
             self.molecule._frame.iloc[key[0], key[1]] = value
+            _bump_version_unless_values(self.molecule, index,
+                                        self.molecule.columns[key[1]])
         else:
             self.molecule._frame.iloc[key] = value
+            self.molecule._bump_version()
 
 
 class _Safe_ILoc(_Unsafe_ILoc):
@@ -76,10 +104,14 @@ class _Safe_ILoc(_Unsafe_ILoc):
             molecule = self.molecule
         else:
             molecule = self.molecule.copy()
+        index = molecule.index
         if isinstance(key, tuple):
             molecule._frame.iloc[key[0], key[1]] = value
+            _bump_version_unless_values(molecule, index,
+                                        molecule.columns[key[1]])
         else:
             molecule._frame.iloc[key] = value
+            molecule._bump_version()
 
         try:
             molecule.get_cartesian()
@@ -11,8 +11,12 @@ import chemcoord.internal_coordinates._indexers as indexers
 import chemcoord.internal_coordinates._zmat_transformation as transformation
 import numpy as np
 import pandas as pd
+from scipy.sparse import bsr_matrix
 from chemcoord._generic_classes.generic_core import GenericCore
+from chemcoord.cartesian_coordinates._construction_table import \
+    from_codes, to_int_table
 from chemcoord.exceptions import (ERR_CODE_OK, ERR_CODE_InvalidReference,
+                                  IllegalArgumentCombination,
                                   InvalidReference, PhysicalMeaning)
 from chemcoord.internal_coordinates._zmat_class_pandas_wrapper import \
     PandasWrapper
@@ -462,32 +466,12 @@ and assigning values safely.
         elif len(new_index) != len(self):
             raise ValueError('len(new_index) has to be the same as len(self)')
 
-        c_table = self.loc[:, ['b', 'a', 'd']]
-        # Strange bug in pandas where .replace is transitive for object columns
-        # and non-transitive for all other types.
-        # (Remember that string columns are just object columns)
-        # Example:
-        # A = {1: 2, 2: 3}
-        # Transtitive [1].replace(A) gives [3]
-        # Non-Transtitive [1].replace(A) gives [2]
-        # https://github.com/pandas-dev/pandas/issues/5338
-        # https://github.com/pandas-dev/pandas/issues/16051
-        # https://github.com/pandas-dev/pandas/issues/5541
-        # For this reason convert to int and replace then.
-
-        c_table = c_table.replace(constants.int_label)
-        try:
-            c_table = c_table.astype('i8')
-        except ValueError:
-            raise ValueError('Due to a bug in pandas it is necessary to have '
-                             'integer columns')
-        c_table = c_table.replace(self.index, new_index)
-        c_table = c_table.replace(
-            {v: k for k, v in constants.int_label.items()})
-
+        c_table = self._get_c_table_positions()
         out = self.copy()
-        out.unsafe_loc[:, ['b', 'a', 'd']] = c_table
         out._frame.index = new_index
+        out.unsafe_loc[:, ['b', 'a', 'd']] = from_codes(c_table.T, out.index)
+        # The positions of the references do not change.
+        out._set_cached('c_table_positions', c_table)
         return out
 
     def _insert_dummy_cart(self, exception, last_valid_cartesian=None):
@@ -540,7 +524,9 @@ and assigning values safely.
             """Works INPLACE on self._frame"""
             cols = ['b', 'a', 'd']
             actual_d = zmat.loc[i, 'd']
-            zframe = insert_row(zmat, zmat.index.get_loc(i), dummy_d)
+            c_table = zmat._get_c_table_positions()
+            pos, actual_pos = zmat.index.get_indexer([i, actual_d])
+            zframe = insert_row(zmat, pos, dummy_d)
             zframe.loc[i, 'd'] = dummy_d
             zframe.loc[dummy_d, 'atom'] = 'X'
             zframe.loc[dummy_d, cols] = zmat.loc[actual_d, cols]
@@ -549,6 +535,13 @@ and assigning values safely.
             zframe.loc[dummy_d, ['bond', 'angle', 'dihedral']] = zmat_values
 
             zmat._frame = zframe
+            zmat._bump_version()
+            # The dummy uses the references of actual_d and is inserted
+            # before i, which moves the following atoms by one position.
+            c_table = np.where(c_table >= pos, c_table + 1, c_table)
+            c_table = np.insert(c_table, pos, c_table[:, actual_pos], axis=1)
+            c_table[2, pos + 1] = pos
+            zmat._set_cached('c_table_positions', c_table)
             zmat._metadata['has_dummies'][i] = {'dummy_d': dummy_d,
                                                 'actual_d': actual_d}
             raise_warning(i, dummy_d)
@@ -592,15 +585,28 @@ and assigning values safely.
             else:
                 return zmat
         has_dummies = zmat._metadata['has_dummies']
+        dummies = [has_dummies[k]['dummy_d'] for k in to_remove]
 
         c_table = zmat.loc[to_remove, ['b', 'a', 'd']]
         c_table['d'] = [has_dummies[k]['actual_d'] for k in to_remove]
+        positions = zmat._get_c_table_positions().copy()
+        positions[2, zmat.index.get_indexer(to_remove)] = \
+            zmat.index.get_indexer(c_table['d'])
         zmat.unsafe_loc[to_remove, 'd'] = c_table['d'].astype('i8')
+        zmat._set_cached('c_table_positions', positions)
 
         zmat_values = zmat.get_cartesian()._calculate_zmat_values(c_table)
         zmat.unsafe_loc[to_remove, ['bond', 'angle', 'dihedral']] = zmat_values
-        zmat._frame.drop([has_dummies[k]['dummy_d'] for k in to_remove],
-                         inplace=True)
+
+        # The atoms after a dummy move forward by one position.
+        is_dummy = zmat.index.isin(dummies)
+        shift = np.cumsum(is_dummy)
+        positions = positions[:, ~is_dummy]
+        positions = np.where(positions >= 0,
+                             positions - shift[positions.clip(0)], positions)
+        zmat._frame.drop(dummies, inplace=True)
+        zmat._bump_version()
+        zmat._set_cached('c_table_positions', positions)
         warnings.warn('The dummy atoms {} were removed'.format(to_remove),
                       UserWarning)
         for k in to_remove:
@@ -617,51 +623,87 @@ and assigning values safely.
             zmat = zmat._insert_dummy_zmat(exception, inplace=False)
             return zmat._remove_dummies(inplace=False)
 
-    def get_cartesian(self):
-        """Return the molecule in cartesian coordinates.
+    def _get_c_table_positions(self):
+        """Return the construction table as ``(3, n_atoms)`` integer array
+        of the positions of the references.
+
+        The absolute references are given by :attr:`constants.int_label`.
+        The array is cached until the references or the index change.
+        """
+        c_table = self._get_cached('c_table_positions')
+        if c_table is None:
+            c_table = to_int_table(self._frame, self.index)
+            self._set_cached('c_table_positions', c_table)
+        return c_table
+
+    def _create_cartesian(self, positions, row):
+        """Return a Cartesian of the first ``row`` atoms at ``positions``.
+        """
+        xyz_frame = pd.DataFrame(positions[:row], index=self.index[:row],
+                                 columns=['x', 'y', 'z'])
+        xyz_frame.insert(0, 'atom', self._frame['atom'].values[:row])
+        from chemcoord.cartesian_coordinates.cartesian_class_main \
+            import Cartesian
+        return Cartesian(xyz_frame, metadata=self.metadata)
+
+    def get_cartesian_positions(self, zmat_values=None):
+        """Return the positions of the atoms in cartesian coordinates.
+
+        This is the fast path of :meth:`~Zmat.get_cartesian`,
+        which returns only an array.
+        The construction table is cached as integer array,
+        so repeated calls for the same Zmat or for new values,
+        e.g. in an optimization, do not use pandas.
 
         Raises an :class:`~exceptions.InvalidReference` exception,
         if the reference of the i-th atom is undefined.
 
         Args:
-            None
+            zmat_values (np.array): An ``(n_atoms, 3)`` array of bond lengths,
+                angles and dihedrals in degrees in the order of the index.
+                By default the values of this Zmat are used.
 
         Returns:
-            Cartesian: Reindexed version of the zmatrix.
+            np.array: An ``(n_atoms, 3)`` array of positions
+            in the order of the index.
         """
-        def create_cartesian(positions, row):
-            xyz_frame = pd.DataFrame(columns=['atom', 'x', 'y', 'z'],
-                                     index=self.index[:row], dtype='f8')
-            xyz_frame['atom'] = self.loc[xyz_frame.index, 'atom']
-            xyz_frame.loc[:, ['x', 'y', 'z']] = positions[:row]
-            from chemcoord.cartesian_coordinates.cartesian_class_main \
-                import Cartesian
-            cartesian = Cartesian(xyz_frame, metadata=self.metadata)
-            return cartesian
-
-        c_table = self.loc[:, ['b', 'a', 'd']]
-        c_table = c_table.replace(constants.int_label)
-        c_table = c_table.replace({k: v for v, k in enumerate(c_table.index)})
-        c_table = c_table.values.astype('i8').T
-
-        C = self.loc[:, ['bond', 'angle', 'dihedral']].values.T
+        c_table = self._get_c_table_positions()
+        if zmat_values is None:
+            zmat_values = self._frame.loc[:, ['bond', 'angle', 'dihedral']]
+        C = np.array(zmat_values).T
+        if C.dtype != object:
+            C = C.astype('f8')
+        # Symbolic values raise an exception here.
         C[[1, 2], :] = np.radians(C[[1, 2], :])
 
         err, row, positions = transformation.get_X(C, c_table)
         positions = positions.T
 
         if err == ERR_CODE_InvalidReference:
-            rename = dict(enumerate(self.index))
-            i = rename[row]
+            i = self.index[row]
             b, a, d = self.loc[i, ['b', 'a', 'd']]
-            cartesian = create_cartesian(positions, row)
+            cartesian = self._create_cartesian(positions, row)
             raise InvalidReference(i=i, b=b, a=a, d=d,
                                    already_built_cartesian=cartesian)
-        elif err == ERR_CODE_OK:
-            return create_cartesian(positions, row + 1)
+        return positions
+
+    def get_cartesian(self):
+        """Return the molecule in cartesian coordinates.
+
+        Raises an :class:`~exceptions.InvalidReference` exception,
+        if the reference of the i-th atom is undefined.
+
+        Args:
+            None
+
+        Returns:
+            Cartesian: Reindexed version of the zmatrix.
+        """
+        return self._create_cartesian(self.get_cartesian_positions(),
+                                      len(self))
 
     def get_grad_cartesian(self, as_function=True, chain=True,
-                           drop_auto_dummies=True):
+                           drop_auto_dummies=True, sparse=False):
         r"""Return the gradient for the transformation to a Cartesian.
 
         If ``as_function`` is True, a function is returned that can be directly
@@ -730,6 +772,14 @@ and assigning values safely.
             =
             \frac{\partial \mathbf{X}_{i, j}}{\partial \mathbf{C}_{l, k}}
 
+        Without chain rule the position of every atom depends only on its
+        own internal coordinates.
+        If ``sparse`` is True, only the ``(3, 3)`` blocks on the diagonal
+        are calculated and a ``(3 * n, 3 * n)``
+        :class:`scipy.sparse.bsr_matrix` is returned instead of the tensor,
+        whose element ``[3 * j + i, 3 * k + l]`` is the element
+        ``[i, j, k, l]`` of the tensor.
+
         Args:
             construction_table (pandas.DataFrame):
             as_function (bool): Return a tensor or
@@ -740,6 +790,8 @@ and assigning values safely.
                 dummies from the gradient.
                 This means, that only changes in regularly placed atoms are
                 considered for the gradient.
+            sparse (bool): Return a sparse matrix instead of a tensor.
+                Requires ``chain=False``.
 
         Returns:
             (func, :class:`numpy.ndarray`): Depending on ``as_function``
@@ -747,28 +799,34 @@ and assigning values safely.
             :func:`~chemcoord.zmat_functions.apply_grad_cartesian_tensor`
             with partially replaced arguments.
         """
-        zmat = self.change_numbering()
-        c_table = zmat.loc[:, ['b', 'a', 'd']]
-        c_table = c_table.replace(constants.int_label).values.T
-        C = zmat.loc[:, ['bond', 'angle', 'dihedral']].values.T
+        if sparse and chain:
+            message = 'A sparse gradient requires chain=False.'
+            raise IllegalArgumentCombination(message)
+        c_table = self._get_c_table_positions()
+        C = self.loc[:, ['bond', 'angle', 'dihedral']].values.T
         if C.dtype == np.dtype('i8'):
             C = C.astype('f8')
         C[[1, 2], :] = np.radians(C[[1, 2], :])
 
-        grad_X = transformation.get_grad_X(C, c_table, chain=chain)
-
+        included = np.full(len(self), True)
         if drop_auto_dummies:
-            def drop_dummies(grad_X, zmolecule):
-                rename = dict(zip(zmolecule.index, range(len(zmolecule))))
-                dummies = [rename[v['dummy_d']] for v in
-                           self._metadata['has_dummies'].values()]
-                excluded = np.full(grad_X.shape[1], True)
-                excluded[dummies] = False
+            dummies = [v['dummy_d']
+                       for v in self._metadata['has_dummies'].values()]
+            included[self.index.get_indexer(dummies)] = False
+
+        if sparse:
+            X = transformation.get_X(C, c_table)[2]
+            data = transformation.get_grad_X_blocks(X, C, c_table)[included]
+            n_atoms = len(data)
+            grad_X = bsr_matrix(
+                (data, np.arange(n_atoms), np.arange(n_atoms + 1)),
+                shape=(3 * n_atoms, 3 * n_atoms))
+        else:
+            grad_X = transformation.get_grad_X(C, c_table, chain=chain)
+            if not included.all():
                 coord_rows = np.full(3, True)
-                selection = np.ix_(coord_rows, excluded, excluded, coord_rows)
-                return grad_X[selection]
-
-            grad_X = drop_dummies(grad_X, self)
+                grad_X = grad_X[np.ix_(coord_rows, included, included,
+                                       coord_rows)]
 
         if as_function:
             from chemcoord.internal_coordinates.zmat_functions import (
@@ -11,14 +11,14 @@ from numba import jit
 import chemcoord.constants as constants
 from chemcoord.cartesian_coordinates.xyz_functions import _jit_isclose
 from chemcoord.cartesian_coordinates._cart_transformation import (
-    get_B, get_grad_B, get_ref_pos)
+    fill_B, fill_grad_B, fill_ref_pos)
 from chemcoord.exceptions import ERR_CODE_OK, ERR_CODE_InvalidReference
 
 
 @jit(nopython=True, cache=True)
-def get_S(C, j):
-    S = np.zeros(3)
-    r, alpha, delta = C[:, j]
+def fill_S(C, j, S):
+    r, alpha, delta = C[0, j], C[1, j], C[2, j]
+    S[:] = 0.
     if _jit_isclose(alpha, np.pi):
         S[2] = r
     elif _jit_isclose(alpha, 0):
@@ -27,13 +27,11 @@ def get_S(C, j):
         S[0] = r * sin(alpha) * cos(delta)
         S[1] = -r * sin(alpha) * sin(delta)
         S[2] = -r * cos(alpha)
-    return S
 
 
 @jit(nopython=True, cache=True)
-def get_grad_S(C, j):
-    grad_S = np.empty((3, 3), dtype=nb.f8)
-    r, alpha, delta = C[:, j]
+def fill_grad_S(C, j, grad_S):
+    r, alpha, delta = C[0, j], C[1, j], C[2, j]
 
     # Derive for r
     grad_S[0, 0] = sin(alpha) * cos(delta)
@@ -49,39 +47,53 @@ def get_grad_S(C, j):
     grad_S[0, 2] = -r * sin(alpha) * sin(delta)
     grad_S[1, 2] = -r * sin(alpha) * cos(delta)
     grad_S[2, 2] = 0.
-    return grad_S
 
 
 @jit(nopython=True, cache=True)
 def get_X(C, c_table):
     X = np.empty_like(C)
+    ref_pos = np.empty((3, 3))
+    B = np.empty((3, 3))
+    S = np.empty(3)
+    v = np.empty(3)
     n_atoms = X.shape[1]
     for j in range(n_atoms):
-        err, B = get_B(X, c_table, j)
+        fill_ref_pos(X, c_table, j, ref_pos)
+        err = fill_B(ref_pos, B, v)
         if err == ERR_CODE_InvalidReference:
             return (err, j, X)
-        X[:, j] = (np.dot(B, get_S(C, j))
-                   + get_ref_pos(X, c_table[0, j]))
+        fill_S(C, j, S)
+        np.dot(B, S, v)
+        for m in range(3):
+            X[m, j] = v[m] + ref_pos[m, 0]
     return (ERR_CODE_OK, j, X)  # pylint:disable=undefined-loop-variable
 
 
 @jit(nopython=True, cache=True)
-def chain_grad(X, grad_X, C, c_table, j, l):
-    if j < constants.keys_below_are_abs_refs:
-        new_grad_X = np.zeros((3, 3))
-    else:
-        grad_B = get_grad_B(X, c_table, j)
-        S = get_S(C, j)
-        new_grad_X = grad_X[:, c_table[0, j], l, :].copy()
-
-        for m_2 in range(3):
-            for m_1 in range(3):
-                for k in range(3):
-                    if c_table[k, j] > constants.keys_below_are_abs_refs:
-                        new_grad_X += (S[m_2]
-                                       * grad_B[:, m_2, k, m_1]
-                                       * grad_X[m_1, c_table[k, j], l, :])
-    return new_grad_X
+def get_grad_X_blocks(X, C, c_table):
+    """Return the ``(3, 3)`` blocks on the diagonal of
+    :func:`get_grad_X` without chain rule.
+
+    Args:
+        X (np.array): The positions built by :func:`get_X`.
+        C (np.array): The bond lengths, angles and dihedrals in radians.
+        c_table (np.array):
+
+    Returns:
+        np.array: A ``(n_atoms, 3, 3)`` array.
+    """
+    n_atoms = C.shape[1]
+    data = np.empty((n_atoms, 3, 3))
+    ref_pos = np.empty((3, 3))
+    B = np.empty((3, 3))
+    grad_S = np.empty((3, 3))
+    v = np.empty(3)
+    for j in range(n_atoms):
+        fill_ref_pos(X, c_table, j, ref_pos)
+        fill_B(ref_pos, B, v)
+        fill_grad_S(C, j, grad_S)
+        np.dot(B, grad_S, data[j])
+    return data
 
 
 @jit(nopython=True, cache=True)
@@ -89,9 +101,68 @@ def get_grad_X(C, c_table, chain=True):
     n_atoms = C.shape[1]
     grad_X = np.zeros((3, n_atoms, n_atoms, 3))
     X = get_X(C, c_table)[2]
+    diagonal = get_grad_X_blocks(X, C, c_table)
+    ref_pos = np.empty((3, 3))
+    grad_B = np.empty((3, 3, 3, 3))
+    S = np.empty(3)
+    v = np.empty(3)
+    # Derivative of B @ S for the positions of the references
+    grad_BS = np.empty((3, 3, 3))
     for j in range(n_atoms):
-        grad_X[:, j, j, :] = np.dot(get_B(X, c_table, j)[1], get_grad_S(C, j))
-        if chain:
-            for l in range(j):
-                grad_X[:, j, l, :] = chain_grad(X, grad_X, C, c_table, j, l)
+        grad_X[:, j, j, :] = diagonal[j]
+        if not chain or j == 0:
+            continue
+
+        fill_ref_pos(X, c_table, j, ref_pos)
+        fill_grad_B(ref_pos, grad_B, v)
+        fill_S(C, j, S)
+        for m in range(3):
+            for k in range(3):
+                for m_1 in range(3):
+                    grad_BS[m, k, m_1] = (S[0] * grad_B[m, 0, k, m_1]
+                                          + S[1] * grad_B[m, 1, k, m_1]
+                                          + S[2] * grad_B[m, 2, k, m_1])
+        # Absolute references are constant
+        for l in range(j):
+            for m in range(3):
+                for n in range(3):
+                    if c_table[0, j] > constants.keys_below_are_abs_refs:
+                        value = grad_X[m, c_table[0, j], l, n]
+                    else:
+                        value = 0.
+                    for k in range(3):
+                        i = c_table[k, j]
+                        if i > constants.keys_below_are_abs_refs:
+                            for m_1 in range(3):
+                                value += (grad_BS[m, k, m_1]
+                                          * grad_X[m_1, i, l, n])
+                    grad_X[m, j, l, n] = value
     return grad_X
+
+
+@jit(nopython=True, cache=True, nogil=True, parallel=True)
+def get_X_frames(C, c_table):
+    """Apply :func:`get_X` to several frames in parallel.
+
+    Args:
+        C (np.array): ``(n_frames, 3, n_atoms)`` array of bond lengths,
+            angles and dihedrals in radians.
+        c_table (np.array): The construction table shared by all frames.
+
+    Returns:
+        tuple: ``(err, row, X)`` with the ``(n_frames,)`` arrays of
+        error codes and of the last built atoms and the
+        ``(n_frames, 3, n_atoms)`` array of positions.
+        The positions of a frame with an error are only defined up to
+        its last built atom.
+    """
+    n_frames = C.shape[0]
+    err = np.empty(n_frames, dtype=np.int64)
+    row = np.empty(n_frames, dtype=np.int64)
+    X = np.empty(C.shape)
+    for f in nb.prange(n_frames):
+        frame_err, frame_row, frame_X = get_X(C[f], c_table)
+        err[f] = frame_err
+        row[f] = frame_row
+        X[f] = frame_X
+    return err, row, X
@@ -4,9 +4,13 @@ from __future__ import (absolute_import, division, print_function,
 
 import numpy as np
 import sympy
+from scipy.sparse import issparse
 
 from chemcoord import export
+from chemcoord.cartesian_coordinates._construction_table import to_int_table
+from chemcoord.internal_coordinates._zmat_transformation import get_X_frames
 from chemcoord.internal_coordinates.zmat_class_main import Zmat
+from chemcoord.utilities._sparse import sparse_dot
 
 
 @export
@@ -76,7 +80,8 @@ def apply_grad_cartesian_tensor(grad_X, zmat_dist):
     """Apply the gradient for transformation to cartesian space onto zmat_dist.
 
     Args:
-        grad_X (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array.
+        grad_X (:class:`numpy.ndarray`): A ``(3, n, n, 3)`` array
+            or a ``(3 * n, 3 * n)`` :class:`scipy.sparse.bsr_matrix`.
             The mathematical details of the index layout is explained in
             :meth:`~chemcoord.Cartesian.get_grad_zmat()`.
         zmat_dist (:class:`~chemcoord.Zmat`):
@@ -92,7 +97,48 @@ def apply_grad_cartesian_tensor(grad_X, zmat_dist):
         C_dist[[1, 2], :] = np.radians(C_dist[[1, 2], :])
     except (TypeError, AttributeError):
         C_dist[[1, 2], :] = sympy.rad(C_dist[[1, 2], :])
-    cart_dist = np.tensordot(grad_X, C_dist, axes=([3, 2], [0, 1])).T
+    if issparse(grad_X):
+        cart_dist = sparse_dot(grad_X, C_dist.T.ravel()).reshape(
+            (len(zmat_dist), 3))
+    else:
+        cart_dist = np.tensordot(grad_X, C_dist, axes=([3, 2], [0, 1])).T
     from chemcoord.cartesian_coordinates.cartesian_class_main import Cartesian
     return Cartesian(atoms=zmat_dist['atom'],
                      coords=cart_dist, index=zmat_dist.index)
+
+
+def get_cartesian_positions(frames, construction_table):
+    """Calculate the cartesian positions of several frames at once.
+
+    The construction table is translated only once and
+    the frames are transformed in parallel.
+
+    Args:
+        frames: Either a list of :class:`~chemcoord.Zmat`
+            or a ``(n_frames, 3, n_atoms)`` array of bond lengths,
+            angles and dihedrals in degrees,
+            where the atoms are in the order of the index of
+            ``construction_table``.
+        construction_table (pandas.DataFrame): The references
+            ``['b', 'a', 'd']`` used for all frames,
+            e.g. ``zmat.loc[:, ['b', 'a', 'd']]``.
+
+    Returns:
+        tuple: ``(err, row, positions)`` with the ``(n_frames,)`` arrays
+        of error codes and of the position of the last built atom and
+        the ``(n_frames, 3, n_atoms)`` array of positions.
+        The error code is :data:`~chemcoord.exceptions.ERR_CODE_OK`
+        or :data:`~chemcoord.exceptions.ERR_CODE_InvalidReference`.
+        The positions of a frame with an error are only defined up to
+        its last built atom.
+    """
+    index = construction_table.index
+    c_table = to_int_table(construction_table, index)
+    if isinstance(frames, np.ndarray):
+        C = frames.astype('f8')
+    else:
+        C = np.stack([
+            frame.loc[index, ['bond', 'angle', 'dihedral']].values.T
+            for frame in frames]).astype('f8')
+    C[:, [1, 2], :] = np.radians(C[:, [1, 2], :])
+    return get_X_frames(np.ascontiguousarray(C), c_table)
@@ -49,7 +49,6 @@ def show_versions(as_json=False):
         ("scipy", lambda mod: mod.version.version),
         ("pandas", lambda mod: mod.__version__),
         ("numba", lambda mod: mod.__version__),
-        ("sortedcontainers", lambda mod: mod.__version__),
         ("sympy", lambda mod: mod.__version__),
         ("pytest", lambda mod: mod.__version__),
         ("pip", lambda mod: mod.__version__),
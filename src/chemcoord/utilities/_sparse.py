@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""Products of sparse gradients with distortions."""
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals, with_statement)
+
+import numpy as np
+
+
+def sparse_dot(matrix, vector):
+    """Return the product of a sparse matrix and a vector.
+
+    :meth:`scipy.sparse.spmatrix.dot` does not support vectors of
+    dtype ``object``, e.g. with :mod:`sympy` expressions.
+    In this case the stored blocks of the :class:`scipy.sparse.bsr_matrix`
+    are multiplied one by one.
+
+    Args:
+        matrix (scipy.sparse.spmatrix):
+        vector (numpy.ndarray):
+
+    Returns:
+        numpy.ndarray:
+    """
+    if vector.dtype != np.dtype('O'):
+        return matrix.dot(vector)
+    matrix = matrix.tobsr()
+    n_rows, n_cols = matrix.blocksize
+    result = np.zeros(matrix.shape[0], dtype='O')
+    for row in range(matrix.shape[0] // n_rows):
+        rows = slice(row * n_rows, (row + 1) * n_rows)
+        for k in range(matrix.indptr[row], matrix.indptr[row + 1]):
+            col = matrix.indices[k]
+            cols = slice(col * n_cols, (col + 1) * n_cols)
+            result[rows] = result[rows] + matrix.data[k].dot(vector[cols])
+    return result
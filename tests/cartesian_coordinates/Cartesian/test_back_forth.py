@@ -8,6 +8,10 @@ import chemcoord as cc
 from chemcoord.xyz_functions import allclose
 import pytest
 from chemcoord.exceptions import UndefinedCoordinateSystem
+from chemcoord.cartesian_coordinates._cartesian_class_get_zmat import \
+    _construction_tables
+import numpy as np
+import pandas as pd
 import itertools
 import os
 import sys
@@ -103,3 +107,118 @@ def test_issue_18():
 
     for i, j in itertools.product(structures, structures):
         assert cc.xyz_functions.allclose(i, j, align=False)
+
+
+def test_fragment_construction_table():
+    path = os.path.join(STRUCTURE_PATH, 'water.xyz')
+    water = cc.Cartesian.read_xyz(path, start_index=1).loc[[1, 2, 3]]
+    c_table = water._get_frag_constr_table(start_atom=2)
+    assert list(c_table.index) == [2, 1, 3]
+    assert c_table.values.tolist() == [['origin', 'e_z', 'e_x'],
+                                       [2, 'e_z', 'e_x'],
+                                       [1, 2, 'e_x']]
+
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'))
+    full_table = molecule._get_frag_constr_table()
+    predefined = full_table.iloc[[0, 2, 1]].copy()
+    predefined.iloc[1] = [full_table.index[0], 'e_z', 'e_x']
+    predefined.iloc[2] = [full_table.index[0], full_table.index[2], 'e_x']
+    c_table = molecule._get_frag_constr_table(predefined_table=predefined)
+    assert (c_table.iloc[:3] == predefined).all().all()
+    assert set(c_table.index) == set(molecule.index)
+    molecule._check_construction_table(c_table)
+
+
+def test_predefined_start_atom_not_in_fragment():
+    path = os.path.join(STRUCTURE_PATH, 'water.xyz')
+    molecule = cc.Cartesian.read_xyz(path)
+    predefined = pd.DataFrame([['origin', 'e_z', 'e_x']], index=[99],
+                              columns=['b', 'a', 'd'])
+    with pytest.raises(KeyError):
+        molecule.get_construction_table(
+            fragment_list=[(molecule, predefined)])
+
+
+def test_correct_dihedral_is_cached():
+    path = os.path.join(STRUCTURE_PATH, 'nasty_cube.xyz')
+    molecule = cc.Cartesian.read_xyz(path)
+    c_table = molecule.get_construction_table(perform_checks=False)
+    problem_index = molecule.check_dihedral(c_table)
+    assert problem_index
+    corrected = molecule.correct_dihedral(c_table)
+    assert not set(molecule.check_dihedral(corrected)) & set(problem_index)
+    assert molecule._get_cached('dihedral_correction') is not None
+    assert corrected.equals(molecule.correct_dihedral(c_table))
+    molecule.loc[molecule.index[0], 'x'] += 0.1
+    assert molecule._get_cached('dihedral_correction') is None
+
+
+def test_reuse_construction_table():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path)
+    displaced = molecule.copy()
+    np.random.seed(0)
+    displaced.loc[:, ['x', 'y', 'z']] += np.random.normal(
+        scale=0.001, size=(len(molecule), 3))
+    cc.settings['defaults']['reuse_construction_table'] = True
+    try:
+        c_table = molecule.get_construction_table()
+        assert c_table.equals(displaced.get_construction_table())
+        assert displaced._get_topology() in _construction_tables
+        displaced._check_construction_table(c_table)
+    finally:
+        cc.settings['defaults']['reuse_construction_table'] = False
+
+
+def test_check_construction_table_reports_all_rows():
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path)
+    c_table = molecule.get_construction_table().astype('O')
+    assert not len(molecule._get_invalid_references(c_table))
+    c_table.iloc[1, 0] = c_table.index[2]
+    c_table.iloc[5, 2] = 'e_x'
+    c_table.iloc[7, 1] = c_table.index[9]
+    invalid = molecule._get_invalid_references(c_table)
+    assert list(invalid) == list(c_table.index[[1, 5, 7]])
+    with pytest.raises(UndefinedCoordinateSystem):
+        molecule._check_construction_table(c_table)
+
+
+def test_frames_back_and_forth():
+    from chemcoord.exceptions import ERR_CODE_OK, ERR_CODE_InvalidReference
+    path = os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz')
+    molecule = cc.Cartesian.read_xyz(path)
+    c_table = molecule.get_construction_table()
+    X = molecule.loc[c_table.index, ['x', 'y', 'z']].values.T
+    np.random.seed(1)
+    X = X + np.random.normal(scale=0.01, size=(4,) + X.shape)
+    b, a = c_table.index.get_indexer(c_table.iloc[3, :2])
+    X[2, :, b] = X[2, :, a]
+
+    err, values = cc.xyz_functions.get_zmat_values(X, c_table)
+    assert list(err) == [ERR_CODE_OK, ERR_CODE_OK,
+                         ERR_CODE_InvalidReference, ERR_CODE_OK]
+    zmats = []
+    for f in [0, 1, 3]:
+        frame = molecule.loc[c_table.index].copy()
+        frame.loc[:, ['x', 'y', 'z']] = X[f].T
+        zmats.append(frame.get_zmat(c_table))
+        assert np.allclose(values[f, 0], zmats[-1]['bond'])
+        assert np.allclose(values[f, 1], zmats[-1]['angle'])
+    frames = [molecule.loc[c_table.index].copy() for f in [0, 1, 3]]
+    for frame, f in zip(frames, [0, 1, 3]):
+        frame.loc[:, ['x', 'y', 'z']] = X[f].T
+    assert np.array_equal(
+        cc.xyz_functions.get_zmat_values(frames, c_table)[1],
+        values[[0, 1, 3]])
+
+    err, row, new_X = cc.zmat_functions.get_cartesian_positions(
+        values[[0, 1, 3]], c_table)
+    assert (err == ERR_CODE_OK).all()
+    assert np.allclose(new_X, X[[0, 1, 3]])
+    zmat_table = zmats[0].loc[:, ['b', 'a', 'd']]
+    err, row, new_X = cc.zmat_functions.get_cartesian_positions(
+        zmats, zmat_table)
+    assert (err == ERR_CODE_OK).all()
+    assert np.allclose(new_X, X[[0, 1, 3]])
@@ -6,6 +6,7 @@ import os
 import sys
 
 import numpy as np
+import pandas as pd
 import pytest
 
 import chemcoord as cc
@@ -128,9 +129,24 @@ def test_overloaded_operators():
 
 def test_get_bonds():
     assert bond_dict == molecule.get_bonds()
-    molecule._metadata['bond_dict'][56].add(4)
+    molecule.get_bonds(use_lookup=True)[56].add(4)
     assert not (bond_dict == molecule.get_bonds(use_lookup=True))
     assert bond_dict == molecule.get_bonds()
+    modified = molecule.get_bonds()
+    modified[56].add(4)
+    molecule.set_bonds(modified)
+    assert not (bond_dict == molecule.get_bonds(use_lookup=True))
+    assert 56 in molecule.get_bonds(use_lookup=True)[4]
+    assert 4 in molecule.get_coordination_sphere(56, give_only_index=True,
+                                                 use_lookup=True)
+    isolated = molecule.get_bonds()
+    for i in isolated[56]:
+        isolated[i].discard(56)
+    isolated[56] = set()
+    molecule.set_bonds(isolated)
+    assert {56} in molecule.fragmentate(give_only_index=True,
+                                        use_lookup=True)
+    assert bond_dict == molecule.get_bonds()
     modified_expected = {1: {2, 51}, 2: {1, 9, 27}, 3: set(), 4: {5, 52},
                          5: {4, 31}, 6: set(), 7: {53}, 8: {10}, 9: {2},
                          10: {8, 12, 24}, 11: set(), 12: {10}, 13: {14},
@@ -150,6 +166,45 @@ def test_get_bonds():
             molecule[molecule['atom'] == 'C'].index}) == modified_expected
 
 
+def test_get_bonds_of_slice():
+    molecule.get_bonds()
+    sliced = molecule.loc[[24, 10, 8, 12, 36]]
+    expected = {24: {10, 36}, 10: {8, 12, 24}, 8: {10}, 12: {10}, 36: {24}}
+    assert sliced.get_bonds(use_lookup=True) == expected
+    assert sliced.get_bonds() == expected
+
+
+def test_cjson_bonds():
+    new = cc.Cartesian.read_cjson(molecule.to_cjson())
+    rename = dict(enumerate(molecule.index))
+    assert {rename[i]: {rename[j] for j in v}
+            for i, v in new.get_bonds(use_lookup=True).items()} == bond_dict
+
+
+def test_val_sorted_bonds():
+    connectivity = molecule._get_val_sorted_connectivity(use_lookup=False)
+    valency = molecule.add_data('valency')['valency']
+    for i, bonded in molecule.get_bonds().items():
+        sorted_bonded = connectivity.get_bonded(i)
+        assert set(sorted_bonded) == bonded
+        assert list(valency[sorted_bonded]) == sorted(valency[list(bonded)],
+                                                      reverse=True)
+
+
+def test_val_sorted_bonds_ties_by_position():
+    connectivity = molecule._get_val_sorted_connectivity(use_lookup=False)
+    valency = molecule.add_data('valency')['valency']
+    n_ties = 0
+    for i in molecule.index:
+        sorted_bonded = connectivity.get_bonded(i)
+        for a, b in zip(sorted_bonded[:-1], sorted_bonded[1:]):
+            if valency[a] == valency[b]:
+                n_ties += 1
+                assert (molecule.index.get_loc(a)
+                        < molecule.index.get_loc(b))
+    assert n_ties > 0
+
+
 def test_coordination_sphere():
     expctd = {}
     expctd[1] = {6, 11, 53}
@@ -164,6 +219,30 @@ def test_coordination_sphere():
         assert expctd[i] == set(molecule.get_coordination_sphere(7, i).index)
 
 
+def test_coordination_spheres_of_several_atoms():
+    atoms = [7, 1, 30]
+    for only_surface in [True, False]:
+        spheres = molecule._get_coordination_spheres(
+            atoms, n_sphere=2, only_surface=only_surface, exclude={11})
+        for i, sphere in zip(atoms, spheres):
+            assert set(sphere) - {11} == molecule.get_coordination_sphere(
+                i, n_sphere=2, only_surface=only_surface, exclude={11},
+                give_only_index=True)
+
+
+def test_cached_coordination_spheres():
+    atoms = list(molecule.index)
+    for n_sphere, only_surface in [(3, True), (1, False), (4, False)]:
+        cached = molecule._get_coordination_spheres(
+            atoms, n_sphere=n_sphere, only_surface=only_surface,
+            use_lookup=True)
+        searched = molecule._get_coordination_spheres(
+            atoms, n_sphere=n_sphere, only_surface=only_surface,
+            use_lookup=False)
+        for sphere1, sphere2 in zip(cached, searched):
+            assert np.array_equal(sphere1, sphere2)
+
+
 def test_cut_sphere():
     expected = {6, 7, 8, 9, 11, 12, 13, 15, 16, 19, 20, 53}
     assert expected == set(molecule.cut_sphere(radius=3, origin=7).index)
@@ -175,6 +254,17 @@ def test_cut_sphere():
                                        outside_sliced=False).index))
 
 
+def test_cut_sphere_preserves_fragments():
+    water = cc.Cartesian.read_xyz(get_complete_path('water.xyz'),
+                                  start_index=1)
+    water = water - water.loc[5, ['x', 'y', 'z']]
+    assert set(water.cut_sphere(radius=0.5, origin=2).index) == {2}
+    assert list(water.cut_sphere(radius=0.5, origin=2,
+                                 preserve_bonds=True).index) == [1, 2, 3]
+    assert list(water.cut_sphere(radius=1.5, origin=1, outside_sliced=False,
+                                 preserve_bonds=True).index) == [4, 5, 6]
+
+
 def test_cut_cuboid():
     expected = {3, 4, 5, 6, 7, 15, 16, 17, 32, 35, 37, 38, 47, 52, 53, 55, 56}
     assert expected == set(molecule.cut_cuboid(a=2, origin=7).index)
@@ -232,6 +322,47 @@ def test_partition_chem_env():
     assert xpctd == molecule.partition_chem_env()
 
 
+def test_chem_env_hashes():
+    hashes = molecule._get_chem_env_hashes()
+    shuffled = molecule.iloc[np.random.RandomState(0).permutation(
+        len(molecule))]
+    shuffled.index = range(100, 100 + len(shuffled))
+    assert np.array_equal(np.sort(shuffled._get_chem_env_hashes()),
+                          np.sort(hashes))
+    reindexed = molecule.reindex_similar(shuffled)
+    assert np.alltrue(reindexed == molecule)
+
+
+def test_chem_env_labels():
+    shuffled = molecule.iloc[np.random.RandomState(0).permutation(
+        len(molecule))]
+    shuffled.index = range(100, 100 + len(shuffled))
+    labels1, labels2 = molecule._get_chem_env_labels(shuffled)
+    labels1 = pd.Series(labels1, index=molecule.index)
+    labels2 = pd.Series(labels2, index=shuffled.index)
+    partition1 = molecule.partition_chem_env()
+    partition2 = shuffled.partition_chem_env()
+    assert len(set(labels1)) == len(partition1)
+    for environment, indices in partition1.items():
+        assert (set(labels1[list(indices)])
+                == set(labels2[list(partition2[environment])])
+                == {labels1[min(indices)]})
+
+
+def test_reindex_similar_by_assignment():
+    rng = np.random.RandomState(1)
+    shuffled = molecule.iloc[rng.permutation(len(molecule))]
+    shuffled.loc[:, ['x', 'y', 'z']] += rng.normal(scale=0.01,
+                                                   size=(len(molecule), 3))
+    shuffled.index = range(100, 100 + len(shuffled))
+    greedy = molecule.reindex_similar(shuffled)
+    reindexed = molecule.reindex_similar(shuffled, method='assignment')
+    assert np.alltrue(reindexed == greedy)
+    assert np.alltrue(reindexed.index == molecule.index)
+    with pytest.raises(ValueError):
+        molecule.reindex_similar(shuffled, method='nearest')
+
+
 def test_change_numbering():
     molecule2 = molecule.copy()
     molecule2.index = reversed(molecule.index)
@@ -53,6 +53,19 @@ def test_fragmentate():
     assert np.alltrue(fragments[0] == molecule)
 
 
+def test_fragmentate_water():
+    water = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, 'water.xyz'),
+                                  start_index=1)
+    water = water - water.loc[5, ['x', 'y', 'z']]
+    water = water.loc[[4, 2, 1, 5, 6, 3]]
+    assert water.fragmentate(give_only_index=True) == [{4, 5, 6}, {1, 2, 3}]
+    fragments = water.fragmentate(lazy=True)
+    first = next(fragments)
+    assert list(first.index) == [4, 5, 6]
+    assert first.get_bonds(use_lookup=True) == {4: {5, 6}, 5: {4}, 6: {4}}
+    assert list(next(fragments).index) == [2, 1, 3]
+
+
 def test_get_shortest_distance():
     i, j, d = molecule.get_shortest_distance(molecule + [0, 0, 10])
     assert (i, j) == (27, 24)
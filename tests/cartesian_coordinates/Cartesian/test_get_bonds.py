@@ -7,6 +7,7 @@ from __future__ import unicode_literals
 import chemcoord as cc
 import pytest
 import numpy as np
+import itertools
 import os
 import sys
 
@@ -34,3 +35,198 @@ def test_water():
     molecule = molecule - molecule.loc[5, ['x', 'y', 'z']]
     expected = {1: {2, 3}, 2: {1}, 3: {1}, 4: {5, 6}, 5: {4}, 6: {4}}
     assert molecule.get_bonds() == expected
+
+
+def test_cell_list_equals_brute_force():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_beta.xyz'), start_index=1)
+    pos = molecule.loc[:, ['x', 'y', 'z']].values
+    radii = molecule.add_data('atomic_radius_cc')['atomic_radius_cc'].values
+    D = ((pos[:, None, :] - pos[None, :, :])**2).sum(axis=2)
+    bonded = (radii[:, None] + radii[None, :])**2 - D >= 0
+    np.fill_diagonal(bonded, False)
+    index = molecule.index
+    expected = {index[i]: set(index[bonded[i].nonzero()[0]])
+                for i in range(len(molecule))}
+    assert molecule.get_bonds() == expected
+
+
+def test_parallel_bond_detection():
+    from chemcoord.cartesian_coordinates import _neighbor_search
+    from chemcoord.cartesian_coordinates._bond_lengths import \
+        get_bond_lengths
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_beta.xyz'), start_index=1)
+    pos = molecule.loc[:, ['x', 'y', 'z']].values
+    codes, bond_lengths, _ = get_bond_lengths(molecule['atom'].values,
+                                              'atomic_radius_cc')
+    cell_list = _neighbor_search.CellList(pos, codes, bond_lengths)
+    serial = cell_list.get_bond_pairs(parallel=False)
+    parallel = cell_list.get_bond_pairs(parallel=True)
+    assert np.array_equal(serial[0], parallel[0])
+    assert np.array_equal(serial[1], parallel[1])
+
+
+def test_modified_radii_equal_brute_force():
+    from chemcoord.cartesian_coordinates._bond_lengths import \
+        get_bond_lengths, get_element_bond_lengths
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_beta.xyz'), start_index=1)
+    radii = molecule.add_data('atomic_radius_cc')['atomic_radius_cc'].values
+    modified = {i: 0.2 + 0.01 * i for i in range(0, len(molecule), 3)}
+    for i, radius in modified.items():
+        radii[i] = radius
+    pos = molecule.loc[:, ['x', 'y', 'z']].values
+    D = np.linalg.norm(pos[:, None] - pos[None, :], axis=2)
+    bonded = D <= radii[:, None] + radii[None, :]
+    np.fill_diagonal(bonded, False)
+    expected = {i: set(molecule.index[bonded[j]])
+                for j, i in enumerate(molecule.index)}
+    assert molecule.get_bonds(modified_properties=modified) == expected
+
+    codes, bond_lengths, deltas = get_bond_lengths(
+        molecule['atom'].values, 'atomic_radius_cc', modified)
+    assert bond_lengths is get_element_bond_lengths('atomic_radius_cc')[1]
+    assert codes.dtype.itemsize <= 2
+    assert np.count_nonzero(deltas) <= len(modified)
+
+
+def test_lookup_is_invalidated():
+    molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, 'water.xyz'),
+                                     start_index=1)
+    expected = molecule.get_bonds()
+    assert molecule.get_bonds(use_lookup=True) == expected
+    assert molecule.get_bonds(use_lookup=True) is expected
+    molecule.loc[2, 'x'] += 10
+    assert molecule.get_bonds(use_lookup=True)[1] == {3}
+    molecule.index = range(6)
+    assert molecule.get_bonds(use_lookup=True)[0] == {2}
+
+
+def test_lookup_is_changed_inplace():
+    molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, 'water.xyz'),
+                                     start_index=1)
+    assert len(molecule.fragmentate()) == 2
+    bonds = molecule.get_bonds(use_lookup=True)
+    bonds[1].add(4)
+    assert len(molecule.fragmentate(use_lookup=True)) == 1
+    assert molecule.get_bonds(use_lookup=True) is bonds
+    assert bonds[4] == {1, 5, 6}
+    assert len(molecule.fragmentate(use_lookup=False)) == 2
+
+
+def test_lookup_depends_on_arguments():
+    molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, 'water.xyz'),
+                                     start_index=1)
+    expected = molecule.get_bonds()
+    assert len(molecule.fragmentate()) == 2
+    modified = molecule.get_bonds(modified_properties={1: 3.0})
+    assert modified != expected
+    assert len(molecule.fragmentate()) == 2
+    assert molecule.get_bonds(use_lookup=True,
+                              modified_properties={1: 3.0}) == modified
+    assert molecule.get_bonds(use_lookup=True,
+                              modified_properties={}) == expected
+    assert molecule.get_bonds(use_lookup=True,
+                              self_bonding_allowed=True) != expected
+
+
+def test_incremental_update():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_beta.xyz'), start_index=1)
+    molecule.get_bonds()
+    for i, shift in [(5, [0.3, 0., 0.]), (17, [-4., 2., 1.]),
+                     (5, [0., 0., -0.3]), (50, [0., 0., 0.])]:
+        molecule.loc[i, ['x', 'y', 'z']] += shift
+        assert molecule.get_bonds(use_lookup=True) == molecule.copy(
+            ).get_bonds()
+
+
+def test_incremental_update_depends_on_arguments():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_beta.xyz'), start_index=1)
+    modified_properties = {5: 2.5, 17: 0.}
+    molecule.get_bonds(modified_properties=modified_properties)
+    molecule.loc[5, ['x', 'y', 'z']] += [0.3, 0., 0.]
+    assert molecule.get_bonds(use_lookup=True) == molecule.copy(
+        ).get_bonds()
+    molecule.get_bonds(modified_properties=modified_properties)
+    molecule.loc[17, ['x', 'y', 'z']] += [0., 0.3, 0.]
+    assert molecule.get_bonds(
+        use_lookup=True, self_bonding_allowed=True) == molecule.copy(
+            ).get_bonds(self_bonding_allowed=True)
+
+
+def test_periodic_bonds_equal_supercell():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'MIL53_beta.xyz'), start_index=1)
+    cell = np.array([[13.5, 0., 0.], [1., 11.5, 0.], [0., 0.5, 9.5]])
+    n = len(molecule)
+    shifts = np.array(list(itertools.product(range(-1, 2), repeat=3)))
+    images = (molecule.loc[:, ['x', 'y', 'z']].values[None, :, :]
+              + (shifts @ cell)[:, None, :]).reshape(-1, 3)
+    supercell = cc.Cartesian(atoms=np.tile(molecule['atom'].values, 27),
+                             coords=images)
+    central = 13 * n
+    expected = {molecule.index[i]: {molecule.index[j % n]
+                                    for j in supercell.get_bonds()[central + i]
+                                    if j % n != i}
+                for i in range(n)}
+    assert molecule.get_bonds() != expected
+    molecule.metadata['cell'] = cell
+    assert molecule.get_bonds(use_lookup=True) == expected
+
+
+def test_minimum_image_distance():
+    molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, 'water.xyz'),
+                                     start_index=1)
+    molecule.metadata['cell'] = np.diag([10., 10., 10.])
+    shifted = molecule.copy()
+    shifted.loc[:, 'x'] += 30.
+    i, j, d = molecule.get_shortest_distance(shifted)
+    assert np.isclose(d, 0.)
+    distances = shifted.get_distance_to(molecule.loc[1, ['x', 'y', 'z']])
+    expected = molecule.get_distance_to(1)
+    assert np.allclose(distances.loc[:, 'distance'],
+                       expected.loc[:, 'distance'])
+
+
+def test_bond_length_table_follows_constants():
+    molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURES, 'water.xyz'),
+                                     start_index=1)
+    molecule = molecule - molecule.loc[5, ['x', 'y', 'z']]
+    expected = molecule.get_bonds()
+    old_radius = cc.constants.elements.loc['O', 'atomic_radius_cc']
+    try:
+        cc.constants.elements.loc['O', 'atomic_radius_cc'] = 0.
+        assert all(len(bonded) == 0
+                   for bonded in molecule.get_bonds().values())
+    finally:
+        cc.constants.elements.loc['O', 'atomic_radius_cc'] = old_radius
+    assert molecule.get_bonds() == expected
+
+
+def test_nearest_inserted_atom():
+    from chemcoord.cartesian_coordinates import _neighbor_search
+    # A lattice has many equal distances, which are broken
+    # by the order of insertion.
+    pos = np.array(list(itertools.product(range(6), repeat=3)), dtype='f8')
+    np.random.seed(0)
+    inserted = np.random.permutation(len(pos))
+    cell_list = _neighbor_search.GrowingCellList(pos)
+    cell_list.insert(inserted[:20])
+    for points in [pos[inserted[20:30]], np.random.rand(5, 3) * 5,
+                   np.array([[20., -3., 2.5]])]:
+        D = np.sqrt(((points[:, None] - pos[inserted[:20]])**2).sum(-1))
+        i, j = np.unravel_index(D.argmin(), D.shape)
+        k, m, d = cell_list.get_nearest(points)
+        assert (k, m) == (i, inserted[j])
+        assert np.isclose(d, D[i, j])
+
+
+def test_offset_is_deprecated():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURES, 'water.xyz'))
+    with pytest.warns(DeprecationWarning):
+        bonds = molecule.get_bonds(offset=3)
+    assert bonds == molecule.get_bonds()
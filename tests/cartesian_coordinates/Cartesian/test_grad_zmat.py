@@ -55,3 +55,49 @@ def test_grad_zmat():
     assert moved_atoms[0] == 13
     assert np.alltrue(
         moved_atoms[1:] == c_table.index[(c_table == 13).any(axis=1)])
+
+
+def test_sparse_grad_zmat():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'))
+    c_table = molecule.get_construction_table()
+    molecule = molecule.loc[c_table.index]
+    n_atoms = len(molecule)
+    grad_C = molecule.get_grad_zmat(c_table, as_function=False)
+    sparse_grad_C = molecule.get_grad_zmat(c_table, as_function=False,
+                                           sparse=True)
+    assert sparse_grad_C.shape == (3 * n_atoms, 3 * n_atoms)
+    absolute_refs = ['origin', 'e_x', 'e_y', 'e_z']
+    n_references = (~c_table.isin(absolute_refs)).values.sum()
+    assert sparse_grad_C.nnz == 9 * (n_atoms + n_references)
+    dense = sparse_grad_C.toarray().reshape((n_atoms, 3, n_atoms, 3))
+    assert np.allclose(dense.transpose(1, 0, 2, 3), grad_C)
+
+    dist_mol = molecule.copy()
+    np.random.seed(0)
+    dist_mol.loc[:, ['x', 'y', 'z']] = np.random.normal(size=(n_atoms, 3))
+    new = molecule.get_grad_zmat(c_table, sparse=True)(dist_mol)
+    expected = molecule.get_grad_zmat(c_table)(dist_mol)
+    values = ['bond', 'angle', 'dihedral']
+    assert np.allclose(new.loc[:, values], expected.loc[:, values])
+
+
+def test_sparse_grad_zmat_with_sympy():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'))
+    c_table = molecule.get_construction_table()
+    molecule = molecule.loc[c_table.index]
+    x = sympy.symbols('x', real=True)
+
+    dist_mol = molecule.copy()
+    dist_mol.loc[:, ['x', 'y', 'z']] = 0.
+    dist_mol.loc[molecule.index[5], 'x'] = x
+    new = molecule.get_grad_zmat(c_table, sparse=True)(dist_mol)
+
+    dist_mol.loc[molecule.index[5], 'x'] = 0.1
+    expected = molecule.get_grad_zmat(c_table)(dist_mol)
+    values = ['bond', 'angle', 'dihedral']
+    substituted = np.array([[float(sympy.sympify(v).subs(x, 0.1)) for v in row]
+                            for row in new.loc[:, values].values])
+    assert np.allclose(substituted,
+                       expected.loc[:, values].values.astype('f8'))
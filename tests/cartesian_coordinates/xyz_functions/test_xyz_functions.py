@@ -74,3 +74,31 @@ def test_concat_with_zmats():
     assert allclose(
         zm1.get_cartesian().append(zm2.get_cartesian() + [0, 0, 20]),
         znew.get_cartesian())
+
+
+def test_read_molden_bonds():
+    path = os.path.join(STRUCTURES, 'total_movement.molden')
+    cartesians = cc.xyz_functions.read_molden(path, start_index=1)
+    for molecule in cartesians:
+        assert (molecule.get_bonds(use_lookup=True)
+                == molecule.copy().get_bonds())
+
+
+def test_read_molden_reuses_verlet_list():
+    path = os.path.join(STRUCTURES, 'total_movement.molden')
+    cartesians = cc.xyz_functions.read_molden(path, start_index=1,
+                                              get_bonds=False)
+    # Every atom moves by about 0.3 per frame,
+    # so the list is rebuilt in every third frame.
+    verlet_list, = cc.Cartesian._set_bonds_of_trajectory(cartesians,
+                                                         skin=1.5)
+    assert verlet_list.n_builds == 7
+    for molecule in cartesians:
+        assert (molecule.get_bonds(use_lookup=True)
+                == molecule.copy().get_bonds())
+
+    molecule = cartesians[4]
+    molecule.loc[5, ['x', 'y', 'z']] += [0.3, 0., 0.]
+    connectivity, _ = molecule._update_connectivity(
+        molecule._get_xyz(), molecule._get_bond_arguments())
+    assert connectivity.to_dict() == molecule.copy().get_bonds()
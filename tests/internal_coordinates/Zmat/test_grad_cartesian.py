@@ -9,6 +9,7 @@ import chemcoord as cc
 import numpy as np
 import pandas as pd
 import pytest
+import sympy
 from chemcoord.exceptions import UndefinedCoordinateSystem
 from chemcoord.xyz_functions import allclose
 
@@ -57,3 +58,69 @@ def test_grad_cartesian():
     index = new.index[~np.isclose(new, 0.).all(axis=1)]
     assert (index
             == [3, 17, 60, 6, 19, 62, 38, 37, 81, 80, 7, 39, 82, 10]).all()
+
+
+def test_grad_X_finite_differences():
+    from chemcoord.internal_coordinates._zmat_transformation import \
+        get_X, get_grad_X
+    molecule = cc.Cartesian.read_xyz(os.path.join(STRUCTURE_PATH, 'water.xyz'))
+    zmolecule = molecule.get_zmat()
+    c_table = zmolecule._get_c_table_positions()
+    C = zmolecule.loc[:, ['bond', 'angle', 'dihedral']].values.T.astype('f8')
+    C[[1, 2], :] = np.radians(C[[1, 2], :])
+
+    h = 1e-6
+    grad_X = np.empty((3, len(molecule), len(molecule), 3))
+    for i in range(len(molecule)):
+        for k in range(3):
+            step = np.zeros_like(C)
+            step[k, i] = h
+            grad_X[:, :, i, k] = (get_X(C + step, c_table)[2]
+                                  - get_X(C - step, c_table)[2]) / (2 * h)
+    assert np.allclose(get_grad_X(C, c_table), grad_X, atol=1e-7)
+
+
+def test_sparse_grad_cartesian():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'))
+    zmolecule = molecule.get_zmat()
+    n_atoms = len(zmolecule)
+    grad_X = zmolecule.get_grad_cartesian(as_function=False, chain=False)
+    sparse_grad_X = zmolecule.get_grad_cartesian(
+        as_function=False, chain=False, sparse=True)
+    assert sparse_grad_X.shape == (3 * n_atoms, 3 * n_atoms)
+    assert sparse_grad_X.nnz == 9 * n_atoms
+    dense = sparse_grad_X.toarray().reshape((n_atoms, 3, n_atoms, 3))
+    assert np.allclose(dense.transpose(1, 0, 2, 3), grad_X)
+
+    zmat_dist = zmolecule.copy()
+    np.random.seed(0)
+    zmat_dist.unsafe_loc[:, ['bond', 'angle', 'dihedral']] = \
+        np.random.normal(size=(n_atoms, 3))
+    new = zmolecule.get_grad_cartesian(chain=False, sparse=True)(zmat_dist)
+    expected = zmolecule.get_grad_cartesian(chain=False)(zmat_dist)
+    assert allclose(new, expected, align=False)
+
+    with pytest.raises(ValueError):
+        zmolecule.get_grad_cartesian(sparse=True)
+
+
+def test_sparse_grad_cartesian_with_sympy():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'))
+    zmolecule = molecule.get_zmat()
+    x = sympy.symbols('x', real=True)
+
+    zmat_dist = zmolecule.copy()
+    zmat_dist.unsafe_loc[:, ['bond', 'angle', 'dihedral']] = 0.
+    zmat_dist.unsafe_loc[zmolecule.index[5], 'bond'] = x
+    new = zmolecule.get_grad_cartesian(chain=False, sparse=True)(zmat_dist)
+
+    zmat_dist = zmolecule.copy()
+    zmat_dist.unsafe_loc[:, ['bond', 'angle', 'dihedral']] = 0.
+    zmat_dist.unsafe_loc[zmolecule.index[5], 'bond'] = 0.1
+    expected = zmolecule.get_grad_cartesian(chain=False)(zmat_dist)
+    substituted = np.array([[float(sympy.sympify(v).subs(x, 0.1)) for v in row]
+                            for row in new.loc[:, ['x', 'y', 'z']].values])
+    assert np.allclose(substituted,
+                       expected.loc[:, ['x', 'y', 'z']].values.astype('f8'))
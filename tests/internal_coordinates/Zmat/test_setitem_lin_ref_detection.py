@@ -61,3 +61,23 @@ def test_assignment_leading_to_linear_reference():
             with pytest.warns(UserWarning):
                 test = e.zmat_after_assignment._insert_dummy_zmat(e)
     assert len(test) == len(zmolecule3) + 1
+
+
+def test_dummy_manipulation_keeps_reference_positions():
+    from chemcoord.cartesian_coordinates._construction_table import \
+        to_int_table
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'water.xyz'), start_index=1)
+    zmolecule = molecule.get_zmat()
+    angle_before_assignment = zmolecule.loc[4, 'angle']
+
+    with pytest.warns(UserWarning):
+        zmolecule.safe_loc[4, 'angle'] = 180
+    assert (zmolecule._get_c_table_positions()
+            == to_int_table(zmolecule._frame, zmolecule.index)).all()
+
+    with pytest.warns(UserWarning):
+        zmolecule.safe_loc[4, 'angle'] = angle_before_assignment
+    assert len(zmolecule) == len(molecule)
+    assert (zmolecule._get_c_table_positions()
+            == to_int_table(zmolecule._frame, zmolecule.index)).all()
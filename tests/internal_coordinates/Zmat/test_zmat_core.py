@@ -11,6 +11,7 @@ from chemcoord.exceptions import UndefinedCoordinateSystem, InvalidReference
 import os
 import sys
 from sympy import Symbol
+from chemcoord.cartesian_coordinates._construction_table import to_int_table
 
 
 def get_script_path():
@@ -47,3 +48,26 @@ def test_addition_with_sympy():
 
     zmolecule = zmolecule + zmolecule2
     zmolecule.subs(x, 3)
+
+
+def test_get_cartesian_positions():
+    molecule = cc.Cartesian.read_xyz(
+        os.path.join(STRUCTURE_PATH, 'MIL53_small.xyz'), start_index=1)
+    zmolecule = molecule.get_zmat()
+    positions = zmolecule.get_cartesian_positions()
+    cartesian = zmolecule.get_cartesian()
+    assert (cartesian.loc[:, ['x', 'y', 'z']].values == positions).all()
+    assert allclose(molecule, cartesian.loc[molecule.index], atol=1e-7)
+
+    c_table = zmolecule._get_c_table_positions()
+    assert zmolecule._get_c_table_positions() is c_table
+    zmolecule.unsafe_loc[:, 'bond'] = zmolecule.loc[:, 'bond'] * 1.1
+    assert zmolecule._get_c_table_positions() is c_table
+    assert (zmolecule.get_cartesian_positions(
+        zmolecule.loc[:, ['bond', 'angle', 'dihedral']].values)
+        == zmolecule.get_cartesian().loc[:, ['x', 'y', 'z']].values).all()
+
+    renumbered = zmolecule.change_numbering()
+    assert renumbered._get_c_table_positions() is c_table
+    assert (to_int_table(renumbered._frame, renumbered.index)
+            == c_table).all()